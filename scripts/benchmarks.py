@@ -0,0 +1,202 @@
+import gzip
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import anndata as ad
+import click
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from mpralib.mpradata import MPRABarcodeData
+
+IGVF_TEST_FILE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "tests",
+    "data",
+    "reporter_experiment_barcode_IGVFDS2165KBMD.input.head20000.tsv.gz",
+)
+
+
+@click.group(help="Benchmarks of MPRAlib on scaled up test data.")
+def cli():
+    pass
+
+
+def scale_barcode_file(input_file: str, output_file: str, scale: int, observed_fraction: float = 1.0, seed: int = 42) -> int:
+    """Writes a reporter experiment barcode file which contains the input `scale` times with unique barcodes and oligos.
+
+    Real libraries are much sparser than the test files, so replicate counts of a barcode are kept only with probability
+    `observed_fraction`.
+
+    Returns:
+        Number of barcodes in the scaled file.
+    """
+    df = pd.read_csv(input_file, sep="\t", header=0, dtype=str, keep_default_na=False)
+    rng = np.random.default_rng(seed)
+    replicate_columns = [(dna, rna) for dna, rna in zip(df.columns[2::2], df.columns[3::2])]
+    with gzip.open(output_file, "wt") if output_file.endswith(".gz") else open(output_file, "w") as f:
+        f.write("\t".join(df.columns) + "\n")
+        for i in range(scale):
+            chunk = df.copy()
+            chunk["barcode"] = chunk["barcode"] + f"_{i}"
+            chunk["oligo_name"] = chunk["oligo_name"] + f"_{i}"
+            for dna, rna in replicate_columns:
+                dropped = rng.random(len(chunk)) >= observed_fraction
+                chunk.loc[dropped, [dna, rna]] = ""
+            chunk.to_csv(f, sep="\t", header=False, index=False)
+    return len(df) * scale
+
+
+def _layer_bytes(layer) -> int:
+    if sp.issparse(layer):
+        return layer.data.nbytes + layer.indices.nbytes + layer.indptr.nbytes
+    return np.asarray(layer).nbytes
+
+
+def _profile_sparse_memory(file_path: str, sparse: bool, queue: multiprocessing.Queue) -> None:
+    start = time.perf_counter()
+    mpradata = MPRABarcodeData.from_file(file_path, sparse=sparse)
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mpradata.activity
+    mpradata.barcode_counts
+    oligo_data = mpradata.oligo_data
+    oligo_data.activity
+    derive_time = time.perf_counter() - start
+
+    layer_bytes = sum(_layer_bytes(layer) for layer in mpradata.data.layers.values())
+    queue.put(
+        {
+            "mode": "sparse" if sparse else "dense",
+            "layers [MB]": round(layer_bytes / 1e6, 1),
+            "peak RSS [MB]": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3, 1),
+            "load [s]": round(load_time, 2),
+            "derived layers + oligo data [s]": round(derive_time, 2),
+        }
+    )
+
+
+def _run_isolated(target, *args) -> dict:
+    # every measurement gets a fresh process so that peak RSS is not shared between runs
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=target, args=(*args, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+@cli.command(help="Memory footprint of dense vs. sparse barcode count layers.")
+@click.option(
+    "--input",
+    "input_file",
+    default=IGVF_TEST_FILE,
+    type=click.Path(exists=True, readable=True),
+    help="Reporter experiment barcode file to scale up. Defaults to the IGVF test file.",
+)
+@click.option("--scale", "scale", default=50, type=int, help="How many times the input is repeated.")
+@click.option(
+    "--observed-fraction",
+    "observed_fraction",
+    default=0.3,
+    type=float,
+    help="Probability to keep the counts of a barcode in a replicate.",
+)
+def sparse_memory(input_file: str, scale: int, observed_fraction: float) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        scaled_file = os.path.join(tmp_dir, "scaled.tsv")
+        n_barcodes = scale_barcode_file(input_file, scaled_file, scale, observed_fraction)
+        click.echo(f"Barcodes: {n_barcodes}")
+
+        results = [_run_isolated(_profile_sparse_memory, scaled_file, sparse) for sparse in [False, True]]
+
+    click.echo(pd.DataFrame(results).to_string(index=False))
+
+
+def _legacy_from_file(file_path: str) -> MPRABarcodeData:
+    # whole-file loader used before the chunked reader, kept as reference
+    data = pd.read_csv(file_path, sep="\t", header=0, index_col=0)
+    data = data.fillna(0)
+
+    replicate_columns_rna = data.columns[2::2]
+    replicate_columns_dna = data.columns[1::2]
+
+    anndata_replicate_rna = data[replicate_columns_rna].transpose().astype(np.int32)
+    anndata_replicate_dna = data[replicate_columns_dna].transpose().astype(np.int32)
+
+    anndata_replicate_rna.index = pd.Index([replicate.split("_")[2] for replicate in replicate_columns_rna])
+    anndata_replicate_dna.index = pd.Index([replicate.split("_")[2] for replicate in replicate_columns_dna])
+
+    adata = ad.AnnData(anndata_replicate_rna)
+    adata.layers["rna"] = np.array(adata.X, dtype=np.int32)
+    adata.layers["dna"] = np.asarray(anndata_replicate_dna.values, dtype=np.int32)
+    adata.var["oligo"] = data["oligo_name"].astype("category")
+    adata.varm["var_filter"] = pd.DataFrame(
+        np.full((adata.n_vars, adata.n_obs), False),
+        index=adata.var_names,
+        columns=adata.obs_names,
+    )
+    return MPRABarcodeData(adata)
+
+
+_LOADERS = {
+    "legacy": _legacy_from_file,
+    "chunked": MPRABarcodeData.from_file,
+    "chunked sparse": lambda file_path: MPRABarcodeData.from_file(file_path, sparse=True),
+}
+
+
+def _profile_loader(file_path: str, loader: str, queue: multiprocessing.Queue) -> None:
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    mpradata = _LOADERS[loader](file_path)
+    load_time = time.perf_counter() - start
+
+    layer_bytes = sum(_layer_bytes(layer) for layer in mpradata.data.layers.values())
+    queue.put(
+        {
+            "loader": loader,
+            "layers [MB]": round(layer_bytes / 1e6, 1),
+            "peak RSS [MB]": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3, 1),
+            "peak RSS increase [MB]": round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) / 1e3, 1),
+            "load [s]": round(load_time, 2),
+        }
+    )
+
+
+@cli.command(help="Peak memory and wall time of the chunked barcode file reader vs. the legacy whole-file loader.")
+@click.option(
+    "--input",
+    "input_file",
+    default=IGVF_TEST_FILE,
+    type=click.Path(exists=True, readable=True),
+    help="Reporter experiment barcode file to scale up. Defaults to the IGVF test file.",
+)
+@click.option("--scale", "scale", default=50, type=int, help="How many times the input is repeated.")
+@click.option(
+    "--observed-fraction",
+    "observed_fraction",
+    default=1.0,
+    type=float,
+    help="Probability to keep the counts of a barcode in a replicate.",
+)
+def loader(input_file: str, scale: int, observed_fraction: float) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        scaled_file = os.path.join(tmp_dir, "scaled.tsv.gz")
+        n_barcodes = scale_barcode_file(input_file, scaled_file, scale, observed_fraction)
+        click.echo(f"Barcodes: {n_barcodes}")
+
+        results = [_run_isolated(_profile_loader, scaled_file, name) for name in _LOADERS]
+
+    click.echo(pd.DataFrame(results).to_string(index=False))
+
+
+if __name__ == "__main__":
+    cli()
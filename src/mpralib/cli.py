@@ -1,20 +1,34 @@
 import ast
 import json
 import logging
-import math
+from collections.abc import Mapping
 
 import click
 import numpy as np
 import pandas as pd
+from scipy.special import expit
 from sklearn.preprocessing import MinMaxScaler
 
 import mpralib.utils.plot as plt
-from mpralib.mpradata import BarcodeFilter, Modality, MPRABarcodeData
+from mpralib.mpradata import (
+    BarcodeFilter,
+    Modality,
+    MPRABarcodeData,
+    MPRAOligoData,
+    allele_incidence,
+    as_dense_array,
+    build_variant_table,
+    flatten_lists,
+    oligo_positions,
+    variant_oligo_lists,
+)
+from mpralib.utils.cache import BarcodeDataCache, SequenceDesignCache, default_cache_dir
 from mpralib.utils.file_validation import ValidationSchema, validate_tsv_with_schema
 from mpralib.utils.io import (
-    chromosome_map,
+    chromosome_aliases,
     export_activity_file,
     export_barcode_file,
+    export_bed_file,
     export_counts_file,
     read_sequence_design_file,
 )
@@ -23,13 +37,119 @@ pd.options.mode.copy_on_write = True
 
 
 @click.group(help="Command line interface of MPRAlib, a library for MPRA data analysis.")
-def cli() -> None:
-    pass
+@click.option(
+    "--sparse/--dense",
+    "sparse",
+    default=False,
+    help="Store barcode counts as sparse matrices. Reduces memory on large libraries where most barcodes are not "
+    "observed in all replicates.",
+)
+@click.option(
+    "--cache/--no-cache",
+    "cache",
+    default=False,
+    help="Cache parsed reporter experiment barcode and sequence design files on disk so that later commands on the same "
+    "file skip parsing. Entries are written to the cache directory.",
+)
+@click.option(
+    "--cache-dir",
+    "cache_dir",
+    default=default_cache_dir,
+    envvar="MPRALIB_CACHE_DIR",
+    show_default="$XDG_CACHE_HOME/mpralib",
+    type=click.Path(file_okay=False, writable=True),
+    help="Directory of the cache. Can also be set with the MPRALIB_CACHE_DIR environment variable.",
+)
+@click.option(
+    "--cache-max-size",
+    "cache_max_size",
+    default=10.0,
+    show_default=True,
+    type=click.FloatRange(min=0),
+    help="Maximum size of the cache in GB. Least recently used entries are removed first.",
+)
+@click.pass_context
+def cli(ctx: click.Context, sparse: bool, cache: bool, cache_dir: str, cache_max_size: float) -> None:
+    ctx.ensure_object(dict)
+    ctx.obj["sparse"] = sparse
+    ctx.obj["cache"] = BarcodeDataCache(cache_dir, max_size=int(cache_max_size * 1000**3)) if cache else None
+    ctx.obj["design_cache"] = SequenceDesignCache(cache_dir, max_size=int(cache_max_size * 1000**3)) if cache else None
+
+
+def _read_barcode_data(input_file: str) -> MPRABarcodeData:
+    """Reads a reporter experiment barcode file using the global options (storage mode, cache) of the command line interface.
+
+    Args:
+        input_file (str): Path to the reporter experiment barcode file.
+
+    Returns:
+        The barcode data of the input file.
+    """
+    options = click.get_current_context().find_root().obj or {}
+    sparse = options.get("sparse", False)
+    cache = options.get("cache")
+    if cache is not None:
+        return cache.read(input_file, sparse=sparse)
+    return MPRABarcodeData.from_file(input_file, sparse=sparse)
+
+
+def _read_sequence_design(sequence_design_file: str) -> pd.DataFrame:
+    """Reads a sequence design file using the cache option of the command line interface.
+
+    Args:
+        sequence_design_file (str): Path to the sequence design file.
+
+    Returns:
+        The sequence design, identical to :func:`read_sequence_design_file`.
+    """
+    cache = (click.get_current_context().find_root().obj or {}).get("design_cache")
+    if cache is not None:
+        return cache.read(sequence_design_file)
+    return read_sequence_design_file(sequence_design_file)
+
+
+def _parse_dict_option(value: str, option_name: str) -> dict:
+    """Parses an option given as JSON string or Python dict.
+
+    Raises:
+        click.ClickException: If the value is neither.
+    """
+    try:
+        return json.loads(value)
+    except Exception:
+        try:
+            return ast.literal_eval(value)
+        except Exception:
+            raise click.ClickException(f"Could not parse {option_name} as dict or JSON.")
 
 
 @cli.group(help="Validate standardized MPRA reporter formats.")
-def validate_file() -> None:
-    pass
+@click.option(
+    "--threads",
+    "threads",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of processes validating chunks of the file in parallel.",
+)
+@click.pass_context
+def validate_file(ctx: click.Context, threads: int) -> None:
+    ctx.ensure_object(dict)
+    ctx.obj["threads"] = threads
+
+
+def _validate(input_file: str, schema_type: ValidationSchema) -> bool:
+    """Validates a file using the options of the validate-file group.
+
+    Args:
+        input_file (str): Path to the file to validate.
+        schema_type (ValidationSchema): The type of schema to validate against.
+
+    Returns:
+        True if the file is valid according to the schema, False otherwise.
+    """
+    threads = (click.get_current_context().find_object(dict) or {}).get("threads", 1)
+    return validate_tsv_with_schema(input_file, schema_type, threads=threads)
 
 
 @validate_file.command(help="Validate MPRA reporter sequence design file.")
@@ -47,7 +167,7 @@ def reporter_sequence_design(input_file: str) -> None:
     Args:
         input_file (str): Path to the MPRA Reporter Sequence Design file to validate.
     """
-    if not validate_tsv_with_schema(input_file, ValidationSchema.REPORTER_SEQUENCE_DESIGN):
+    if not _validate(input_file, ValidationSchema.REPORTER_SEQUENCE_DESIGN):
         raise click.ClickException("Validation failed. Please check the input file.")
 
 
@@ -66,7 +186,7 @@ def reporter_barcode_to_element_mapping(input_file: str) -> None:
     Args:
         input_file (str): Path to the MPRA Reporter Barcode to Element Mapping file to validate.
     """
-    if not validate_tsv_with_schema(input_file, ValidationSchema.REPORTER_BARCODE_TO_ELEMENT_MAPPING):
+    if not _validate(input_file, ValidationSchema.REPORTER_BARCODE_TO_ELEMENT_MAPPING):
         raise click.ClickException("Validation failed. Please check the input file.")
 
 
@@ -85,7 +205,7 @@ def reporter_experiment_barcode(input_file: str) -> None:
     Args:
         input_file (str): Path to the MPRA Reporter Experiment Barcode file to validate.
     """
-    if not validate_tsv_with_schema(input_file, ValidationSchema.REPORTER_EXPERIMENT_BARCODE):
+    if not _validate(input_file, ValidationSchema.REPORTER_EXPERIMENT_BARCODE):
         raise click.ClickException("Validation failed. Please check the input file.")
 
 
@@ -104,7 +224,7 @@ def reporter_experiment(input_file: str) -> None:
     Args:
         input_file (str): Path to the MPRA Reporter Experiment file to validate.
     """
-    if not validate_tsv_with_schema(input_file, ValidationSchema.REPORTER_EXPERIMENT):
+    if not _validate(input_file, ValidationSchema.REPORTER_EXPERIMENT):
         raise click.ClickException("Validation failed. Please check the input file.")
 
 
@@ -123,7 +243,7 @@ def reporter_element(input_file: str) -> None:
     Args:
         input_file (str): Path to the MPRA Reporter Element file to validate.
     """
-    if not validate_tsv_with_schema(input_file, ValidationSchema.REPORTER_ELEMENT):
+    if not _validate(input_file, ValidationSchema.REPORTER_ELEMENT):
         raise click.ClickException("Validation failed. Please check the input file.")
 
 
@@ -142,7 +262,7 @@ def reporter_variant(input_file: str) -> None:
     Args:
         input_file (str): Path to the MPRA Reporter Variant file to validate.
     """
-    if not validate_tsv_with_schema(input_file, ValidationSchema.REPORTER_VARIANT):
+    if not _validate(input_file, ValidationSchema.REPORTER_VARIANT):
         raise click.ClickException("Validation failed. Please check the input file.")
 
 
@@ -161,7 +281,7 @@ def reporter_genomic_element(input_file: str) -> None:
     Args:
         input_file (str): Path to the MPRA Reporter Genomic Element file to validate.
     """
-    if not validate_tsv_with_schema(input_file, ValidationSchema.REPORTER_GENOMIC_ELEMENT):
+    if not _validate(input_file, ValidationSchema.REPORTER_GENOMIC_ELEMENT):
         raise click.ClickException("Validation failed. Please check the input file.")
 
 
@@ -180,7 +300,7 @@ def reporter_genomic_variant(input_file: str) -> None:
     Args:
         input_file (str): Path to the MPRA Reporter Genomic Variant file to validate.
     """
-    if not validate_tsv_with_schema(input_file, ValidationSchema.REPORTER_GENOMIC_VARIANT):
+    if not _validate(input_file, ValidationSchema.REPORTER_GENOMIC_VARIANT):
         raise click.ClickException("Validation failed. Please check the input file.")
 
 
@@ -228,7 +348,7 @@ def activities(input_file: str, bc_threshold: int, element_level: bool, output_f
         element_level (bool): Export activity at the element (default) or barcode level.
         output_file (str): Output file of results.
     """
-    mpradata = MPRABarcodeData.from_file(input_file)
+    mpradata = _read_barcode_data(input_file)
 
     mpradata.barcode_threshold = bc_threshold
 
@@ -280,7 +400,7 @@ def compute_correlation(input_file: str, bc_threshold: int, correlation_on: str,
         correlation_on (str): Using a barcode threshold for output (element level only).
         correlation_method (str): Computing pearson, spearman or both.
     """
-    mpradata = MPRABarcodeData.from_file(input_file).oligo_data
+    mpradata = _read_barcode_data(input_file).oligo_data
 
     mpradata.barcode_threshold = bc_threshold
 
@@ -347,6 +467,29 @@ def compute_correlation(input_file: str, bc_threshold: int, correlation_on: str,
     type=click.Path(writable=True),
     help="Output the barcode file of results.",
 )
+@click.option(
+    "--sweep",
+    "sweep_values",
+    required=False,
+    type=str,
+    help="JSON string or Python dict of parameter value lists, e.g. '{\"times_zscore\": [2, 3, 4, 5]}'. Evaluates every "
+    "combination of values, together with --method-values, on the data loaded once and outputs a table instead of files.",
+)
+@click.option(
+    "--output-sweep",
+    "output_sweep_file",
+    required=False,
+    type=click.Path(writable=True),
+    help="Output the table of the sweep. Printed if not given.",
+)
+@click.option(
+    "--threads",
+    "threads",
+    default=1,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Number of processes evaluating the settings of the sweep in parallel.",
+)
 def filter(
     input_file: str,
     method: str,
@@ -354,6 +497,9 @@ def filter(
     bc_threshold: int,
     output_activity_file: str | None,
     output_barcode_file: str | None,
+    sweep_values: str | None,
+    output_sweep_file: str | None,
+    threads: int,
 ) -> None:
     """
     Filters barcodes from MPRA barcode data using different methods.
@@ -361,6 +507,8 @@ def filter(
     Reads an input file to create an MPRAdata object, applies a barcode filter to remove outliers
     using the specified method and parameters, and optionally exports the filtered activity data
     to an output file. Prints Pearson correlation of log2FoldChange across replicates before and after outlier removal.
+    With a sweep, the filter is evaluated for every combination of the swept parameter values instead, and a table of
+    removed barcodes and Pearson correlations per setting is written.
 
     Args:
         input_file (str): Path to the input file containing barcode data.
@@ -369,9 +517,34 @@ def filter(
         bc_threshold (int): Minimum barcode count threshold for generating the Pearson correlation.
         output_activity_file (str): Path to the output file to export filtered activity data. If None, no file is written.
         output_barcode_file (str): Path to the output file to export filtered barcode data. If None, no file is written.
+        sweep_values (dict): Lists of values of the swept parameters. If None, the filter is applied once.
+        output_sweep_file (str): Path to the output file of the sweep table. If None, the table is printed.
+        threads (int): Number of processes evaluating the settings of the sweep.
     """
 
-    mpradata = MPRABarcodeData.from_file(input_file)
+    # Parse method_values as dict if provided
+    params = _parse_dict_option(method_values, "--method-values") if method_values else {}
+
+    if sweep_values:
+        if output_activity_file or output_barcode_file:
+            raise click.ClickException("--output-activity and --output-barcode cannot be used with --sweep.")
+        grid = _parse_dict_option(sweep_values, "--sweep")
+        if not isinstance(grid, dict):
+            raise click.ClickException("--sweep must map parameter names to lists of values.")
+        grid = {name: values if isinstance(values, (list, tuple)) else [values] for name, values in grid.items()}
+
+        mpradata = _read_barcode_data(input_file)
+        mpradata.barcode_threshold = bc_threshold
+        mpradata.var_filter = None
+
+        table = mpradata.sweep_barcode_filter(BarcodeFilter.from_string(method), grid, params, threads=threads)
+        if output_sweep_file:
+            table.to_csv(output_sweep_file, sep="\t", index=False, na_rep="NA")
+        else:
+            click.echo(table.to_csv(sep="\t", index=False, na_rep="NA"), nl=False)
+        return
+
+    mpradata = _read_barcode_data(input_file)
 
     mpradata.barcode_threshold = bc_threshold
     oligo_data = mpradata.oligo_data
@@ -381,16 +554,6 @@ def filter(
         f"{oligo_data.correlation('pearson', Modality.ACTIVITY).flatten()[[1, 2, 5]]}"
     )
     mpradata.var_filter = None
-    # Parse method_values as dict if provided
-    params = {}
-    if method_values:
-        try:
-            params = json.loads(method_values)
-        except Exception:
-            try:
-                params = ast.literal_eval(method_values)
-            except Exception:
-                raise click.ClickException("Could not parse --method-values as dict or JSON.")
 
     mpradata.apply_barcode_filter(BarcodeFilter.from_string(method), params)
 
@@ -444,11 +607,11 @@ def get_variant_map(input_file: str, sequence_design_file: str, output_file: str
         output_file (str): Output file of results.
     """
 
-    df_sequence_design = read_sequence_design_file(sequence_design_file)
+    df_sequence_design = _read_sequence_design(sequence_design_file)
 
     if input_file:
         print("Read barcode count file...")
-        mpradata = MPRABarcodeData.from_file(input_file)
+        mpradata = _read_barcode_data(input_file)
 
         print("Generating oligo data...")
         mpradata = mpradata.oligo_data
@@ -456,46 +619,18 @@ def get_variant_map(input_file: str, sequence_design_file: str, output_file: str
         print("Adding metadata file...")
         mpradata.add_sequence_design(df_sequence_design, sequence_design_file)
 
-        print(mpradata.data.var["SPDI"])
-        print(type(mpradata.data.var["SPDI"]))
-        print(mpradata.data.var["SPDI"].values)
-
         print("Generating variant map...")
         variant_map = mpradata.variant_map
     else:
-        variant_map = pd.DataFrame(
-            {
-                "ID": np.concatenate(df_sequence_design["SPDI"].values),
-                "allele": np.concatenate(df_sequence_design["allele"].values),
-                "oligo": df_sequence_design.index.values.repeat(df_sequence_design["SPDI"].apply(len)),
-            }
-        )
-
-        variant_map["REF"] = np.where(
-            variant_map["allele"] == "ref",
-            variant_map["oligo"],
-            np.full(len(variant_map["allele"]), pd.NA, dtype=object),
-        )
-        variant_map["ALT"] = np.where(
-            variant_map["allele"] == "alt",
-            variant_map["oligo"],
-            np.full(len(variant_map["allele"]), pd.NA, dtype=object),
-        )
-        variant_map = variant_map.groupby("ID").agg(
-            {
-                "REF": lambda x: [val for val in x if pd.notna(val)],
-                "ALT": lambda x: [val for val in x if pd.notna(val)],
-            }
-        )
+        spdis, offsets = flatten_lists(df_sequence_design["SPDI"])
+        alleles, _ = flatten_lists(df_sequence_design["allele"])
+        oligo_codes = np.repeat(np.arange(len(df_sequence_design)), np.diff(offsets))
+        variant_map = variant_oligo_lists(build_variant_table(spdis, alleles, oligo_codes), df_sequence_design.index)
 
     print("Prepair output file...")
-    for key in ["REF", "ALT"]:
-
-        # TODO: what happens a variant has multiple alt alleles?
-        # Right now joined by comma. But maybe I hould use one row per ref/alt pai?
-        variant_map.loc[:, key] = variant_map[key].apply(lambda x: ",".join(x))
-
-    variant_map = variant_map[variant_map.apply(lambda x: all(x != ""), axis=1)]
+    # TODO: what happens a variant has multiple alt alleles?
+    # Right now joined by comma. But maybe I hould use one row per ref/alt pai?
+    variant_map = pd.DataFrame({key: variant_map[key].str.join(",") for key in ["REF", "ALT"]})
 
     variant_map.to_csv(output_file, sep="\t", index=True)
 
@@ -595,7 +730,7 @@ def get_counts(
         elements_only (bool): Only return count data for elements and ref sequence of variants.
         output_file (str): Output file of all non zero counts.
     """
-    mpradata = MPRABarcodeData.from_file(input_file)
+    mpradata = _read_barcode_data(input_file)
     mpradata.scaling = scaling_factor
     mpradata.pseudo_count = pseudo_count
 
@@ -604,14 +739,12 @@ def get_counts(
     if use_oligos:
         mpradata = mpradata.oligo_data
 
-    mpradata.add_sequence_design(read_sequence_design_file(sequence_design_file), sequence_design_file)
+    mpradata.add_sequence_design(_read_sequence_design(sequence_design_file), sequence_design_file)
 
     element_mask = None
     if elements_only:
 
-        element_mask = np.array(mpradata.data.var["allele"].apply(lambda x: "ref" in x).values, dtype=bool) | (
-            mpradata.data.var["category"] == "element"
-        )
+        element_mask = mpradata.sequence_design_contains("allele", "ref") | (mpradata.data.var["category"] == "element")
         element_mask = ~np.repeat(np.array(element_mask)[np.newaxis, :], mpradata.n_obs, axis=0)
 
     export_counts_file(mpradata, output_file, normalized=normalized_counts, filter=element_mask)
@@ -710,71 +843,51 @@ def get_variant_counts(
         - When `use_oligos` is False, the function exports the counts using `export_counts_file`.
         - Variants with all-zero counts or counts only on reference or alternate are removed from the output.
     """
-    mpradata = MPRABarcodeData.from_file(input_file)
+    mpradata = _read_barcode_data(input_file)
     mpradata.scaling = scaling_factor
     mpradata.pseudo_count = pseudo_count
 
-    mpradata.add_sequence_design(read_sequence_design_file(sequence_design_file), sequence_design_file)
+    mpradata.add_sequence_design(_read_sequence_design(sequence_design_file), sequence_design_file)
 
     mpradata.barcode_threshold = bc_threshold
 
     if use_oligos:
         mpradata = mpradata.oligo_data
 
-        variant_map = mpradata.variant_map
-
-        df = {"variant_id": []}
-        for replicate in mpradata.obs_names:
-            for rna_or_dna in ["dna", "rna"]:
-                df[f"{rna_or_dna}_count_{replicate}_REF"] = []
-                df[f"{rna_or_dna}_count_{replicate}_ALT"] = []
+        variant_table = mpradata.variant_table
 
         if normalized_counts:
-            dna_counts = mpradata.normalized_dna_counts.copy()
-            rna_counts = mpradata.normalized_rna_counts.copy()
+            counts = {"dna": mpradata.normalized_dna_counts, "rna": mpradata.normalized_rna_counts}
         else:
-            dna_counts = mpradata.dna_counts.copy()
-            rna_counts = mpradata.rna_counts.copy()
+            counts = {"dna": mpradata.dna_counts, "rna": mpradata.rna_counts}
 
         not_observed_mask = ~mpradata.observed
         lower_bc_mask = mpradata.barcode_counts < mpradata.barcode_threshold
-        not_variant_mask = ~np.repeat(
-            np.array(mpradata.data.var["category"] == "variant")[np.newaxis, :],
-            mpradata.n_obs,
-            axis=0,
-        )
-
-        dna_counts = np.ma.masked_array(
-            dna_counts,
-            mask=np.any([not_observed_mask, lower_bc_mask, not_variant_mask], axis=0),
-        )
-        rna_counts = np.ma.masked_array(
-            rna_counts,
-            mask=np.any([not_observed_mask, lower_bc_mask, not_variant_mask], axis=0),
+        not_variant_mask = ~np.array(mpradata.data.var["category"] == "variant")[np.newaxis, :]
+        mask = not_observed_mask | lower_bc_mask | not_variant_mask
+
+        incidence = {
+            "REF": allele_incidence(variant_table, "ref", mpradata.n_vars),
+            "ALT": allele_incidence(variant_table, "alt", mpradata.n_vars),
+        }
+        sums = {}
+        for allele, variant_oligos in incidence.items():
+            # sums of the unmasked oligos of all variants, missing if all oligos of a variant are masked
+            has_counts = np.asarray((~mask) @ variant_oligos.T.astype(np.int64)) > 0
+            for rna_or_dna, modality_counts in counts.items():
+                allele_sums = as_dense_array(np.where(mask, 0, modality_counts) @ variant_oligos.T).astype(np.float64)
+                sums[(rna_or_dna, allele)] = np.where(has_counts, allele_sums, np.nan)
+
+        df = pd.DataFrame(
+            {
+                f"{rna_or_dna}_count_{replicate}_{allele}": sums[(rna_or_dna, allele)][idx]
+                for idx, replicate in enumerate(mpradata.obs_names)
+                for rna_or_dna in ["dna", "rna"]
+                for allele in ["REF", "ALT"]
+            },
+            index=pd.Index(variant_table["variant_id"].cat.categories, name="variant_id"),
         )
-
-        for spdi, row in variant_map.iterrows():
-
-            mask_ref = mpradata.oligos.isin(row["REF"])
-            mask_alt = mpradata.oligos.isin(row["ALT"])
-
-            df["variant_id"].append(spdi)
-
-            dna_counts_ref = dna_counts[:, mask_ref].sum(axis=1)
-            rna_counts_ref = rna_counts[:, mask_ref].sum(axis=1)
-
-            dna_counts_alt = dna_counts[:, mask_alt].sum(axis=1)
-            rna_counts_alt = rna_counts[:, mask_alt].sum(axis=1)
-
-            for idx, replicate in enumerate(mpradata.obs_names):
-                df[f"dna_count_{replicate}_REF"].append(dna_counts_ref[idx])
-                df[f"rna_count_{replicate}_REF"].append(rna_counts_ref[idx])
-                df[f"dna_count_{replicate}_ALT"].append(dna_counts_alt[idx])
-                df[f"rna_count_{replicate}_ALT"].append(rna_counts_alt[idx])
-
-        df = pd.DataFrame(df).set_index("variant_id")
         # remove IDs which are all zero or just on ref or alt
-        df = df.map(lambda x: np.nan if isinstance(x, np.ma.core.MaskedConstant) else x)
         ref_columns = [f"dna_count_{replicate}_REF" for replicate in mpradata.obs_names] + [
             f"rna_count_{replicate}_REF" for replicate in mpradata.obs_names
         ]
@@ -855,17 +968,16 @@ def get_reporter_elements(
         bc_threshold (int): Using a barcode threshold for output.
         output_reporter_elements_file (str): Output file of MPRA data object.
     """
-    mpradata = MPRABarcodeData.from_file(input_file).oligo_data
+    mpradata = _read_barcode_data(input_file).oligo_data
 
-    mpradata.add_sequence_design(read_sequence_design_file(sequence_design_file), sequence_design_file)
+    mpradata.add_sequence_design(_read_sequence_design(sequence_design_file), sequence_design_file)
 
     mpradata.barcode_threshold = bc_threshold
 
     df = pd.read_csv(statistics_file, sep="\t", header=0)
 
-    indexes_in_order = [mpradata.oligos[mpradata.oligos == ID].index.tolist() for ID in df["ID"]]
-    indexes_in_order = [index for sublist in indexes_in_order for index in sublist]
-    df.index = pd.Index(indexes_in_order)
+    _, positions = oligo_positions(mpradata.oligos, df["ID"])
+    df.index = mpradata.oligos.index[positions]
 
     df = df.join(mpradata.oligos, how="right")
 
@@ -892,6 +1004,35 @@ def get_reporter_elements(
     ].to_csv(output_reporter_elements_file, sep="\t", index=False, float_format="%.4f")
 
 
+def _variant_counts(mpradata: MPRAOligoData) -> pd.DataFrame:
+    """Computes the mean normalized counts of the REF and ALT oligos of all variants in one sparse product.
+
+    Args:
+        mpradata (MPRAOligoData): Oligo data with a sequence design.
+
+    Returns:
+        DataFrame indexed by variant ID with the input and output counts of both alleles, and the variant position and strand
+        of the first REF oligo.
+    """
+    variant_table = mpradata.variant_table
+    ref = allele_incidence(variant_table, "ref", mpradata.n_vars)
+    alt = allele_incidence(variant_table, "alt", mpradata.n_vars)
+    dna_counts = mpradata.normalized_dna_counts
+    rna_counts = mpradata.normalized_rna_counts
+    first_ref = np.asarray(ref.argmax(axis=1)).ravel()
+    return pd.DataFrame(
+        {
+            "inputCountRef": as_dense_array(dna_counts @ ref.T).mean(axis=0),
+            "inputCountAlt": as_dense_array(dna_counts @ alt.T).mean(axis=0),
+            "outputCountRef": as_dense_array(rna_counts @ ref.T).mean(axis=0),
+            "outputCountAlt": as_dense_array(rna_counts @ alt.T).mean(axis=0),
+            "variantPos": mpradata.sequence_design_list("variant_pos").iloc[first_ref].str[0].to_numpy(),
+            "strand": mpradata.data.var["strand"].iloc[first_ref].to_numpy(),
+        },
+        index=pd.Index(variant_table["variant_id"].cat.categories, name="ID"),
+    )
+
+
 @combine.command(help="Generate reporter variant file from counts, sequence design and quantification statistics.")
 @click.option(
     "--input",
@@ -946,40 +1087,19 @@ def get_reporter_variants(
         bc_threshold (int): Using a barcode threshold for output.
         output_reporter_variants_file (str): Output file of MPRA data object.
     """
-    mpradata = MPRABarcodeData.from_file(input_file)
+    mpradata = _read_barcode_data(input_file)
 
-    mpradata.add_sequence_design(read_sequence_design_file(sequence_design_file), sequence_design_file)
+    mpradata.add_sequence_design(_read_sequence_design(sequence_design_file), sequence_design_file)
 
     mpradata.barcode_threshold = bc_threshold
 
     mpradata = mpradata.oligo_data
 
-    variant_map = mpradata.variant_map
-
     df = pd.read_csv(statistics_file, sep="\t", header=0, index_col=0, na_values="NA").dropna()
 
-    dna_counts = mpradata.normalized_dna_counts.copy()
-    rna_counts = mpradata.normalized_rna_counts.copy()
-
-    for spdi, row in variant_map.iterrows():
-
-        mask_ref = mpradata.oligos.isin(row["REF"])
-        mask_alt = mpradata.oligos.isin(row["ALT"])
-
-        dna_counts_ref = dna_counts[:, mask_ref].sum(axis=1)
-        rna_counts_ref = rna_counts[:, mask_ref].sum(axis=1)
-
-        dna_counts_alt = dna_counts[:, mask_alt].sum(axis=1)
-        rna_counts_alt = rna_counts[:, mask_alt].sum(axis=1)
-
-        if spdi in df.index:
-            df.loc[str(spdi), "inputCountRef"] = dna_counts_ref.mean()
-            df.loc[str(spdi), "inputCountAlt"] = dna_counts_alt.mean()
-            df.loc[str(spdi), "outputCountRef"] = rna_counts_ref.mean()
-            df.loc[str(spdi), "outputCountAlt"] = rna_counts_alt.mean()
-            df.loc[str(spdi), "variantPos"] = int(
-                mpradata.data.var["variant_pos"][mpradata.oligos.isin(row["REF"])].values[0][0]
-            )
+    variants = _variant_counts(mpradata).reindex(df.index)
+    for column in variants.columns:
+        df[column] = variants[column].to_numpy()
 
     df.loc[df["P.Value"] == 0, "P.Value"] = np.finfo(float).eps
     df.loc[df["adj.P.Val"] == 0, "adj.P.Val"] = np.finfo(float).eps
@@ -993,10 +1113,11 @@ def get_reporter_variants(
         },
         inplace=True,
     )
-    df["postProbEffect"] = df["B"].apply(lambda x: math.exp(x) / (1 + math.exp(x)))
+    df["postProbEffect"] = expit(df["B"])
     df["variant_id"] = df.index
-    df["refAllele"] = df["variant_id"].apply(lambda x: x.split(":")[2])
-    df["altAllele"] = df["variant_id"].apply(lambda x: x.split(":")[3])
+    spdi = df["variant_id"].str.split(":", expand=True)
+    df["refAllele"] = spdi[2]
+    df["altAllele"] = spdi[3]
     df["variantPos"] = df["variantPos"].astype(int)
 
     df[
@@ -1061,7 +1182,7 @@ def get_reporter_variants(
     "output_reporter_genomic_elements_file",
     required=True,
     type=click.Path(writable=True),
-    help="Output file of MPRA data object.",
+    help="Output file of MPRA data object. Files ending with .gz or .bgz are BGZF compressed and indexed with tabix (.tbi).",
 )
 def get_reporter_genomic_elements(
     input_file: str,
@@ -1082,24 +1203,21 @@ def get_reporter_genomic_elements(
         reference (str): Using only this reference as denoted in ref in the sequence design file
         output_reporter_genomic_elements_file (str): Output file of MPRA data object.
     """
-    mpradata = MPRABarcodeData.from_file(input_file)
+    mpradata = _read_barcode_data(input_file)
 
-    mpradata.add_sequence_design(read_sequence_design_file(sequence_design_file), sequence_design_file)
+    mpradata.add_sequence_design(_read_sequence_design(sequence_design_file), sequence_design_file)
 
     mpradata.barcode_threshold = bc_threshold
 
     mpradata = mpradata.oligo_data
 
-    mask = np.array(mpradata.data.var["allele"].apply(lambda x: "ref" in x).values, dtype=bool) | (
-        mpradata.data.var["category"] == "element"
-    )
+    mask = mpradata.sequence_design_contains("allele", "ref") | (mpradata.data.var["category"] == "element")
     mask = mask & (mpradata.data.var["ref"] == reference)
 
     df = pd.read_csv(statistics_file, sep="\t", header=0)
 
-    indexes_in_order = [mpradata.oligos[mpradata.oligos == ID].index.tolist() for ID in df["ID"]]
-    indexes_in_order = [index for sublist in indexes_in_order for index in sublist]
-    df.index = pd.Index(indexes_in_order)
+    _, positions = oligo_positions(mpradata.oligos, df["ID"])
+    df.index = mpradata.oligos.index[positions]
 
     df = df.join(mpradata.oligos, how="right")
 
@@ -1142,7 +1260,7 @@ def get_reporter_genomic_elements(
         ]
     ].sort_values(by=["chr", "start", "end"])
 
-    out_df.to_csv(output_reporter_genomic_elements_file, sep="\t", index=False, header=False, float_format="%.4f")
+    export_bed_file(out_df, output_reporter_genomic_elements_file)
 
 
 @combine.command(help="Generate reporter genomic variants file from counts, sequence design and quantification statistics.")
@@ -1188,7 +1306,7 @@ def get_reporter_genomic_elements(
     "output_reporter_genomic_variants_file",
     required=True,
     type=click.Path(writable=True),
-    help="Output file of MPRA data object.",
+    help="Output file of MPRA data object. Files ending with .gz or .bgz are BGZF compressed and indexed with tabix (.tbi).",
 )
 def get_reporter_genomic_variants(
     input_file: str,
@@ -1209,41 +1327,19 @@ def get_reporter_genomic_variants(
         reference (str): Using only this reference as denoted in ref in the sequence design file
         output_reporter_genomic_variants_file (str): Output file of MPRA data object
     """
-    mpradata = MPRABarcodeData.from_file(input_file)
+    mpradata = _read_barcode_data(input_file)
 
-    mpradata.add_sequence_design(read_sequence_design_file(sequence_design_file), sequence_design_file)
+    mpradata.add_sequence_design(_read_sequence_design(sequence_design_file), sequence_design_file)
 
     mpradata.barcode_threshold = bc_threshold
 
     mpradata = mpradata.oligo_data
 
-    variant_map = mpradata.variant_map
-
     df = pd.read_csv(statistics_file, sep="\t", header=0, index_col=0, na_values="NA").dropna()
 
-    dna_counts = mpradata.normalized_dna_counts.copy()
-    rna_counts = mpradata.normalized_rna_counts.copy()
-
-    for spdi, row in variant_map.iterrows():
-
-        mask_ref = mpradata.oligos.isin(row["REF"])
-        mask_alt = mpradata.oligos.isin(row["ALT"])
-
-        dna_counts_ref = dna_counts[:, mask_ref].sum(axis=1)
-        rna_counts_ref = rna_counts[:, mask_ref].sum(axis=1)
-
-        dna_counts_alt = dna_counts[:, mask_alt].sum(axis=1)
-        rna_counts_alt = rna_counts[:, mask_alt].sum(axis=1)
-
-        if spdi in df.index:
-            df.loc[str(spdi), "inputCountRef"] = dna_counts_ref.mean()
-            df.loc[str(spdi), "inputCountAlt"] = dna_counts_alt.mean()
-            df.loc[str(spdi), "outputCountRef"] = rna_counts_ref.mean()
-            df.loc[str(spdi), "outputCountAlt"] = rna_counts_alt.mean()
-            df.loc[str(spdi), "variantPos"] = int(
-                mpradata.data.var["variant_pos"][mpradata.oligos.isin(row["REF"])].values[0][0]
-            )
-            df.loc[str(spdi), "strand"] = mpradata.data.var["strand"][mpradata.oligos.isin(row["REF"])].values[0]
+    variants = _variant_counts(mpradata).reindex(df.index)
+    for column in variants.columns:
+        df[column] = variants[column].to_numpy()
 
     df["variantPos"] = df["variantPos"].astype(int)
     df.loc[df["P.Value"] == 0, "P.Value"] = np.finfo(float).eps
@@ -1258,16 +1354,15 @@ def get_reporter_genomic_variants(
         },
         inplace=True,
     )
-    df["postProbEffect"] = df["B"].apply(lambda x: math.exp(x) / (1 + math.exp(x)))
+    df["postProbEffect"] = expit(df["B"])
     df["variant_id"] = df.index
-    df["refAllele"] = df["variant_id"].apply(lambda x: x.split(":")[2])
-    df["altAllele"] = df["variant_id"].apply(lambda x: x.split(":")[3])
-    df["start"] = df["variant_id"].apply(lambda x: x.split(":")[1]).astype(int)
-    df["end"] = df["start"] + df["refAllele"].apply(lambda x: len(x)).astype(int)
+    spdi = df["variant_id"].str.split(":", expand=True)
+    df["refAllele"] = spdi[2]
+    df["altAllele"] = spdi[3]
+    df["start"] = spdi[1].astype(int)
+    df["end"] = df["start"] + df["refAllele"].str.len().astype(int)
 
-    map = chromosome_map()
-    map = map[map["release"] == reference]
-    df["chr"] = df["variant_id"].apply(lambda x: _get_chr(map, x, mpradata.LOGGER))
+    df["chr"] = _get_chromosomes(df["variant_id"], chromosome_aliases(reference), mpradata.LOGGER)
 
     df.dropna(inplace=True)
 
@@ -1298,16 +1393,32 @@ def get_reporter_genomic_variants(
         ]
     ].sort_values(by=["chr", "start", "end"])
 
-    df.to_csv(output_reporter_genomic_variants_file, sep="\t", index=False, header=False, float_format="%.4f")
+    export_bed_file(df, output_reporter_genomic_variants_file)
 
 
-def _get_chr(map: pd.DataFrame, variant_id: str, logger: logging.Logger) -> str | None:
-    variant_contig = variant_id.split(":")[0]
-    if variant_contig in map["refseq"].values:
-        return map[map["refseq"] == variant_contig].loc[:, "ucsc"].values[0]
-    else:
+def _get_chromosomes(variant_ids: pd.Series, aliases: Mapping[str, str], logger: logging.Logger) -> pd.Series:
+    """Resolves the contigs of SPDI IDs to chromosome names in one lookup.
+
+    Args:
+        variant_ids (pd.Series): SPDI IDs.
+        aliases (Mapping[str, str]): Chromosome name of each contig, e.g. from :func:`chromosome_aliases`.
+        logger (logging.Logger): Logger of warnings about contigs without a chromosome name.
+
+    Returns:
+        The chromosome name of each ID, NaN if the contig is not found.
+    """
+    contigs = variant_ids.str.split(":").str[0]
+    chromosomes = contigs.map(aliases)
+    for variant_contig, variant_id in zip(contigs[chromosomes.isna()], variant_ids[chromosomes.isna()]):
         logger.warning(f"Contig {variant_contig} of SPDI {variant_id} not found in chromosome map. Returning None.")
-        return None
+    return chromosomes
+
+
+def _get_chr(map: pd.DataFrame, variant_id: str, logger: logging.Logger) -> str | None:
+    map = map.dropna(subset=["refseq"]).drop_duplicates("refseq")
+    aliases = dict(zip(map["refseq"].astype(str), map["ucsc"]))
+    chromosome = _get_chromosomes(pd.Series([variant_id]), aliases, logger).iloc[0]
+    return None if pd.isna(chromosome) else chromosome
 
 
 @cli.group(help="Plotting functions.")
@@ -1383,7 +1494,7 @@ def correlation(
         replicates (list): List of replicate names to include in the plot. If None, all replicates are included.
         output_file (str): Path to the output file where the plot will be saved.
     """  # noqa: E501
-    mpradata = MPRABarcodeData.from_file(input_file)
+    mpradata = _read_barcode_data(input_file)
 
     mpradata.barcode_threshold = bc_threshold
 
@@ -1458,7 +1569,7 @@ def dna_vs_rna(
         replicates (list): List of replicate names to compute the median on for the plot. If None, all replicates are included.
         output_file (str): Path to the output file where the plot will be saved.
     """  # noqa: E501
-    mpradata = MPRABarcodeData.from_file(input_file)
+    mpradata = _read_barcode_data(input_file)
 
     mpradata.barcode_threshold = bc_threshold
 
@@ -1507,7 +1618,7 @@ def barcodes_per_oligo(input_file: str, replicates: list | None, output_file: st
         replicates (list): List of replicate names to plot the histogram. If None, all replicates are included.
         output_file (str): Path to the output file where the plot will be saved.
     """  # noqa: E501
-    mpradata = MPRABarcodeData.from_file(input_file).oligo_data
+    mpradata = _read_barcode_data(input_file).oligo_data
 
     if replicates:
         fig = plt.barcodes_per_oligo(mpradata, replicates)
@@ -1551,7 +1662,7 @@ def outlier(input_file: str, bc_threshold: int, output_file: str) -> None:
         bc_threshold (int): Minimum barcode count threshold per oligo to consider.
         output_file (str): Path to the output file where the plot will be saved.
     """  # noqa: E501
-    mpradata = MPRABarcodeData.from_file(input_file)
+    mpradata = _read_barcode_data(input_file)
 
     mpradata.barcode_threshold = bc_threshold
 
@@ -1,19 +1,567 @@
+import io
+import itertools
 import logging
+import multiprocessing
 import os
 from abc import ABC, abstractmethod
-from collections.abc import Callable
+from collections.abc import Callable, Iterable, Mapping
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
 from typing import Any
 
 import anndata as ad
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 from numpy.typing import NDArray
-from scipy.stats import pearsonr, spearmanr
+from scipy.special import betainc
+from scipy.stats import rankdata
 
 from mpralib.exception import MPRAlibException
 
 
+def as_dense_array(counts: NDArray | sp.spmatrix) -> NDArray:
+    """Returns a count matrix as dense NumPy array.
+
+    Args:
+        counts (NDArray | scipy.sparse.spmatrix): A dense or sparse count matrix, e.g. a layer of sparse barcode data.
+
+    Returns:
+        The counts as dense NumPy array. Dense input is returned as is without copying.
+    """
+    if sp.issparse(counts):
+        return counts.toarray()
+    return np.asarray(counts)
+
+
+def _row_sums(counts: NDArray | sp.spmatrix) -> NDArray:
+    return np.asarray(counts.sum(axis=1)).ravel()
+
+
+def segment_sum(counts: NDArray | sp.spmatrix, codes: NDArray[np.integer], n_segments: int) -> NDArray:
+    """Sums the columns of a (replicates x barcodes) matrix per segment, e.g. over all barcodes of an oligo.
+
+    The reduction is a single product with a sparse barcode-to-segment indicator matrix and works for dense and sparse counts.
+
+    Args:
+        counts (NDArray | scipy.sparse.spmatrix): Dense or sparse matrix with one column per barcode.
+        codes (NDArray[np.integer]): Segment code of each column, between 0 and `n_segments - 1`. Columns with code -1 are ignored.
+        n_segments (int): Number of segments.
+
+    Returns:
+        Dense (replicates x n_segments) matrix of the sums.
+    """  # noqa: E501
+    codes = np.asarray(codes)
+    columns = np.flatnonzero(codes >= 0)
+    indicator = sp.csr_matrix(
+        (np.ones(len(columns), dtype=np.int64), (columns, codes[columns])),
+        shape=(len(codes), n_segments),
+    )
+    return as_dense_array(counts @ indicator)
+
+
+def _matrix_entries(counts: NDArray | sp.spmatrix, rows: NDArray[np.intp], cols: NDArray[np.intp]) -> NDArray:
+    # values of a dense or sparse matrix at the given positions; sparse matrices return a matrix for empty positions
+    if not sp.issparse(counts):
+        return counts[rows, cols]
+    if len(rows) == 0:
+        return np.zeros(0, dtype=counts.dtype)
+    return np.asarray(counts[rows, cols]).ravel()
+
+
+def _broadcast_segments(sums: NDArray, codes: NDArray[np.integer]) -> NDArray:
+    # maps segment values back to the columns of each segment; code -1 picks the appended zero column
+    return np.append(sums, np.zeros((sums.shape[0], 1), dtype=sums.dtype), axis=1)[:, codes]
+
+
+def oligo_positions(oligos: pd.Series, names: Any) -> tuple[NDArray[np.intp], NDArray[np.intp]]:
+    """Looks up oligo names, e.g. the IDs of a statistics file, in the oligos of the data with a hash index built once.
+
+    The result equals `[(i, j) for i, name in enumerate(names) for j in np.flatnonzero(oligos == name)]` but takes linear time.
+
+    Args:
+        oligos (pd.Series): Oligo name of each column of the data.
+        names (Any): Array-like of oligo names to look up.
+
+    Returns:
+        The position in `names` and the column of each match, ordered by `names` and then by column.
+    """  # noqa: E501
+    codes, uniques = pd.factorize(oligos)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    # columns grouped by oligo in column order; missing oligos (code -1) are sorted first and dropped
+    n_missing = len(codes) - counts.sum()
+    order = np.argsort(codes, kind="stable")[n_missing:]
+    starts = np.cumsum(counts) - counts
+
+    # unknown names (code -1) pick the appended group without columns
+    name_codes = pd.Index(uniques).get_indexer(pd.Index(names))
+    n_matches = np.append(counts, 0)[name_codes]
+    matches = np.repeat(np.arange(len(name_codes)), n_matches)
+    offsets = np.arange(n_matches.sum()) - np.repeat(np.cumsum(n_matches) - n_matches, n_matches)
+    return matches, order[np.repeat(np.append(starts, 0)[name_codes], n_matches) + offsets]
+
+
+def variant_incidence(oligo_lists: pd.Series, oligos: pd.Series) -> sp.csr_matrix:
+    """Builds the sparse incidence matrix of variants and oligos, e.g. of the REF or ALT oligos of :attr:`MPRAData.variant_map`.
+
+    Row `i` equals `oligos.isin(oligo_lists.iloc[i])`, so sums over the oligos of all variants are one sparse product.
+
+    Args:
+        oligo_lists (pd.Series): List of oligo names of each variant.
+        oligos (pd.Series): Oligo name of each column of the data.
+
+    Returns:
+        Boolean (variants x oligos) CSR matrix.
+    """  # noqa: E501
+    names = oligo_lists.reset_index(drop=True).explode().dropna()
+    matches, columns = oligo_positions(oligos, names.to_numpy())
+    # oligos listed twice for a variant are summed up by the constructor and cast back to True
+    return sp.csr_matrix(
+        (np.ones(len(columns), dtype=np.int64), (names.index.to_numpy()[matches], columns)),
+        shape=(len(oligo_lists), len(oligos)),
+    ).astype(np.bool_)
+
+
+def build_variant_table(variant_ids: Any, alleles: Any, oligo_codes: Any) -> pd.DataFrame:
+    """Builds the long table of a variant map from flat SPDI and allele lists, e.g. of :func:`flatten_lists`.
+
+    Only `ref` and `alt` alleles of variants with at least one REF and one ALT oligo are kept. The rows are sorted by variant
+    ID and keep their order within a variant.
+
+    Args:
+        variant_ids (Any): Array-like of the SPDI of each list item.
+        alleles (Any): Array-like of the allele of each list item.
+        oligo_codes (Any): Array-like of the position of the oligo of each list item, e.g. the column in the data.
+
+    Returns:
+        DataFrame with the categorical columns `variant_id` and `allele` and the integer column `oligo_code`.
+    """  # noqa: E501
+    allele_codes = pd.Categorical(alleles, categories=["ref", "alt"]).codes
+    ids, variants = pd.factorize(np.asarray(variant_ids, dtype=object), sort=True)
+    oligo_codes = np.asarray(oligo_codes, dtype=np.int64)
+
+    rows = (ids >= 0) & (allele_codes >= 0)
+    n_alleles = np.bincount(ids[rows] * 2 + allele_codes[rows], minlength=2 * len(variants)).reshape(-1, 2)
+    complete = (n_alleles > 0).all(axis=1)
+    rows &= np.append(complete, False)[ids]
+
+    ids = (np.cumsum(complete) - 1)[ids[rows]]
+    order = np.argsort(ids, kind="stable")
+    return pd.DataFrame(
+        {
+            "variant_id": pd.Categorical.from_codes(ids[order], categories=variants[complete]),
+            "allele": pd.Categorical.from_codes(allele_codes[rows][order], categories=["ref", "alt"]),
+            "oligo_code": oligo_codes[rows][order],
+        }
+    )
+
+
+def variant_oligo_lists(table: pd.DataFrame, oligos: Any) -> pd.DataFrame:
+    """Groups the long table of :func:`build_variant_table` into the REF and ALT oligo names of each variant.
+
+    Args:
+        table (pd.DataFrame): Long table of a variant map.
+        oligos (Any): Array-like of oligo names the `oligo_code` column points to.
+
+    Returns:
+        DataFrame with the lists `REF` and `ALT` indexed by the variant `ID`.
+    """
+    variant_codes = table["variant_id"].cat.codes.to_numpy()
+    names = np.asarray(oligos, dtype=object)[table["oligo_code"].to_numpy()]
+    n_variants = len(table["variant_id"].cat.categories)
+
+    oligo_lists = {}
+    for key, allele in [("REF", "ref"), ("ALT", "alt")]:
+        rows = (table["allele"] == allele).to_numpy()
+        ends = np.cumsum(np.bincount(variant_codes[rows], minlength=n_variants))
+        items = names[rows].tolist()
+        # rows are sorted by variant, so the oligos of a variant are a contiguous slice
+        oligo_lists[key] = [items[start:end] for start, end in zip([0] + ends[:-1].tolist(), ends.tolist())]
+    return pd.DataFrame(oligo_lists, index=pd.Index(table["variant_id"].cat.categories, name="ID"))
+
+
+def allele_incidence(table: pd.DataFrame, allele: str, n_oligos: int) -> sp.csr_matrix:
+    """Builds the sparse incidence matrix of variants and their REF or ALT oligos from the long table of a variant map.
+
+    Args:
+        table (pd.DataFrame): Long table of :func:`build_variant_table`.
+        allele (str): `ref` or `alt`.
+        n_oligos (int): Number of oligos the `oligo_code` column points to, e.g. the number of columns of the data.
+
+    Returns:
+        Boolean (variants x oligos) CSR matrix with the rows ordered like the variant categories of the table.
+    """
+    rows = (table["allele"] == allele).to_numpy()
+    return sp.csr_matrix(
+        (
+            np.ones(rows.sum(), dtype=np.int64),
+            (table["variant_id"].cat.codes.to_numpy()[rows], table["oligo_code"].to_numpy()[rows]),
+        ),
+        shape=(len(table["variant_id"].cat.categories), n_oligos),
+    ).astype(np.bool_)
+
+
+def select_oligos(
+    sequence_design: pd.DataFrame, category: str | list[str] | None = None, region: str | None = None
+) -> pd.Index:
+    """Selects the oligos of a sequence design by category and genomic region.
+
+    Args:
+        sequence_design (pd.DataFrame): Sequence design indexed by oligo name, as read by `read_sequence_design_file`.
+        category (str | list[str] | None, optional): Category or categories of the oligos, e.g. `element` or `variant`.
+            Defaults to None (all categories).
+        region (str | None, optional): Genomic region `chr:start-end` the oligos overlap, with 0-based half-open
+            coordinates like the `start` and `end` columns of the design. Defaults to None (all regions).
+
+    Returns:
+        Names of the selected oligos.
+
+    Raises:
+        ValueError: If the region is not of the form `chr:start-end`.
+    """
+    selected = np.ones(len(sequence_design), dtype=np.bool_)
+    if category is not None:
+        selected &= sequence_design["category"].isin([category] if isinstance(category, str) else category).to_numpy()
+    if region is not None:
+        chromosome, _, interval = region.replace(",", "").rpartition(":")
+        start, _, end = interval.partition("-")
+        if not chromosome or not start.isdigit() or not end.isdigit():
+            raise ValueError(f"Region must be of the form chr:start-end: {region}")
+        overlaps = (
+            (sequence_design["chr"] == chromosome)
+            & (sequence_design["start"] < int(end))
+            & (sequence_design["end"] > int(start))
+        )
+        selected &= overlaps.fillna(False).to_numpy(dtype=np.bool_)
+    return pd.Index(sequence_design.index[selected].astype(str).unique())
+
+
+def flatten_lists(lists: Any) -> tuple[NDArray, NDArray[np.int64]]:
+    """Flattens list-valued cells, e.g. the SPDI lists of a sequence design, into CSR-style values and offsets.
+
+    The list of cell `i` is `values[offsets[i] : offsets[i + 1]]`. Scalars count as lists with one item and missing values
+    as empty lists.
+
+    Args:
+        lists (Any): Iterable of lists, scalars or missing values.
+
+    Returns:
+        The values of all lists concatenated and the `len(lists) + 1` offsets into them.
+    """  # noqa: E501
+    cells = [cell if isinstance(cell, (list, tuple, np.ndarray)) else ([] if pd.isna(cell) else [cell]) for cell in lists]
+    lengths = np.fromiter((len(cell) for cell in cells), dtype=np.int64, count=len(cells))
+    values = np.asarray([value for cell in cells for value in cell])
+    return values, np.concatenate(([0], np.cumsum(lengths)))
+
+
+def _expand_offsets(starts: NDArray[np.int64], lengths: NDArray[np.int64]) -> NDArray[np.int64]:
+    # positions of all items of the lists starting at `starts`, list by list
+    return np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+
+
+def _segment_zscore_outliers(
+    counts: NDArray | sp.spmatrix,
+    mask: NDArray[np.bool_],
+    codes: NDArray[np.integer],
+    n_segments: int,
+    times_zscore: float,
+) -> NDArray[np.bool_]:
+    """Flags counts deviating by more than `times_zscore` standard deviations from the mean of their segment.
+
+    Means and sample standard deviations (ddof=1) are computed per replicate and segment from the counts in `mask` with
+    two `np.bincount` passes, one for the sums and one for the squared deviations from the means. Standard deviations of
+    0 and of segments with a single count are replaced by 1. Replicates are processed one at a time, so only a few vectors
+    of the length of the barcodes are allocated besides the result.
+
+    Args:
+        counts (NDArray | scipy.sparse.spmatrix): Counts (replicates x barcodes).
+        mask (NDArray[np.bool_]): Counts included in the statistics (barcodes x replicates). Other counts are never flagged.
+        codes (NDArray[np.integer]): Segment code of each barcode. Barcodes with negative codes are never flagged.
+        n_segments (int): Number of segments.
+        times_zscore (float): Threshold of the absolute z-score.
+
+    Returns:
+        Boolean mask of the flagged counts (barcodes x replicates).
+    """
+    mask = np.asarray(mask, dtype=np.bool_)
+    codes = np.asarray(codes)
+    outliers = np.zeros(mask.shape, dtype=np.bool_)
+    for replicate in range(counts.shape[0]):
+        included = np.flatnonzero(mask[:, replicate] & (codes >= 0))
+        segments = codes[included]
+        values = as_dense_array(counts[replicate]).ravel()[included].astype(np.float64)
+
+        n_values = np.bincount(segments, minlength=n_segments)
+        means = np.bincount(segments, weights=values, minlength=n_segments) / np.maximum(n_values, 1)
+        deviations = values - means[segments]
+        variances = np.bincount(segments, weights=deviations**2, minlength=n_segments) / np.maximum(n_values - 1, 1)
+        stds = np.sqrt(variances)
+        stds[stds == 0] = 1
+        outliers[included, replicate] = np.abs(deviations) / stds[segments] > times_zscore
+    return outliers
+
+
+def _segment_medians(values: NDArray[np.floating], codes: NDArray[np.integer], n_segments: int) -> NDArray[np.float64]:
+    """Computes the median of the values of each segment with one sort of all values.
+
+    The median of an even number of values is the mean of the two middle values, like in pandas. Empty segments get NaN.
+    """
+    counts = np.bincount(codes, minlength=n_segments)
+    starts = np.cumsum(counts) - counts
+    # sorting by value and then stably by code is faster than a lexsort of both keys
+    order = np.argsort(values)
+    sorted_values = values[order[np.argsort(codes[order], kind="stable")]]
+    medians = np.full(n_segments, np.nan)
+    filled = counts > 0
+    lower = sorted_values[(starts + (counts - 1) // 2)[filled]]
+    upper = sorted_values[(starts + counts // 2)[filled]]
+    medians[filled] = (lower + upper) / 2
+    return medians
+
+
+# barcodes per block of the dense Gram product, few enough that float32 sums of 0/1 values are exact (< 2**24)
+_GRAM_CHUNK_SIZE = 1 << 20
+
+
+def _gram_chunks(n_columns: int) -> list[slice]:
+    return [slice(start, start + _GRAM_CHUNK_SIZE) for start in range(0, n_columns, _GRAM_CHUNK_SIZE)]
+
+
+def _observed_gram(observed: NDArray[np.bool_] | sp.spmatrix) -> NDArray[np.int64]:
+    """Counts the barcodes observed in both replicates of every replicate pair, `observed @ observed.T`.
+
+    The product is computed block by block with dense float32 matrix products, also for sparse matrices.
+    """
+    if sp.issparse(observed):
+        # column blocks of CSC matrices are sliced without scanning all entries
+        observed = sp.csc_matrix(observed)
+    gram = np.zeros((observed.shape[0], observed.shape[0]), dtype=np.int64)
+    for columns in _gram_chunks(observed.shape[1]):
+        block = as_dense_array(observed[:, columns]).astype(np.float32)
+        gram += np.rint(block @ block.T).astype(np.int64)
+    return gram
+
+
+def _complexity_estimates(n_observed: NDArray, recaptures: NDArray[np.int64], method: str) -> NDArray[np.int64]:
+    # Lincoln-Peterson or Chapman estimate of every replicate pair from the observed barcodes and their recaptures
+    n_observed = np.asarray(n_observed, dtype=np.int64)
+    if method == "lincoln":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            estimates = np.where(recaptures > 0, np.multiply.outer(n_observed, n_observed) / recaptures, 0.0)
+    else:
+        estimates = np.multiply.outer(n_observed + 1, n_observed + 1) / (recaptures + 1) - 1
+    return np.floor(estimates).astype(np.int64)
+
+
+def _pack_filter(mask: NDArray[np.bool_]) -> NDArray[np.uint8]:
+    # one bit per replicate, every barcode is a row of ceil(n_replicates / 8) bytes
+    return np.packbits(np.asarray(mask, dtype=np.bool_), axis=1)
+
+
+def _filter_bits(packed: NDArray[np.uint8], barcodes: Any, replicates: Any) -> NDArray[np.bool_]:
+    # looks up single bits of a packed filter without unpacking it; packbits uses big endian bit order
+    replicates = np.asarray(replicates)
+    return ((packed[barcodes, replicates >> 3] >> (7 - (replicates & 7))) & 1).astype(np.bool_)
+
+
+def _freeze(value: Any) -> None:
+    # cached derived matrices are shared between callers, so they must not be changed in place
+    if sp.issparse(value):
+        value.data.flags.writeable = False
+    elif isinstance(value, np.ndarray):
+        value.flags.writeable = False
+
+
+def _read_only_view(counts: NDArray | sp.csr_matrix) -> NDArray | sp.csr_matrix:
+    # the view can be frozen by _freeze without making the layer itself read-only
+    if sp.issparse(counts):
+        counts = counts.tocsr()
+        return sp.csr_matrix((counts.data.view(), counts.indices, counts.indptr), shape=counts.shape, copy=False)
+    view = np.asarray(counts).view()
+    view.flags.writeable = False
+    return view
+
+
+def _same_dependencies(cached: tuple, current: tuple) -> bool:
+    # layers and the var filter are compared by identity, scalar settings by value
+    return all(a is b or (np.isscalar(a) and np.isscalar(b) and a == b) for a, b in zip(cached, current))
+
+
+def sample_counts(
+    counts: NDArray[np.integer],
+    rng: np.random.Generator,
+    proportion: float | None = None,
+    total: int | None = None,
+    size: int | None = None,
+) -> NDArray[np.int32]:
+    """Downsamples counts by binomial thinning and exact multivariate-hypergeometric sampling.
+
+    Each count is first thinned by a binomial draw with success probability `proportion`. If `total` is set, exactly `total` of the remaining counts are then drawn without replacement, treating all entries of `counts` as one urn (all counts are kept if there are not more than `total`). Use one call per replicate for replicate-wise totals.
+
+    Args:
+        counts (NDArray[np.integer]): Non-negative integer counts of arbitrary shape.
+        rng (np.random.Generator): Random number generator used for all draws.
+        proportion (float | None, optional): Probability to keep a single count. Defaults to None (no thinning).
+        total (int | None, optional): Number of counts to keep. Defaults to None (no downsampling).
+        size (int | None, optional): Number of independent sampling draws, e.g. for saturation analyses. If set, the draws are stacked along a new first axis. Defaults to None (one draw without an extra axis).
+
+    Returns:
+        The sampled counts with the shape of `counts`, or `(size, *counts.shape)` if `size` is set.
+    """  # noqa: E501
+    counts = np.asarray(counts)
+    flat_counts = counts.astype(np.int64).ravel()
+    n_draws = 1 if size is None else size
+
+    if proportion is not None:
+        sampled = rng.binomial(np.broadcast_to(flat_counts, (n_draws, flat_counts.size)), proportion)
+    else:
+        sampled = np.tile(flat_counts, (n_draws, 1))
+
+    if total is not None:
+        if proportion is None:
+            # all draws share the same urn, so they can be generated in one batch
+            if flat_counts.sum() > total:
+                sampled = _multivariate_hypergeometric(rng, flat_counts, total, n_draws)
+        else:
+            for i in np.flatnonzero(sampled.sum(axis=1) > total):
+                sampled[i] = _multivariate_hypergeometric(rng, sampled[i], total, 1)[0]
+
+    sampled = sampled.astype(np.int32).reshape((n_draws, *counts.shape))
+    return sampled if size is not None else sampled[0]
+
+
+def correlation_matrix(data: NDArray[np.floating], method: str = "pearson") -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+    """Computes the correlation and p-values between all rows of a matrix at once.
+
+    Missing values (NaN) are handled pairwise: the correlation of two rows only uses the columns observed in both, which gives the same result as :func:`scipy.stats.pearsonr` or :func:`scipy.stats.spearmanr` on the pairwise complete observations. P-values are two-sided and computed analytically from the t-distribution with `n - 2` degrees of freedom.
+
+    Args:
+        data (NDArray[np.floating]): Matrix with one series per row, e.g. replicates x oligos.
+        method (str, optional): Either "pearson" or "spearman". Defaults to "pearson".
+
+    Returns:
+        The symmetric correlation matrix and the matrix of p-values. Pairs with fewer than two common observations or constant values are NaN.
+    """  # noqa: E501
+    if method not in {"pearson", "spearman"}:
+        raise ValueError(f"Unsupported correlation method: {method}")
+
+    data = np.asarray(data, dtype=np.float64)
+    observed = ~np.isnan(data)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if method == "pearson":
+            correlation, n = _pearson_matrix(data, observed)
+        elif np.all(observed == observed[:1]):
+            # all rows share the same missing values, so ranks do not depend on the pair
+            ranks = np.full(data.shape, np.nan)
+            ranks[:, observed[0]] = rankdata(data[:, observed[0]], axis=1)
+            correlation, n = _pearson_matrix(ranks, observed)
+        else:
+            correlation, n = _pairwise_spearman_matrix(data, observed)
+
+        correlation = np.clip(correlation, -1.0, 1.0)
+        a = n / 2.0 - 1.0
+        pvalue = 2.0 * betainc(a, a, (1.0 - np.abs(correlation)) / 2.0)
+    # like scipy, two observations always correlate perfectly: pearsonr reports p = 1, spearmanr has no p-value
+    pvalue = np.where(n == 2, 1.0 if method == "pearson" else np.nan, np.minimum(pvalue, 1.0))
+    pvalue[np.isnan(correlation)] = np.nan
+    return correlation, pvalue
+
+
+def _pearson_matrix(data: NDArray[np.float64], observed: NDArray[np.bool_]) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+    # center every row first to avoid cancellation in the sums of squares
+    centered = np.where(observed, data - np.nanmean(data, axis=1, keepdims=True), 0.0)
+    observed = observed.astype(np.float64)
+
+    n = observed @ observed.T
+    sums = centered @ observed.T
+    squares = (centered**2) @ observed.T
+    covariance = centered @ centered.T - sums * sums.T / n
+    variance = squares - sums**2 / n
+    # constant values leave only rounding errors in the variance
+    variance[variance <= 1e-12 * squares] = np.nan
+    correlation = covariance / np.sqrt(variance * variance.T)
+    correlation[n < 2] = np.nan
+    return correlation, n
+
+
+def _pairwise_spearman_matrix(
+    data: NDArray[np.float64], observed: NDArray[np.bool_]
+) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+    num_rows = data.shape[0]
+    order = np.argsort(data, axis=1)
+    sorted_data = np.take_along_axis(data, order, axis=1)
+    sorted_observed = np.take_along_axis(observed, order, axis=1)
+    tie_starts = np.ones(data.shape, dtype=np.bool_)
+    tie_starts[:, 1:] = sorted_data[:, 1:] != sorted_data[:, :-1]
+
+    correlation = np.full((num_rows, num_rows), np.nan)
+    n = np.zeros((num_rows, num_rows))
+    for i in range(num_rows):
+        partners = slice(i, num_rows)
+        # ranks of row i within the observations shared with each partner row
+        ranks_i = np.empty((num_rows - i, data.shape[1]))
+        ranks_i[:, order[i]] = _average_ranks(
+            np.broadcast_to(tie_starts[i], ranks_i.shape), observed[partners][:, order[i]] & sorted_observed[i]
+        )
+        # ranks of each partner row within the observations shared with row i
+        ranks_partners = np.empty(ranks_i.shape)
+        np.put_along_axis(
+            ranks_partners,
+            order[partners],
+            _average_ranks(tie_starts[partners], sorted_observed[partners] & observed[i][order[partners]]),
+            axis=1,
+        )
+
+        shared = observed[partners] & observed[i]
+        n_shared = shared.sum(axis=1)
+        # the mean of average ranks of m observations is (m + 1) / 2
+        mean_rank = (n_shared[:, np.newaxis] + 1) / 2.0
+        x = np.where(shared, ranks_i - mean_rank, 0.0)
+        y = np.where(shared, ranks_partners - mean_rank, 0.0)
+        r = (x * y).sum(axis=1) / np.sqrt((x**2).sum(axis=1) * (y**2).sum(axis=1))
+        r[n_shared < 2] = np.nan
+
+        correlation[i, partners] = correlation[partners, i] = r
+        n[i, partners] = n[partners, i] = n_shared
+    return correlation, n
+
+
+def _average_ranks(tie_starts: NDArray[np.bool_], included: NDArray[np.bool_]) -> NDArray[np.float64]:
+    # Average ranks (like scipy.stats.rankdata) of the included values of each row. Both arguments are in sorted order
+    # of the values; tie_starts marks the first value of each group of ties. Excluded values get undefined ranks.
+    included_flat = included.ravel()
+    counts = np.cumsum(included, axis=1, dtype=np.int32).ravel()
+    starts = np.flatnonzero(tie_starts.ravel())
+    ends = np.append(starts[1:], counts.size) - 1
+    before = counts[starts] - included_flat[starts]
+    ranks = before + (counts[ends] - before + 1) / 2.0
+    return ranks[np.cumsum(tie_starts.ravel()) - 1].reshape(included.shape)
+
+
+_MAX_HYPERGEOMETRIC_POPULATION = 10**9
+
+
+def _multivariate_hypergeometric(
+    rng: np.random.Generator, colors: NDArray[np.int64], nsample: int, size: int
+) -> NDArray[np.int64]:
+    population = int(colors.sum())
+    if population < _MAX_HYPERGEOMETRIC_POPULATION:
+        return rng.multivariate_hypergeometric(colors, nsample, size=size)
+    # NumPy limits the urn to 1e9 items. Drawing the positions of the sampled items without replacement
+    # is exact as well and only needs memory in the order of nsample.
+    bounds = np.cumsum(colors)
+    return np.stack(
+        [
+            np.bincount(
+                np.searchsorted(bounds, rng.choice(population, size=nsample, replace=False, shuffle=False), side="right"),
+                minlength=colors.size,
+            )
+            for _ in range(size)
+        ]
+    )
+
+
 class Modality(Enum):
     """An enumeration representing different data modalities in MPRA (Massively Parallel Reporter Assay) experiments."""
 
@@ -80,6 +628,8 @@ class BarcodeFilter(Enum):
     """str: Filter barcodes with counts below a specified minimum."""
     MAX_COUNT = "MAX_COUNT"
     """str: Filter barcodes with counts above a specified maximum."""
+    MAD = "MAD"
+    """str: Filter barcodes by the median absolute deviation (MAD) of their DNA/RNA ratio within bins of RNA counts."""
 
     def __new__(cls, value):
         obj = object.__new__(cls)
@@ -105,6 +655,156 @@ class BarcodeFilter(Enum):
         raise ValueError(f"{value} is not a valid {cls.__name__}")
 
 
+class BarcodeFilterPipeline:
+    """Ordered barcode filters that are applied to barcode data in one scheduled pass.
+
+    Applying a pipeline results in the same var filter as calling :meth:`MPRABarcodeData.apply_barcode_filter` for every step in order. Filters reading only the raw counts (`MIN_COUNT`, `MAX_COUNT`, `MAD` and `RANDOM`) do not depend on the filters applied before them. Consecutive steps of these filters form one stage: they are evaluated together, their masks are merged into the var filter at once and their minimum and maximum count thresholds are fused into one comparison per modality. Other filters read filtered counts and are evaluated as their own stage after all earlier stages are applied. Intermediates not depending on the var filter, like the observed barcodes and the oligo codes, are cached by the barcode data and shared between the steps.
+
+    The steps are recorded in `uns["barcode_filter_pipeline"]`, one `{filter: params}` dictionary per step, and in `uns["var_filter"]`.
+
+    Args:
+        steps (list[tuple[BarcodeFilter, dict]] | None, optional): Filters and their parameters in order of application. Defaults to None (no steps).
+    """  # noqa: E501
+
+    _RAW_COUNT_FILTERS = frozenset({BarcodeFilter.MIN_COUNT, BarcodeFilter.MAX_COUNT, BarcodeFilter.MAD, BarcodeFilter.RANDOM})
+    _THRESHOLD_PARAMS = {
+        BarcodeFilter.MIN_COUNT: {"rna_min_count": ("rna", 0), "dna_min_count": ("dna", 0)},
+        BarcodeFilter.MAX_COUNT: {"rna_max_count": ("rna", 1), "dna_max_count": ("dna", 1)},
+    }
+
+    def __init__(self, steps: list[tuple[BarcodeFilter, dict]] | None = None):
+        self.steps: list[tuple[BarcodeFilter, dict]] = []
+        for barcode_filter, params in steps or []:
+            self.add(barcode_filter, params)
+
+    def add(self, barcode_filter: BarcodeFilter, params: dict | None = None) -> "BarcodeFilterPipeline":
+        """Appends a filter step.
+
+        Args:
+            barcode_filter (BarcodeFilter): The filter.
+            params (dict | None, optional): Parameters of the filter function. Defaults to None (default parameters).
+
+        Returns:
+            The pipeline, so that calls can be chained.
+        """
+        self.steps.append((barcode_filter, dict(params or {})))
+        return self
+
+    def schedule(self) -> list[list[tuple[BarcodeFilter, dict]]]:
+        """Groups the steps into stages that are evaluated together.
+
+        Returns:
+            The stages in order of evaluation, each a list of steps.
+        """
+        stages: list[list[tuple[BarcodeFilter, dict]]] = []
+        for step in self.steps:
+            if stages and step[0] in self._RAW_COUNT_FILTERS and stages[-1][0][0] in self._RAW_COUNT_FILTERS:
+                stages[-1].append(step)
+            else:
+                stages.append([step])
+        return stages
+
+    def _is_threshold(self, barcode_filter: BarcodeFilter, params: dict) -> bool:
+        # steps with other parameters are evaluated by their filter function, which rejects them
+        return barcode_filter in self._THRESHOLD_PARAMS and set(params) <= set(self._THRESHOLD_PARAMS[barcode_filter])
+
+    def apply(self, mpradata: "MPRABarcodeData") -> None:
+        """Applies all steps to barcode data and records the pipeline in its metadata.
+
+        Args:
+            mpradata (MPRABarcodeData): The barcode data. Its var filter is extended in place.
+        """
+        for stage in self.schedule():
+            mask = np.full((mpradata.n_vars, mpradata.n_obs), False)
+            ranges: dict[str, list[int | None]] = {"rna": [None, None], "dna": [None, None]}
+            for barcode_filter, params in stage:
+                if not self._is_threshold(barcode_filter, params):
+                    mask |= mpradata._barcode_filter(barcode_filter, params)
+                    continue
+                # a count is flagged below the largest minimum or above the smallest maximum
+                for name, value in params.items():
+                    modality, bound = self._THRESHOLD_PARAMS[barcode_filter][name]
+                    if value is not None:
+                        current = ranges[modality][bound]
+                        ranges[modality][bound] = value if current is None else (max if bound == 0 else min)(current, value)
+            if any(value is not None for bounds in ranges.values() for value in bounds):
+                mask |= mpradata._barcode_filter_count_range(tuple(ranges["rna"]), tuple(ranges["dna"]))
+            mpradata._union_var_filter(mask)
+
+        mpradata._add_metadata("var_filter", [barcode_filter.value for barcode_filter, _ in self.steps])
+        mpradata._add_metadata(
+            "barcode_filter_pipeline", [{barcode_filter.value: params} for barcode_filter, params in self.steps]
+        )
+
+
+class _BarcodeFilterSweep:
+    """Evaluates settings of one barcode filter against the oligo sums of the barcode data without changing its var filter."""
+
+    def __init__(self, mpradata: "MPRABarcodeData", barcode_filter: BarcodeFilter, params: dict):
+        self.mpradata = mpradata
+        self.barcode_filter = barcode_filter
+        self.params = params
+        self.base_filter = mpradata.var_filter
+        self.codes, oligos = mpradata._oligo_index()
+        self.n_oligos = len(oligos)
+        self.rna = segment_sum(mpradata.rna_counts, self.codes, self.n_oligos)
+        self.dna = segment_sum(mpradata.dna_counts, self.codes, self.n_oligos)
+        self.observed = mpradata._apply_var_filter(mpradata.observed)
+        self.barcode_counts = segment_sum(self.observed, self.codes, self.n_oligos)
+        self.var = mpradata._oligo_var()
+        self.pairs = list(itertools.combinations(range(mpradata.n_obs), 2))
+        self.columns = [f"pearson_{mpradata.obs_names[i]}_{mpradata.obs_names[j]}" for i, j in self.pairs]
+
+    def _correlations(self, rna: NDArray, dna: NDArray, barcode_counts: NDArray) -> dict[str, float]:
+        oligo_data = self.mpradata._aggregated_oligo_data(rna, dna, barcode_counts, self.var)
+        correlation = oligo_data.correlation("pearson", Modality.ACTIVITY)
+        return {column: float(correlation[i, j]) for column, (i, j) in zip(self.columns, self.pairs)}
+
+    def unfiltered(self) -> dict[str, Any]:
+        correlations = self._correlations(self.rna, self.dna, self.barcode_counts)
+        return {"barcodes_removed": 0, "observations_removed": 0, **correlations}
+
+    def evaluate(self, params: dict) -> dict[str, Any]:
+        mask = self.mpradata._barcode_filter(self.barcode_filter, {**self.params, **params})
+        # only observed barcodes newly flagged by the setting change the oligo sums
+        barcodes, replicates = np.nonzero(mask & ~self.base_filter)
+        observed_removed = _matrix_entries(self.observed, replicates, barcodes)
+        barcodes, replicates = barcodes[observed_removed], replicates[observed_removed]
+
+        codes = self.codes[barcodes]
+        in_oligo = codes >= 0
+        bins = replicates[in_oligo] * self.n_oligos + codes[in_oligo]
+
+        def removed_sums(counts: NDArray | sp.csr_matrix, sums: NDArray) -> NDArray:
+            values = _matrix_entries(counts, replicates[in_oligo], barcodes[in_oligo])
+            removed = np.bincount(bins, weights=values, minlength=len(sums.flat)).reshape(sums.shape)
+            return sums - removed.astype(sums.dtype)
+
+        return {
+            **params,
+            "barcodes_removed": len(np.unique(barcodes)),
+            "observations_removed": len(barcodes),
+            **self._correlations(
+                removed_sums(self.mpradata.rna_counts, self.rna),
+                removed_sums(self.mpradata.dna_counts, self.dna),
+                removed_sums(self.observed, self.barcode_counts),
+            ),
+        }
+
+
+_worker_sweep: _BarcodeFilterSweep | None = None
+
+
+def _init_sweep_worker(sweep: _BarcodeFilterSweep) -> None:
+    global _worker_sweep
+    _worker_sweep = sweep
+
+
+def _evaluate_sweep_in_worker(params: dict) -> dict[str, Any]:
+    assert _worker_sweep is not None
+    return _worker_sweep.evaluate(params)
+
+
 class MPRAData(ABC):
     """Abstract base class for handling MPRA (Massively Parallel Reporter Assay) data using AnnData objects.
 
@@ -118,6 +818,7 @@ class MPRAData(ABC):
         _SCALING (float): Default scaling factor for normalization.
         _PSEUDOCOUNT (int): Default pseudocount for normalization.
         _data (anndata.AnnData): The AnnData object containing MPRA data.
+        _derived (dict): Cache of derived count matrices with the dependencies they were computed from.
 
     Raises:
         ValueError: If required metadata (e.g., sequence design file) is not loaded.
@@ -150,8 +851,12 @@ class MPRAData(ABC):
         pass
 
     def __init__(self, data: ad.AnnData, barcode_threshold: int = 0):
+        self._derived: dict[str, tuple[tuple[str, ...], tuple, Any]] = {}
+        self._derived_hits = 0
+        self._derived_misses = 0
         self._data = data
-        self.var_filter = None
+        if not self._has_var_filter():
+            self.var_filter = None
         self.barcode_threshold = barcode_threshold
 
         # Initialize scaling and pseudo count metadata
@@ -199,6 +904,62 @@ class MPRAData(ABC):
     @data.setter
     def data(self, new_data: ad.AnnData) -> None:
         self._data = new_data
+        self.clear_derived_cache()
+
+    def _dependency(self, name: str) -> Any:
+        if name == "var_filter":
+            return self.data.varm["var_filter"]
+        if name in {"scaling", "pseudo_count"}:
+            return getattr(self, name)
+        if name == "sequence_design":
+            return self._sequence_design_metadata()
+        if name == "oligo":
+            # object columns are returned as new views of the same block, which is replaced with the column
+            values = self.data.var["oligo"].values
+            return values.base if isinstance(values, np.ndarray) and values.base is not None else values
+        return self.data.layers.get(name)
+
+    def _memoize(self, name: str, dependencies: tuple[str, ...], compute: Callable[[], Any]) -> Any:
+        """Returns a derived matrix from the cache or computes and caches it.
+
+        An entry is valid as long as the layers and settings it depends on are the same. Layers are compared by identity, so replacing a layer invalidates all entries computed from it.
+
+        Args:
+            name (str): Name of the derived matrix.
+            dependencies (tuple[str, ...]): Layers, `var_filter`, `scaling`, `pseudo_count`, `sequence_design` or `oligo` the
+                matrix is computed from.
+            compute (Callable[[], Any]): Computes the matrix on a cache miss.
+
+        Returns:
+            The derived matrix. It is read-only because it is shared with later calls.
+        """  # noqa: E501
+        entry = self._derived.get(name)
+        if entry is not None and _same_dependencies(entry[1], tuple(self._dependency(d) for d in dependencies)):
+            self._derived_hits += 1
+            return entry[2]
+
+        self._derived_misses += 1
+        value = compute()
+        _freeze(value)
+        # dependencies are read after computing because computing can create layers, e.g. normalized counts
+        self._derived[name] = (dependencies, tuple(self._dependency(d) for d in dependencies), value)
+        return value
+
+    def _invalidate_derived(self, *dependencies: str) -> None:
+        for name in [name for name, entry in self._derived.items() if not set(entry[0]).isdisjoint(dependencies)]:
+            del self._derived[name]
+
+    def clear_derived_cache(self) -> None:
+        """Removes all cached derived count matrices.
+
+        Derived matrices are invalidated automatically when layers, the var filter, scaling, pseudocount or the oligo column are replaced. Only in-place changes of layers or of the oligo column, e.g. `data.layers["rna"][0, 0] = 0` or `data.var.loc["barcode1", "oligo"] = "oligo2"`, require clearing the cache.
+        """  # noqa: E501
+        self._derived.clear()
+
+    @property
+    def derived_cache_info(self) -> dict[str, int]:
+        """dict[str, int]: Hits, misses and current number of entries of the cache of derived count matrices."""
+        return {"hits": self._derived_hits, "misses": self._derived_misses, "size": len(self._derived)}
 
     @property
     def var_names(self) -> pd.Index:
@@ -225,54 +986,115 @@ class MPRAData(ABC):
         """pd.Series: Returns the oligo names for each variable in the dataset."""
         return self.data.var["oligo"]
 
+    def _oligo_index(self) -> tuple[NDArray[np.intp], pd.Index]:
+        """Returns the integer oligo code of each barcode and the oligo names of the codes, both in order of first appearance."""  # noqa: E501
+        return self._memoize("oligo_index", ("oligo",), self._compute_oligo_index)
+
+    def _compute_oligo_index(self) -> tuple[NDArray[np.intp], pd.Index]:
+        codes, oligos = pd.factorize(self.oligos)
+        codes.flags.writeable = False
+        return codes, pd.Index(np.asarray(oligos))
+
+    @property
+    def is_sparse(self) -> bool:
+        """bool: Whether the count layers are stored as sparse (CSR) matrices. Count properties then return sparse matrices."""  # noqa: E501
+        return sp.issparse(self.data.layers["rna"])
+
+    def _layer(self, layer_name: str) -> NDArray | sp.csr_matrix:
+        layer = self.data.layers[layer_name]
+        if sp.issparse(layer):
+            return layer.tocsr()
+        return np.asarray(layer)
+
+    def _apply_var_filter(self, counts: NDArray | sp.csr_matrix) -> NDArray | sp.csr_matrix:
+        packed = self._packed_var_filter()
+        if not packed.any():
+            # a read-only view instead of a copy, so that the unfiltered layer is not held twice in memory
+            return _read_only_view(counts)
+        if sp.issparse(counts):
+            # only touch stored entries, the filter bits are looked up at their positions
+            counts = counts.tocsr(copy=True)
+            rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+            counts.data[_filter_bits(packed, counts.indices, rows)] = 0
+            counts.eliminate_zeros()
+            return counts
+        # one replicate at a time, so the filter is never expanded to a full boolean matrix
+        filtered = np.empty(counts.shape, dtype=np.result_type(counts.dtype, np.bool_))
+        for replicate in range(counts.shape[0]):
+            np.multiply(counts[replicate], ~_filter_bits(packed, slice(None), replicate), out=filtered[replicate])
+        return filtered
+
     @property
     def raw_rna_counts(self) -> NDArray[np.int32]:
         """NDArray[np.int32]: Returns the raw RNA counts from the dataset."""
-        return np.asarray(self.data.layers["rna"])
+        return self._layer("rna")
 
     @property
     def normalized_dna_counts(self) -> NDArray[np.float32]:
         """NDArray[np.float32]: Returns the normalized DNA counts from the dataset, applying the variable filter if present."""
-        if "dna_normalized" not in self.data.layers:
-            self._normalize()
-        return np.asarray(self.data.layers["dna_normalized"]) * ~self.var_filter.T
+        return self._memoize(
+            "normalized_dna_counts",
+            ("dna_normalized", "var_filter", "scaling", "pseudo_count"),
+            lambda: self._apply_var_filter(self._normalized_layer("dna_normalized")),
+        )
 
     @property
     def rna_counts(self) -> NDArray[np.int32]:
         """NDArray[np.int32]: Returns the raw RNA or, if present, sampled RNA counts, applying the variable filter if present."""  # noqa: E501
-        if "rna_sampling" in self.data.layers:
-            return np.asarray(self.data.layers["rna_sampling"]) * ~self.var_filter.T
-        else:
-            return self.raw_rna_counts * ~self.var_filter.T
+        return self._memoize(
+            "rna_counts",
+            ("rna", "rna_sampling", "var_filter"),
+            lambda: self._apply_var_filter(self._counts_layer("rna")),
+        )
+
+    def _counts_layer(self, modality: str) -> NDArray[np.int32] | sp.csr_matrix:
+        # sampled counts replace the raw counts when present
+        if f"{modality}_sampling" in self.data.layers:
+            return self._layer(f"{modality}_sampling")
+        return self._layer(modality)
 
     @property
     def raw_dna_counts(self) -> NDArray[np.int32]:
         """NDArray[np.int32]: Returns the raw DNA counts from the dataset."""
-        return np.asarray(self.data.layers["dna"])
+        return self._layer("dna")
 
     @property
     def dna_counts(self) -> NDArray[np.int32]:
         """NDArray[np.int32]: Returns the raw DNA or, if present, sampled DNA counts, applying the variable filter if present."""  # noqa: E501
-        if "dna_sampling" in self.data.layers:
-            return np.asarray(self.data.layers["dna_sampling"]) * ~self.var_filter.T
-        else:
-            return self.raw_dna_counts * ~self.var_filter.T
+        return self._memoize(
+            "dna_counts",
+            ("dna", "dna_sampling", "var_filter"),
+            lambda: self._apply_var_filter(self._counts_layer("dna")),
+        )
 
     @property
     def normalized_rna_counts(self) -> NDArray[np.float32]:
         """NDArray[np.float32]: Returns the normalized RNA counts from the dataset, applying the variable filter if present."""
-        if "rna_normalized" not in self.data.layers:
+        return self._memoize(
+            "normalized_rna_counts",
+            ("rna_normalized", "var_filter", "scaling", "pseudo_count"),
+            lambda: self._apply_var_filter(self._normalized_layer("rna_normalized")),
+        )
+
+    def _normalized_layer(self, layer_name: str) -> NDArray[np.float32] | sp.csr_matrix:
+        if layer_name not in self.data.layers:
             self._normalize()
-        return np.asarray(self.data.layers["rna_normalized"]) * ~self.var_filter.T
+        return self._layer(layer_name)
 
     @property
     def activity(self) -> NDArray[np.float32]:
         """NDArray[np.float32]: Returns the activity values calculated from normalized RNA and DNA counts, applying the variable filter if present."""  # noqa: E501
+        return self._memoize("activity", ("activity", "var_filter", "scaling", "pseudo_count"), self._filtered_activity)
+
+    def _filtered_activity(self) -> NDArray[np.float32] | sp.csr_matrix:
         if "activity" not in self.data.layers:
             self._compute_activities()
-        return np.asarray(self.data.layers["activity"]) * ~self.var_filter.T
+        return self._apply_var_filter(self._layer("activity"))
 
     def _compute_activities(self) -> None:
+        if self.is_sparse:
+            self._compute_sparse_activities()
+            return
         ratio = np.divide(
             self.normalized_rna_counts,
             self.normalized_dna_counts,
@@ -283,14 +1105,29 @@ class MPRAData(ABC):
             log2ratio[np.isneginf(log2ratio)] = np.nan
         self.data.layers["activity"] = log2ratio
 
+    def _compute_sparse_activities(self) -> None:
+        normalized_rna_counts = self.normalized_rna_counts
+        normalized_dna_counts = self.normalized_dna_counts
+
+        # activities are only stored where normalized DNA counts are present
+        rows, cols = normalized_dna_counts.nonzero()
+        rna = np.asarray(normalized_rna_counts[rows, cols]).ravel()
+        dna = np.asarray(normalized_dna_counts[rows, cols]).ravel()
+        with np.errstate(divide="ignore"):
+            log2ratio = np.log2(rna / dna)
+            log2ratio[np.isneginf(log2ratio)] = np.nan
+        self.data.layers["activity"] = sp.csr_matrix(
+            (log2ratio.astype(np.float32), (rows, cols)), shape=normalized_dna_counts.shape
+        )
+
     @property
     def total_dna_counts(self) -> NDArray[np.int32]:
         """NDArray[np.int32]: Returns the total DNA counts for each replicate. Usually it are the total raw counts per replicate. Only when sampled data is availabe it returns the sampled counts."""  # noqa: E501
         if "dna_counts" not in self.data.obs:
             if "dna_sampling" in self.data.layers:
-                self.data.obs["dna_counts"] = np.sum(np.asarray(self.data.layers["dna_sampling"]), axis=1)
+                self.data.obs["dna_counts"] = _row_sums(self._layer("dna_sampling"))
             else:
-                self.data.obs["dna_counts"] = np.sum(self.raw_dna_counts, axis=1)
+                self.data.obs["dna_counts"] = _row_sums(self.raw_dna_counts)
         return np.asarray(self.data.obs["dna_counts"])
 
     @property
@@ -298,9 +1135,9 @@ class MPRAData(ABC):
         """NDArray[np.int32]: Returns the total RNA counts for each replicate. Usually it are the total raw counts per replicate. Only when sampled data is availabe it returns the sampled counts."""  # noqa: E501
         if "rna_counts" not in self.data.obs:
             if "rna_sampling" in self.data.layers:
-                self.data.obs["rna_counts"] = np.sum(np.asarray(self.data.layers["rna_sampling"]), axis=1)
+                self.data.obs["rna_counts"] = _row_sums(self._layer("rna_sampling"))
             else:
-                self.data.obs["rna_counts"] = np.sum(self.raw_rna_counts, axis=1)
+                self.data.obs["rna_counts"] = _row_sums(self.raw_rna_counts)
         return np.asarray(self.data.obs["rna_counts"])
 
     def drop_total_counts(self) -> None:
@@ -316,31 +1153,50 @@ class MPRAData(ABC):
     def observed(self) -> NDArray[np.bool_]:
         """:class:`NDArray[np.bool_]`: Returns a boolean NumPy array indicating which barcodes (observations) have non-zero counts in either DNA or RNA. Uses sampled counts when available. otherwise raw counts"""  # noqa: E501
 
-        if "dna_sampling" in self.data.layers:
-            dna_counts = np.asarray(self.data.layers["dna_sampling"])
-        else:
-            dna_counts = self.raw_dna_counts
-        if "rna_sampling" in self.data.layers:
-            rna_counts = np.asarray(self.data.layers["rna_sampling"])
-        else:
-            rna_counts = self.raw_rna_counts
-
-        return (dna_counts + rna_counts) > 0
+        return self._memoize(
+            "observed",
+            ("dna", "dna_sampling", "rna", "rna_sampling"),
+            lambda: (self._counts_layer("dna") + self._counts_layer("rna")) > 0,
+        )
 
     @property
     def var_filter(self) -> NDArray[np.bool_]:
-        """:class:`NDArray[np.bool_]`: Returns a boolean NumPy array indicating which variables (samples) are filtered out."""
+        """:class:`NDArray[np.bool_]`: Returns a boolean NumPy array (barcodes x replicates) indicating which variables (samples) are filtered out.
 
-        return np.asarray(self.data.varm["var_filter"], dtype=np.bool_)
+        The filter is stored bit-packed in `varm["var_filter"]`, one bit per replicate, and expanded on access.
+        """  # noqa: E501
+
+        return np.unpackbits(self._packed_var_filter(), axis=1, count=self.n_obs).view(np.bool_)
 
     @var_filter.setter
     def var_filter(self, new_data: NDArray[np.bool_] | None) -> None:
         if new_data is None:
-            self.data.varm["var_filter"] = np.full((self.data.n_vars, self.data.n_obs), False)
+            self.data.varm["var_filter"] = np.zeros((self.data.n_vars, (self.data.n_obs + 7) // 8), dtype=np.uint8)
             if "var_filter" in self.data.uns:
                 del self.data.uns["var_filter"]
         else:
-            self.data.varm["var_filter"] = new_data
+            self.data.varm["var_filter"] = _pack_filter(new_data)
+        self._invalidate_derived("var_filter")
+
+    def _packed_var_filter(self) -> NDArray[np.uint8]:
+        var_filter = np.asarray(self.data.varm["var_filter"])
+        if var_filter.dtype == np.bool_:
+            # unpacked filter, e.g. set directly in AnnData
+            return _pack_filter(var_filter)
+        return var_filter
+
+    def _has_var_filter(self) -> bool:
+        # a stored filter is kept, e.g. when reading a written h5ad file, if it fits the data
+        if "var_filter" not in self.data.varm:
+            return False
+        var_filter = np.asarray(self.data.varm["var_filter"])
+        if var_filter.dtype == np.bool_:
+            return var_filter.shape == (self.n_vars, self.n_obs)
+        return var_filter.dtype == np.uint8 and var_filter.shape == (self.n_vars, (self.n_obs + 7) // 8)
+
+    def _union_var_filter(self, mask: NDArray[np.bool_]) -> None:
+        self.data.varm["var_filter"] = self._packed_var_filter() | _pack_filter(mask)
+        self._invalidate_derived("var_filter")
 
     @property
     @abstractmethod
@@ -378,59 +1234,104 @@ class MPRAData(ABC):
 
     @property
     def variant_map(self) -> pd.DataFrame:
-        """pd.DataFrame: Returns a DataFrame mapping SPDI IDs to alleles and oligos.
+        """pd.DataFrame: Returns a DataFrame mapping SPDI IDs to the lists of their REF and ALT oligos.
+
+        The grouped view of :attr:`variant_table`, cached until another sequence design is added.
 
         Raises:
             ValueError: If the sequence design file is not loaded in the metadata.
         """
+        return self._memoize("variant_map", ("sequence_design",), lambda: variant_oligo_lists(self.variant_table, self.oligos))
+
+    @property
+    def variant_table(self) -> pd.DataFrame:
+        """pd.DataFrame: Returns the long table of the variant map with one row per REF or ALT column of a variant.
+
+        See :func:`build_variant_table`; `oligo_code` is the column in the data. The table is built once and cached until
+        another sequence design is added, so all consumers share it.
+
+        Raises:
+            ValueError: If the sequence design file is not loaded in the metadata.
+        """  # noqa: E501
         if not self._get_metadata("sequence_design_file") and not (
             isinstance(self, MPRAOligoData) and self._get_metadata("MPRABarcodeData_sequence_design_file")
         ):
             raise ValueError("Sequence design file not loaded.")
 
-        oligos = self.data.var["oligo"].repeat(self.data.var["SPDI"].apply(len).tolist())
+        return self._memoize("variant_table", ("sequence_design",), self._build_variant_table)
 
-        spdis = np.concatenate(self.data.var["SPDI"].values)
+    def _build_variant_table(self) -> pd.DataFrame:
+        spdis, columns = self._sequence_design_items("SPDI")
+        alleles, _ = self._sequence_design_items("allele")
+        return build_variant_table(spdis, alleles, columns)
 
-        alleles = np.concatenate(self.data.var["allele"].values)
+    def _sequence_design_metadata(self) -> dict | None:
+        lists = self._get_metadata("sequence_design_lists")
+        if lists is None:
+            lists = self._get_metadata("MPRABarcodeData_sequence_design_lists")
+        return lists
 
-        df = pd.DataFrame({"ID": spdis, "allele": alleles, "oligo": oligos})
-        df["REF"] = np.where(
-            df["allele"] == "ref",
-            df["oligo"],
-            np.full(len(df["allele"]), pd.NA, dtype=object),
-        )
-        df["ALT"] = np.where(
-            df["allele"] == "alt",
-            df["oligo"],
-            np.full(len(df["allele"]), pd.NA, dtype=object),
-        )
-        df = df.groupby("ID").agg(
-            {
-                "REF": lambda x: [val for val in x if pd.notna(val)],
-                "ALT": lambda x: [val for val in x if pd.notna(val)],
-            }
+    def _sequence_design_lists(self, column: str) -> tuple[NDArray, NDArray[np.int64], NDArray[np.int64]]:
+        lists = self._sequence_design_metadata()
+        if lists is None:
+            raise ValueError("Sequence design file not loaded.")
+
+        offsets = np.asarray(lists[column]["offsets"])
+        rows = self.data.var["design_row"].to_numpy()
+        return np.asarray(lists[column]["values"]), offsets[rows], offsets[rows + 1] - offsets[rows]
+
+    def _sequence_design_items(self, column: str) -> tuple[NDArray, NDArray[np.int64]]:
+        # all list items of a sequence design column together with the column of the data they belong to
+        values, starts, lengths = self._sequence_design_lists(column)
+        return values[_expand_offsets(starts, lengths)], np.repeat(np.arange(self.n_vars), lengths)
+
+    def sequence_design_list(self, column: str) -> pd.Series:
+        """Materializes a list column of the sequence design, e.g. `SPDI` or `allele`, for all columns of the data.
+
+        The lists are stored flat with offsets (see :func:`flatten_lists`), so this builds Python lists and is only meant for
+        inspection or small subsets.
+
+        Args:
+            column (str): One of `variant_class`, `variant_pos`, `SPDI` or `allele`.
+
+        Returns:
+            Series of lists indexed by the var names.
+
+        Raises:
+            ValueError: If the sequence design file is not loaded.
+        """  # noqa: E501
+        values, starts, lengths = self._sequence_design_lists(column)
+        items = values.tolist()
+        ends = starts + lengths
+        return pd.Series(
+            [items[start:end] for start, end in zip(starts.tolist(), ends.tolist())],
+            index=self.var_names,
+            dtype=object,
         )
-        df = df[(df["REF"].apply(len) >= 1) & (df["ALT"].apply(len) >= 1)]
 
-        return df
+    def sequence_design_contains(self, column: str, value: Any) -> NDArray[np.bool_]:
+        """Tests which columns of the data list a value in a list column of the sequence design.
+
+        Args:
+            column (str): One of `variant_class`, `variant_pos`, `SPDI` or `allele`.
+            value (Any): The value to look for, e.g. `"ref"` in the `allele` column.
+
+        Returns:
+            Boolean array with one entry per column of the data.
+
+        Raises:
+            ValueError: If the sequence design file is not loaded.
+        """
+        items, columns = self._sequence_design_items(column)
+        return np.bincount(columns[items == value], minlength=self.n_vars) > 0
 
     def _normalize(self) -> None:
         self.drop_normalized()
 
         self.LOGGER.info("Normalizing data")
 
-        if "dna_sampling" in self.data.layers:
-            dna_counts = np.asarray(self.data.layers["dna_sampling"])
-        else:
-            dna_counts = self.raw_dna_counts
-        if "rna_sampling" in self.data.layers:
-            rna_counts = np.asarray(self.data.layers["rna_sampling"])
-        else:
-            rna_counts = self.raw_rna_counts
-
-        self.data.layers["dna_normalized"] = self._normalize_layer(dna_counts, self.total_dna_counts)
-        self.data.layers["rna_normalized"] = self._normalize_layer(rna_counts, self.total_rna_counts)
+        self.data.layers["dna_normalized"] = self._normalize_layer(self._counts_layer("dna"), self.total_dna_counts)
+        self.data.layers["rna_normalized"] = self._normalize_layer(self._counts_layer("rna"), self.total_rna_counts)
         self._add_metadata("normalized", True)
 
     @abstractmethod
@@ -452,6 +1353,7 @@ class MPRAData(ABC):
         self.data.layers.pop("rna_normalized", None)
         self.data.layers.pop("dna_normalized", None)
         self.data.layers.pop("activity", None)
+        self._invalidate_derived("rna_normalized", "dna_normalized", "activity")
         self._drop_correlation()
         self._add_metadata("normalized", False)
 
@@ -466,67 +1368,40 @@ class MPRAData(ABC):
             raise ValueError(f"Unsupported correlation method: {method}")
 
         if count_type == Modality.DNA_NORMALIZED:
-            filtered = self.normalized_dna_counts.copy()
+            values = as_dense_array(self.normalized_dna_counts)
             layer_name = str(count_type.value)
         elif count_type == Modality.RNA_NORMALIZED:
             layer_name = str(count_type.value)
-            filtered = self.normalized_rna_counts.copy()
+            values = as_dense_array(self.normalized_rna_counts)
         elif count_type == Modality.ACTIVITY:
-            filtered = self.activity.copy()
+            values = as_dense_array(self.activity)
             layer_name = str(count_type.value)
         else:
             raise ValueError(f"Unsupported count type: {count_type}")
 
-        filtered[self.barcode_counts < self.barcode_threshold] = np.nan
+        filtered = np.where(as_dense_array(self.barcode_counts) < self.barcode_threshold, np.nan, values)
 
         return self._correlation(method, filtered, layer_name)
 
     def _correlation(self, method: str, data: NDArray[np.float32], layer: str) -> NDArray[np.float32]:
-        if not self._get_metadata(f"correlation_{layer}"):
-            self._compute_correlation(data, layer)
+        if not self._get_metadata(f"correlation_{layer}") or f"{method}_correlation_{layer}" not in self.data.obsp:
+            self._compute_correlation(data, layer, [method])
         correlation = self.data.obsp[f"{method}_correlation_{layer}"]
         correlation = np.asarray(correlation, dtype=np.float32)
         return correlation
 
-    def _compute_correlation(self, data: NDArray[np.float32], layer) -> None:
+    def _compute_correlation(self, data: NDArray[np.float32], layer, methods: list[str] | None = None) -> None:
 
-        correlation_methods = ["pearson", "spearman"]
-
-        def compute_correlation(x, y, method: str) -> tuple:
-            if method == "spearman":
-                return spearmanr(x, y)
-            elif method == "pearson":
-                return pearsonr(x, y)
-            else:
-                raise ValueError(f"Unsupported correlation method: {method}")
+        if methods is None:
+            methods = ["pearson", "spearman"]
 
         # apply var filter to data
-        data[self.var_filter.T] = np.nan
-
-        num_columns = self.n_obs
-
-        correlations = {}
-        pvalues = {}
-        for method in correlation_methods:
-            correlations[method] = np.zeros((num_columns, num_columns), dtype=np.float32)
-            pvalues[method] = np.zeros((num_columns, num_columns), dtype=np.float32)
-
-        for i in range(num_columns):
-            for j in range(i, num_columns):
-                mask = ~np.isnan(data[i, :]) & ~np.isnan(data[j, :])
-                x = data[i, mask]
-                y = data[j, mask]
-
-                for method in correlation_methods:
-                    corr, pvalue = compute_correlation(x, y, method)
-                    correlations[method][i, j] = corr
-                    pvalues[method][i, j] = pvalue
-                    correlations[method][j, i] = corr
-                    pvalues[method][j, i] = pvalue
+        data = np.where(self.var_filter.T, np.nan, data)
 
-        for method in correlation_methods:
-            self.data.obsp[f"{method}_correlation_{layer}"] = correlations[method]
-            self.data.obsp[f"{method}_correlation_{layer}_pvalue"] = pvalues[method]
+        for method in methods:
+            correlation, pvalue = correlation_matrix(data, method)
+            self.data.obsp[f"{method}_correlation_{layer}"] = correlation.astype(np.float32)
+            self.data.obsp[f"{method}_correlation_{layer}_pvalue"] = pvalue.astype(np.float32)
 
         self._add_metadata(f"correlation_{layer}", True)
 
@@ -538,8 +1413,8 @@ class MPRAData(ABC):
 
                 self._add_metadata(f"correlation_{layer}", False)
                 for method in ["pearson", "spearman"]:
-                    del self.data.obsp[f"{method}_correlation_{layer}"]
-                    del self.data.obsp[f"{method}_correlation_{layer}_pvalue"]
+                    self.data.obsp.pop(f"{method}_correlation_{layer}", None)
+                    self.data.obsp.pop(f"{method}_correlation_{layer}_pvalue", None)
 
     def _add_metadata(self, key: str, value: Any) -> None:
         if isinstance(value, list):
@@ -559,6 +1434,10 @@ class MPRAData(ABC):
     def add_sequence_design(self, df_sequence_design: pd.DataFrame, sequence_design_file_path) -> None:
         """Add sequence design metadata to the object's data.
 
+        The list columns `variant_class`, `variant_pos`, `SPDI` and `allele` are not stored in `var` but flat with offsets per
+        oligo in `uns["sequence_design_lists"]`; `var["design_row"]` points to the oligo of each column. Use
+        :meth:`sequence_design_list` to get them as lists.
+
         Args:
             df_sequence_design (pd.DataFrame): DataFrame containing sequence design information, indexed by oligo identifiers.
             sequence_design_file_path (str): Path to the file from which the sequence design data was loaded to store it into the metadata.
@@ -573,10 +1452,16 @@ class MPRAData(ABC):
         self.data.var["start"] = df_matched_metadata["start"].values
         self.data.var["end"] = df_matched_metadata["end"].values
         self.data.var["strand"] = pd.Categorical(df_matched_metadata["strand"])
-        self.data.var["variant_class"] = df_matched_metadata["variant_class"].values
-        self.data.var["variant_pos"] = df_matched_metadata["variant_pos"].values
-        self.data.var["SPDI"] = df_matched_metadata["SPDI"].values
-        self.data.var["allele"] = df_matched_metadata["allele"].values
+
+        # the lists are flattened once per oligo instead of being copied to every barcode
+        design_rows, oligos = pd.factorize(self.oligos)
+        df_oligo_lists = df_sequence_design.loc[oligos]
+        self.data.var["design_row"] = design_rows
+        sequence_design_lists = {}
+        for column in ["variant_class", "variant_pos", "SPDI", "allele"]:
+            values, offsets = flatten_lists(df_oligo_lists[column])
+            sequence_design_lists[column] = {"values": values, "offsets": offsets}
+        self.data.uns["sequence_design_lists"] = sequence_design_lists
 
         self._add_metadata("sequence_design_file", sequence_design_file_path)
 
@@ -615,17 +1500,29 @@ class MPRABarcodeData(MPRAData):
 
     @property
     def barcode_counts(self) -> NDArray[np.int32]:
+        """NDArray[np.int32]: Returns the barcode counts matrix, which is the number of observed barcodes of the oligo of each barcode. In sparse mode only observed barcodes carry a value."""  # noqa: E501
         if "barcode_counts" not in self.data.layers or self.data.layers["barcode_counts"] is None:
-            self.barcode_counts = (
-                pd.DataFrame(
-                    self.observed,  # FIXME make sure var_filter is applied correctly
-                    index=self.obs_names,
-                    columns=self.var_names,
-                )
-                .T.groupby(self.oligos, observed=True)
-                .transform("sum")
-            ).T.values
-        return np.asarray(self.data.layers["barcode_counts"], dtype=np.int32)
+            if self.is_sparse:
+                self.barcode_counts = self._sparse_barcode_counts()
+            else:
+                codes, oligos = self._oligo_index()
+                # FIXME make sure var_filter is applied correctly
+                self.barcode_counts = _broadcast_segments(segment_sum(self.observed, codes, len(oligos)), codes)
+        barcode_counts = self.data.layers["barcode_counts"]
+        if sp.issparse(barcode_counts):
+            return barcode_counts.tocsr().astype(np.int32)
+        return np.asarray(barcode_counts, dtype=np.int32)
+
+    def _sparse_barcode_counts(self) -> sp.csr_matrix:
+        observed = self.observed
+        codes, oligos = self._oligo_index()
+        oligo_barcode_counts = segment_sum(observed, codes, len(oligos))
+
+        rows, cols = observed.nonzero()
+        return sp.csr_matrix(
+            (_broadcast_segments(oligo_barcode_counts, codes)[rows, cols].astype(np.int32), (rows, cols)),
+            shape=observed.shape,
+        )
 
     @barcode_counts.setter
     def barcode_counts(self, new_data: NDArray[np.int32]) -> None:
@@ -645,25 +1542,110 @@ class MPRABarcodeData(MPRAData):
         return self._oligo_data()
 
     @classmethod
-    def from_file(cls, file_path: str) -> "MPRABarcodeData":
+    def from_file(
+        cls,
+        file_path: str,
+        sparse: bool = False,
+        chunk_size: int = 100_000,
+        oligos: Iterable[str] | None = None,
+        category: str | list[str] | None = None,
+        region: str | None = None,
+        sequence_design: pd.DataFrame | None = None,
+    ) -> "MPRABarcodeData":
+        """Create an instance of the class from a reporter experiment barcode file.
+
+        The file is parsed in chunks of `chunk_size` rows, so only one chunk is held as a data frame at a time. Counts of each chunk are converted directly into int32 (or sparse) replicate blocks and the oligo names are encoded incrementally. Gzip and BGZF compressed files are supported.
+
+        Only the barcodes of a subset of oligos are loaded if `oligos`, `category` or `region` is given; a barcode is loaded if its oligo matches all of them. If an oligo index (see :func:`mpralib.utils.index.build_oligo_index`) of a BGZF compressed file exists, only the lines of the selected oligos are read. Otherwise the whole file is parsed and the other barcodes are dropped chunk by chunk.
+
+        Args:
+            file_path (str): Path to the reporter experiment barcode file.
+            sparse (bool, optional): Store the RNA and DNA count layers as sparse (CSR) matrices. Most barcodes are only seen in a subset of replicates, so this reduces the memory footprint of large libraries. Defaults to False.
+            chunk_size (int, optional): Number of rows parsed at once. Defaults to 100000.
+            oligos (Iterable[str] | None, optional): Names of the oligos to load. Defaults to None (all oligos).
+            category (str | list[str] | None, optional): Category or categories of the sequence design to load. Defaults to None.
+            region (str | None, optional): Genomic region `chr:start-end` of the sequence design to load. Defaults to None.
+            sequence_design (pd.DataFrame | None, optional): Sequence design to select `category` and `region` from. Defaults to None.
+
+        Returns:
+            An instance of MPRABarcodeData containing the processed data in an AnnData object.
 
-        data = pd.read_csv(file_path, sep="\t", header=0, index_col=0)
-        data = data.fillna(0)
+        Raises:
+            ValueError: If `category` or `region` is given without sequence design or no barcode matches the selection.
+        """  # noqa: E501
+
+        selected = None if oligos is None else pd.Index(oligos).astype(str)
+        if category is not None or region is not None:
+            if sequence_design is None:
+                raise ValueError("Selecting oligos by category or region requires a sequence design.")
+            design_oligos = select_oligos(sequence_design, category=category, region=region)
+            selected = design_oligos if selected is None else selected.intersection(design_oligos)
+
+        columns = pd.read_csv(file_path, sep="\t", header=0, nrows=0).columns
+        barcode_column, oligo_column, count_columns = columns[0], columns[1], columns[2:]
+        replicates = pd.Index([replicate.split("_")[2] for replicate in count_columns[1::2]])
+
+        # imported here because the index reads BGZF blocks with mpralib.utils.io, which imports this module
+        from mpralib.utils.index import OligoIndex
+
+        source: Any = file_path
+        oligo_index = OligoIndex.load(file_path) if selected is not None else None
+        if oligo_index is not None:
+            cls.LOGGER.info(f"Reading {len(selected)} oligos with the oligo index of {file_path}")
+            header = "\t".join(columns) + "\n"
+            source = io.BytesIO(header.encode() + b"".join(oligo_index.read_lines(file_path, selected)))
+
+        reader = pd.read_csv(
+            source,
+            sep="\t",
+            header=0,
+            index_col=0,
+            chunksize=chunk_size,
+            dtype={barcode_column: str, oligo_column: str, **{column: np.float64 for column in count_columns}},
+        )
+
+        barcodes, oligo_codes, rna_blocks, dna_blocks = [], [], [], []
+        oligo_categories: dict[str, int] = {}
+        with reader:
+            for chunk in reader:
+                if selected is not None:
+                    chunk = chunk[chunk[oligo_column].isin(selected)]
+                barcodes.append(chunk.index.to_numpy())
+
+                codes, uniques = pd.factorize(chunk[oligo_column])
+                # the trailing -1 keeps missing oligo names (code -1) as missing values
+                lookup = np.fromiter(
+                    (oligo_categories.setdefault(oligo, len(oligo_categories)) for oligo in uniques),
+                    dtype=np.int32,
+                    count=len(uniques),
+                )
+                oligo_codes.append(np.append(lookup, -1)[codes])
 
-        replicate_columns_rna = data.columns[2::2]
-        replicate_columns_dna = data.columns[1::2]
+                counts = np.nan_to_num(chunk[count_columns].to_numpy(), nan=0.0).astype(np.int32)
+                dna_blocks.append(counts[:, 0::2].T)
+                rna_blocks.append(counts[:, 1::2].T)
+                if sparse:
+                    dna_blocks[-1] = sp.csr_matrix(dna_blocks[-1])
+                    rna_blocks[-1] = sp.csr_matrix(rna_blocks[-1])
 
-        anndata_replicate_rna = data[replicate_columns_rna].transpose().astype(np.int32)
-        anndata_replicate_dna = data[replicate_columns_dna].transpose().astype(np.int32)
+        if selected is not None and not oligo_categories:
+            raise ValueError(f"No barcodes of the selected oligos in {file_path}.")
 
-        anndata_replicate_rna.index = pd.Index([replicate.split("_")[2] for replicate in replicate_columns_rna])
-        anndata_replicate_dna.index = pd.Index([replicate.split("_")[2] for replicate in replicate_columns_dna])
+        var = pd.DataFrame(index=pd.Index(np.concatenate(barcodes), name=barcode_column))
+        # categories stay in order of first appearance, so the codes directly index the oligo level
+        var["oligo"] = pd.Categorical.from_codes(np.concatenate(oligo_codes), categories=list(oligo_categories))
 
-        adata = ad.AnnData(anndata_replicate_rna)
-        adata.layers["rna"] = np.array(adata.X, dtype=np.int32)
-        adata.layers["dna"] = np.asarray(anndata_replicate_dna.values, dtype=np.int32)
+        if sparse:
+            rna = sp.hstack(rna_blocks, format="csr", dtype=np.int32)
+            dna = sp.hstack(dna_blocks, format="csr", dtype=np.int32)
+        else:
+            rna = np.concatenate(rna_blocks, axis=1)
+            dna = np.concatenate(dna_blocks, axis=1)
+        del rna_blocks, dna_blocks
 
-        adata.var["oligo"] = data["oligo_name"].astype("category")
+        adata = ad.AnnData(X=rna, obs=pd.DataFrame(index=replicates), var=var)
+        adata.layers["rna"] = rna
+        adata.layers["dna"] = dna
 
         adata.uns["file_path"] = file_path
         adata.uns["date"] = pd.to_datetime("today").strftime("%Y-%m-%d")
@@ -671,17 +1653,14 @@ class MPRABarcodeData(MPRAData):
         adata.uns["normalized"] = False
         adata.uns["barcode_threshold"] = None
 
-        adata.varm["var_filter"] = pd.DataFrame(
-            np.full((adata.n_vars, adata.n_obs), False),
-            index=adata.var_names,
-            columns=adata.obs_names,
-        )
-
+        # the empty var filter is added by the constructor
         return cls(adata)
 
     def complexity(self, method="lincoln") -> NDArray[np.int64]:
         """Calculates and returns the complexity of barcodes using the Lincoln-Peterson or Chapman estimation.
 
+        The recaptures of all replicate pairs are computed at once as the Gram matrix of the observed barcodes.
+
         Args:
             method (str): Either "lincoln" or "chapman".
 
@@ -692,22 +1671,57 @@ class MPRABarcodeData(MPRAData):
         if method not in {"lincoln", "chapman"}:
             raise ValueError("Method must be either 'lincoln' or 'chapman'.")
 
-        n_observed = np.sum(self.observed, axis=1)
-        num_rows = self.observed.shape[0]
-        results = np.zeros((num_rows, num_rows), dtype=np.int64)
-        for i in range(num_rows):
-            for j in range(i, num_rows):
-                n_recap = np.sum(np.sum(np.logical_and(self.observed[i, :], self.observed[j, :])))
-                if method == "lincoln":
-                    count = (n_observed[i] * n_observed[j]) / n_recap if n_recap > 0 else 0
-                elif method == "chapman":
-                    count = ((n_observed[i] + 1) * (n_observed[j] + 1) / (n_recap + 1)) - 1
+        observed = self.observed
+        return _complexity_estimates(_row_sums(observed), _observed_gram(observed), method)
 
-                count = int(np.floor(count))  # type: ignore
-                results[i, j] = count
-                results[j, i] = count  # symmetric
+    def complexity_curve(self, fractions: Any, method: str = "lincoln", seed: int | None = None) -> NDArray[np.int64]:
+        """Calculates complexity estimates of subsampled counts, e.g. to check the saturation of the library.
 
-        return results
+        For every fraction, each count is kept with that probability, so a barcode stays observed in a replicate with probability `1 - (1 - fraction) ** count`. One random number per barcode and replicate is shared by all fractions, so barcodes observed at a fraction are also observed at every larger fraction. A fraction of 1 gives the estimates of :meth:`complexity`.
+
+        Args:
+            fractions (Any): Fractions of the counts between 0 and 1.
+            method (str, optional): Either "lincoln" or "chapman". Defaults to "lincoln".
+            seed (int | None, optional): Seed of the random number generator. Defaults to None.
+
+        Returns:
+            The Lincoln-Peterson or Chapman estimates of all replicate pairs, one matrix per fraction, of shape `(len(fractions), n_obs, n_obs)`.
+        """  # noqa: E501
+
+        if method not in {"lincoln", "chapman"}:
+            raise ValueError("Method must be either 'lincoln' or 'chapman'.")
+        fractions = np.asarray(fractions, dtype=np.float64).reshape(-1)
+        if np.any((fractions < 0) | (fractions > 1)):
+            raise ValueError("Fractions must be between 0 and 1.")
+
+        rng = np.random.default_rng(seed)
+        # log1p(-1) is -inf, unobserved barcodes give nan and are never kept
+        with np.errstate(divide="ignore"):
+            log_missed = np.log1p(-fractions)
+        counts = self._counts_layer("dna") + self._counts_layer("rna")
+        n_observed = np.zeros((len(fractions), self.n_obs), dtype=np.int64)
+        recaptures = np.zeros((len(fractions), self.n_obs, self.n_obs), dtype=np.int64)
+        if sp.issparse(counts):
+            counts = sp.csr_matrix(counts)
+            counts.eliminate_zeros()
+            draws = rng.random(counts.nnz)
+            for i in range(len(fractions)):
+                with np.errstate(invalid="ignore"):
+                    kept = draws < -np.expm1(log_missed[i] * counts.data)
+                observed = sp.csr_matrix((kept, counts.indices, counts.indptr), shape=counts.shape)
+                n_observed[i] = _row_sums(observed)
+                recaptures[i] = _observed_gram(observed)
+        else:
+            for columns in _gram_chunks(counts.shape[1]):
+                chunk = np.asarray(counts[:, columns])
+                draws = rng.random(chunk.shape)
+                for i in range(len(fractions)):
+                    with np.errstate(invalid="ignore"):
+                        observed = draws < -np.expm1(log_missed[i] * chunk)
+                    n_observed[i] += observed.sum(axis=1)
+                    recaptures[i] += _observed_gram(observed)
+
+        return np.stack([_complexity_estimates(n_observed[i], recaptures[i], method) for i in range(len(fractions))])
 
     def _normalize_layer(
         self,
@@ -715,36 +1729,60 @@ class MPRABarcodeData(MPRAData):
         total_counts: NDArray[np.int32],
     ) -> NDArray[np.float32]:
 
+        observed = self.observed
+
         # I do a pseudo count when normalizing to avoid division by zero when computing logfold ratios.
         # barcode filter is already in the observed matrix
-        total_counts = total_counts + np.sum(self.pseudo_count * self.observed, axis=1)
+        total_counts = total_counts + self.pseudo_count * _row_sums(observed)
 
         # Avoid division by zero when pseudocount is set to 0
         total_counts[total_counts == 0] = 1
-        return (
-            ((counts + (self.pseudo_count * self.observed)) / total_counts[:, np.newaxis] * self.scaling) * self.observed
-        ).astype(np.float32)
+
+        if sp.issparse(counts):
+            # normalized counts are only stored for observed barcodes
+            rows, cols = observed.nonzero()
+            values = np.asarray(counts[rows, cols]).ravel()
+            values = (values + self.pseudo_count) / total_counts[rows] * self.scaling
+            return sp.csr_matrix((values.astype(np.float32), (rows, cols)), shape=counts.shape)
+
+        return (((counts + (self.pseudo_count * observed)) / total_counts[:, np.newaxis] * self.scaling) * observed).astype(
+            np.float32
+        )
 
     def _oligo_data(self) -> "MPRAOligoData":
 
-        # Convert the result back to an AnnData object
-        oligo_data = ad.AnnData(self._sum_counts_by_oligo(self.rna_counts))
+        codes, oligos = self._oligo_index()
+
+        return self._aggregated_oligo_data(
+            segment_sum(self.rna_counts, codes, len(oligos)),
+            segment_sum(self.dna_counts, codes, len(oligos)),
+            segment_sum(self._apply_var_filter(self.observed), codes, len(oligos)),
+            self._oligo_var(),
+        )
+
+    def _oligo_var(self) -> pd.DataFrame:
+        # Subset of vars using the first occurence of oligo name
+        indices = self.data.var["oligo"].dropna().drop_duplicates(keep="first").index
+        if isinstance(self.data.var, pd.DataFrame):
+            return self.data.var.loc[indices]
+        # Handle Dataset2D or other indexable types
+        return self.data.var[indices]
+
+    def _aggregated_oligo_data(
+        self, rna: NDArray[np.int64], dna: NDArray[np.int64], barcode_counts: NDArray[np.int64], var: pd.DataFrame
+    ) -> "MPRAOligoData":
+        # Convert the oligo sums back to an AnnData object
+        oligo_data = ad.AnnData(rna)
 
         oligo_data.layers["rna"] = np.array(oligo_data.X)
-        oligo_data.layers["dna"] = self._sum_counts_by_oligo(self.dna_counts)
+        oligo_data.layers["dna"] = dna
 
-        oligo_data.layers["barcode_counts"] = self._sum_counts_by_oligo(self.observed * ~self.var_filter.T)
+        oligo_data.layers["barcode_counts"] = barcode_counts
 
         oligo_data.obs_names = self.obs_names.tolist()
-        oligo_data.var_names = self.data.var["oligo"].unique().tolist()
+        oligo_data.var_names = self._oligo_index()[1].tolist()
 
-        # Subset of vars using the first occurence of oligo name
-        indices = self.data.var["oligo"].drop_duplicates(keep="first").index
-        if isinstance(self.data.var, pd.DataFrame):
-            oligo_data.var = self.data.var.loc[indices]
-        else:
-            # Handle Dataset2D or other indexable types
-            oligo_data.var = self.data.var[indices]
+        oligo_data.var = var
 
         oligo_data.obs = self.data.obs
 
@@ -759,23 +1797,16 @@ class MPRABarcodeData(MPRAData):
 
         return MPRAOligoData(oligo_data, self.barcode_threshold)
 
-    def _sum_counts_by_oligo(self, counts: NDArray) -> pd.DataFrame:
-
-        grouped = pd.DataFrame(
-            counts,
-            index=self.obs_names,
-            columns=self.var_names,
-        ).T.groupby(self.data.var["oligo"], observed=True)
-
-        # Perform an operation on each group, e.g., mean
-        return grouped.sum().T
-
     def _barcode_filter_min_bcs_per_oligo(self, threshold: int = 0) -> NDArray[np.bool_]:
 
         if threshold <= 0:
             return np.full((self.n_vars, self.n_obs), False, dtype=bool)
 
-        mask = (self.barcode_counts < threshold).T
+        # per-oligo counts broadcast to all barcodes of the oligo, so unobserved barcodes are flagged like in dense mode,
+        # where the sparse barcode counts would have no value for them
+        codes, oligos = self._oligo_index()
+        oligo_barcode_counts = segment_sum(self.observed, codes, len(oligos))
+        mask = (_broadcast_segments(oligo_barcode_counts, codes) < threshold).T
 
         return mask
 
@@ -794,19 +1825,17 @@ class MPRABarcodeData(MPRAData):
             Boolean mask indicating which barcodes pass the filtering criteria.
         """  # noqa: E501
 
-        barcode_mask = self.observed.T
+        observed = as_dense_array(self.observed)
+        barcode_mask = observed.T
 
         if apply_bc_threshold:
             if aggregated_bc_threshold:
-                aggregated_barcode_counts = (
-                    pd.DataFrame(self.observed.any(axis=0).reshape(-1, 1), index=self.var_names)
-                    .groupby(self.oligos, observed=True)
-                    .transform("sum")
-                    .values
-                )
+                codes, oligos = self._oligo_index()
+                observed_any = observed.any(axis=0)[np.newaxis, :]
+                aggregated_barcode_counts = _broadcast_segments(segment_sum(observed_any, codes, len(oligos)), codes).T
                 barcode_mask = barcode_mask * np.tile(aggregated_barcode_counts, (1, self.n_obs)) >= self.barcode_threshold
             else:
-                barcode_mask = barcode_mask * (self.barcode_counts.T >= self.barcode_threshold)
+                barcode_mask = barcode_mask * (as_dense_array(self.barcode_counts).T >= self.barcode_threshold)
 
         return barcode_mask
 
@@ -819,10 +1848,8 @@ class MPRABarcodeData(MPRAData):
 
         barcode_mask = self._get_barcode_mask_for_outlier_filtering(apply_bc_threshold, aggregated_bc_threshold)
 
-        df_rna = pd.DataFrame(self.rna_counts, index=self.obs_names, columns=self.var_names).T.where(barcode_mask)
-        mask = ((df_rna - df_rna.mean(axis=0)) / df_rna.std(axis=0)).abs() > times_zscore
-
-        return mask.values.astype(bool)
+        # all barcodes form one segment
+        return _segment_zscore_outliers(self.rna_counts, barcode_mask, np.zeros(self.n_vars, dtype=np.intp), 1, times_zscore)
 
     def _barcode_filter_oligo_specific_outliers(
         self,
@@ -833,11 +1860,8 @@ class MPRABarcodeData(MPRAData):
 
         barcode_mask = self._get_barcode_mask_for_outlier_filtering(apply_bc_threshold, aggregated_bc_threshold)
 
-        df_rna = pd.DataFrame(self.rna_counts, index=self.obs_names, columns=self.var_names).T.where(barcode_mask)
-        grouped = df_rna.groupby(self.oligos, observed=True)
-        mask = ((df_rna - grouped.transform("mean")) / grouped.transform("std").fillna(0).replace(0, 1)).abs() > times_zscore
-
-        return mask.values.astype(bool)
+        codes, oligos = self._oligo_index()
+        return _segment_zscore_outliers(self.rna_counts, barcode_mask, codes, len(oligos), times_zscore)
 
     def _barcode_filter_large_expression_outliers(
         self,
@@ -846,10 +1870,14 @@ class MPRABarcodeData(MPRAData):
         aggregated_bc_threshold: bool = False,
     ) -> NDArray[np.bool_]:
 
+        normalized_rna_sums = np.asarray(self.normalized_rna_counts.sum(axis=0)).ravel()
+        normalized_dna_sums = np.asarray(self.normalized_dna_counts.sum(axis=0)).ravel()
+        # barcodes without DNA counts get a ratio of 0, i.e. no log2 ratio
         ratio = np.divide(
-            self.normalized_rna_counts.sum(axis=0),
-            self.normalized_dna_counts.sum(axis=0),
-            where=self.normalized_dna_counts.sum(axis=0) != 0,
+            normalized_rna_sums,
+            normalized_dna_sums,
+            out=np.zeros(normalized_rna_sums.shape, dtype=np.result_type(normalized_rna_sums, normalized_dna_sums)),
+            where=normalized_dna_sums != 0,
         )
         with np.errstate(divide="ignore"):
             log2ratio = np.log2(ratio)
@@ -870,43 +1898,38 @@ class MPRABarcodeData(MPRAData):
         mask_array = np.tile(mask[:, np.newaxis], (1, self.n_obs))
         return mask_array
 
-    def _barcode_filter_mad(self, times_mad=3, n_bins=20) -> NDArray[np.bool_]:
+    def _barcode_filter_mad(self, times_mad: float = 3, n_bins: int = 20) -> NDArray[np.bool_]:
         # sum up DNA and RNA counts across replicates
-        DNA_sum = pd.DataFrame(self.raw_dna_counts, index=self.obs_names, columns=self.var_names).T.sum(axis=1)
-        RNA_sum = pd.DataFrame(self.raw_rna_counts, index=self.obs_names, columns=self.var_names).T.sum(axis=1)
-        df_sums = pd.DataFrame({"DNA_sum": DNA_sum, "RNA_sum": RNA_sum}).fillna(0)
-        # removing all barcodes with 0 counts in RNA and more DNA count than number of replicates/observations
-        df_sums = df_sums[(df_sums["DNA_sum"] > self.data.n_obs) & (df_sums["RNA_sum"] > 0)]
+        dna_sums = np.asarray(self.raw_dna_counts.sum(axis=0)).ravel()
+        rna_sums = np.asarray(self.raw_rna_counts.sum(axis=0)).ravel()
+        codes, oligos = self._oligo_index()
 
+        # removing all barcodes with 0 counts in RNA and not more DNA counts than number of replicates/observations
+        kept = (dna_sums > self.n_obs) & (rna_sums > 0) & (codes >= 0)
         # remove all barcodes where oligo has less barcodes as the number of replicates/observations
-        df_sums = df_sums.groupby(self.data.var["oligo"], observed=True).filter(lambda x: len(x) >= self.data.n_obs)
-
-        # Calculate ratio, ratio_med, ratio_diff, and mad
-        df_sums["ratio"] = np.log2(df_sums["DNA_sum"] / df_sums["RNA_sum"])
-        df_sums["ratio_med"] = df_sums.groupby(self.data.var["oligo"], observed=True)["ratio"].transform("median")
-        df_sums["ratio_diff"] = df_sums["ratio"] - df_sums["ratio_med"]
-        # df_sums['mad'] = (df_sums['ratio'] - df_sums['ratio_med']).abs().mean()
-
-        # Calculate quantiles within  n_bins
-        qs = np.unique(np.quantile(np.log10(df_sums["RNA_sum"]), np.arange(0, n_bins) / n_bins))
-
-        # Create bins based on rna_count
-        df_sums["bin"] = pd.cut(
-            np.log10(df_sums["RNA_sum"]),
-            bins=qs,
-            include_lowest=True,
-            labels=[str(i) for i in range(0, len(qs) - 1)],
-        )
-        # Filter based on ratio_diff and mad
-        df_sums["ratio_diff_med"] = df_sums.groupby("bin", observed=True)["ratio_diff"].transform("median")
-        df_sums["ratio_diff_med_dist"] = np.abs(df_sums["ratio_diff"] - df_sums["ratio_diff_med"])
-        df_sums["mad"] = df_sums.groupby("bin", observed=True)["ratio_diff_med_dist"].transform("median")
-
-        m = df_sums.ratio_diff > times_mad * df_sums.mad
-        df_sums = df_sums[~m]
-
-        var_filter_df = pd.DataFrame(self.var_filter, index=self.var_names, columns=self.obs_names)
-        return var_filter_df.apply(lambda col: col | ~var_filter_df.index.isin(df_sums.index)).values
+        kept &= np.bincount(codes[kept], minlength=len(oligos))[codes] >= self.n_obs
+        barcodes = np.flatnonzero(kept)
+        outliers = np.ones(self.n_vars, dtype=np.bool_)
+        if len(barcodes) > 0:
+            codes = codes[barcodes]
+            ratio = np.log2(dna_sums[barcodes] / rna_sums[barcodes])
+            ratio_diff = ratio - _segment_medians(ratio, codes, len(oligos))[codes]
+
+            # bins between the quantiles of the log10 RNA counts, closed on the right and the first one also on the left
+            log_rna = np.log10(rna_sums[barcodes])
+            qs = np.unique(np.quantile(log_rna, np.arange(0, n_bins) / n_bins))
+            bins = np.digitize(log_rna, qs, right=True) - 1
+            bins[log_rna == qs[0]] = 0
+            # RNA counts above the largest quantile are in no bin and never outliers
+            binned = np.flatnonzero(bins < len(qs) - 1)
+            bins = bins[binned]
+
+            ratio_diff_med = _segment_medians(ratio_diff[binned], bins, len(qs) - 1)
+            mad = _segment_medians(np.abs(ratio_diff[binned] - ratio_diff_med[bins]), bins, len(qs) - 1)
+            outliers[barcodes] = False
+            outliers[barcodes[binned[ratio_diff[binned] > times_mad * mad[bins]]]] = True
+
+        return self.var_filter | outliers[:, np.newaxis]
 
     def _barcode_filter_random(
         self,
@@ -916,9 +1939,9 @@ class MPRABarcodeData(MPRAData):
     ) -> NDArray[np.bool_]:
 
         if aggegate_over_replicates and total is None:
-            total_max: int = self.var_filter.shape[0]
+            total_max: int = self.n_vars
         elif total is None:
-            total_max: int = self.var_filter.size
+            total_max: int = self.n_vars * self.n_obs
         else:
             total_max: int = total
 
@@ -934,7 +1957,7 @@ class MPRABarcodeData(MPRAData):
 
             flat_df[true_indices] = True
 
-            mask = flat_df.reshape(self.var_filter.shape)
+            mask = flat_df.reshape((self.n_vars, self.n_obs))
 
         return mask
 
@@ -956,6 +1979,7 @@ class MPRABarcodeData(MPRAData):
         counts: NDArray[np.int32],
         count_threshold: int,
     ) -> NDArray[np.bool_]:
+        counts = as_dense_array(counts)
         if barcode_filter == BarcodeFilter.MIN_COUNT:
             return (counts < count_threshold).T
         elif barcode_filter == BarcodeFilter.MAX_COUNT:
@@ -977,6 +2001,40 @@ class MPRABarcodeData(MPRAData):
 
         return mask
 
+    def _barcode_filter(self, barcode_filter: BarcodeFilter, params: dict) -> NDArray[np.bool_]:
+        filter_switch: dict[BarcodeFilter, Callable[..., NDArray[np.bool_]]] = {
+            BarcodeFilter.MIN_BCS_PER_OLIGO: self._barcode_filter_min_bcs_per_oligo,
+            BarcodeFilter.GLOBAL: self._barcode_filter_global_outliers,
+            BarcodeFilter.LARGE_EXPRESSION: self._barcode_filter_large_expression_outliers,
+            BarcodeFilter.OLIGO_SPECIFIC: self._barcode_filter_oligo_specific_outliers,
+            BarcodeFilter.RANDOM: self._barcode_filter_random,
+            BarcodeFilter.MIN_COUNT: self._barcode_filter_min_count,
+            BarcodeFilter.MAX_COUNT: self._barcode_filter_max_count,
+            BarcodeFilter.MAD: self._barcode_filter_mad,
+        }
+
+        filter_func = filter_switch.get(barcode_filter)
+        if filter_func is None:
+            raise ValueError(f"Unsupported barcode filter: {barcode_filter}")
+        return filter_func(**params)
+
+    def _barcode_filter_count_range(
+        self, rna_range: tuple[int | None, int | None], dna_range: tuple[int | None, int | None]
+    ) -> NDArray[np.bool_]:
+        # fused MIN_COUNT and MAX_COUNT filters, flags counts below the minimum or above the maximum of each modality
+        mask = np.full((self.n_vars, self.n_obs), False)
+        for counts, (min_count, max_count) in [(self.raw_rna_counts, rna_range), (self.raw_dna_counts, dna_range)]:
+            if min_count is None and max_count is None:
+                continue
+            counts = as_dense_array(counts)
+            if min_count is not None and max_count is not None:
+                mask |= ((counts < min_count) | (counts > max_count)).T
+            elif min_count is not None:
+                mask |= (counts < min_count).T
+            else:
+                mask |= (counts > max_count).T
+        return mask
+
     def apply_barcode_filter(self, barcode_filter: BarcodeFilter, params: dict = {}) -> None:
         """Applies a specified barcode filter to the dataset using the provided parameters.
 
@@ -990,23 +2048,45 @@ class MPRABarcodeData(MPRAData):
             ValueError: If an unsupported barcode filter is provided.
         """  # noqa: E501
 
-        filter_switch: dict[BarcodeFilter, Callable[..., NDArray[np.bool_]]] = {
-            BarcodeFilter.MIN_BCS_PER_OLIGO: self._barcode_filter_min_bcs_per_oligo,
-            BarcodeFilter.GLOBAL: self._barcode_filter_global_outliers,
-            BarcodeFilter.LARGE_EXPRESSION: self._barcode_filter_large_expression_outliers,
-            BarcodeFilter.OLIGO_SPECIFIC: self._barcode_filter_oligo_specific_outliers,
-            BarcodeFilter.RANDOM: self._barcode_filter_random,
-            BarcodeFilter.MIN_COUNT: self._barcode_filter_min_count,
-            BarcodeFilter.MAX_COUNT: self._barcode_filter_max_count,
-        }
+        self._union_var_filter(self._barcode_filter(barcode_filter, params))
+        self._add_metadata("var_filter", [barcode_filter.value])
 
-        filter_func = filter_switch.get(barcode_filter)
-        if filter_func:
-            self.var_filter = self.var_filter | filter_func(**params)
-        else:
-            raise ValueError(f"Unsupported barcode filter: {barcode_filter}")
+    def sweep_barcode_filter(
+        self, barcode_filter: BarcodeFilter, grid: Mapping[str, Iterable], params: dict = {}, threads: int = 1
+    ) -> pd.DataFrame:
+        """Evaluates a barcode filter for all combinations of parameter values without changing the var filter.
 
-        self._add_metadata("var_filter", [barcode_filter.value])
+        The oligo-level sums of the data are computed once. For every setting the filter is evaluated on the data as it is, like :meth:`apply_barcode_filter` would, and only the barcodes it newly removes are subtracted from the sums before the replicate correlations of the oligo activity are computed. Intermediates of the filters, e.g. normalized counts or oligo codes, are cached by the data and shared between the settings. With more than one thread, the first setting is evaluated in this process and the others by worker processes. Workers are started with the `fork` start method where it is available (POSIX), so they inherit the data and the cached intermediates without copying; with other start methods, e.g. on Windows, the data are pickled into every worker.
+
+        Args:
+            barcode_filter (BarcodeFilter): The filter.
+            grid (Mapping[str, Iterable]): Values of the swept parameters. Every combination of values is one setting.
+            params (dict, optional): Parameters shared by all settings. Defaults to an empty dictionary.
+            threads (int, optional): Number of processes evaluating the settings. Defaults to 1.
+
+        Returns:
+            One row for the data without the filter and one row per setting: the swept parameters, the number of barcodes removed in at least one replicate, the number of removed barcode observations (barcode and replicate) and the Pearson correlation of the oligo activity of each pair of replicates. Only observed barcodes are counted.
+        """  # noqa: E501
+        names = list(grid)
+        settings = [dict(zip(names, values)) for values in itertools.product(*(list(grid[name]) for name in names))]
+
+        sweep = _BarcodeFilterSweep(self, barcode_filter, dict(params))
+        rows = [sweep.unfiltered()]
+        if threads <= 1 or len(settings) <= 1:
+            rows.extend(sweep.evaluate(setting) for setting in settings)
+        else:
+            rows.append(sweep.evaluate(settings[0]))
+            # forked workers inherit the data, other start methods (spawn, forkserver) would pickle it into every worker
+            mp_context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+            with ProcessPoolExecutor(
+                max_workers=min(threads, len(settings) - 1),
+                mp_context=mp_context,
+                initializer=_init_sweep_worker,
+                initargs=(sweep,),
+            ) as executor:
+                rows.extend(executor.map(_evaluate_sweep_in_worker, settings[1:]))
+
+        return pd.DataFrame(rows, columns=[*names, "barcodes_removed", "observations_removed", *sweep.columns])
 
     def drop_count_sampling(self) -> None:
         """Removes count sampling data from the dataset.
@@ -1027,39 +2107,13 @@ class MPRABarcodeData(MPRAData):
         del self.data.uns["count_sampling"]
         self.data.layers.pop("rna_sampling", None)
         self.data.layers.pop("dna_sampling", None)
-
-    def _calculate_proportions(
-        self,
-        proportion: float | None,
-        total: int | None,
-        aggregate_over_replicates: bool,
-        counts: NDArray[np.int32],
-        replicates: int,
-    ):
-        pp = [1.0] * replicates
-
-        if proportion is not None:
-            pp = [proportion] * replicates
-
-        if total is not None:
-            if aggregate_over_replicates:
-                for i, p in enumerate(pp):
-                    pp[i] = min(float(total) / float(np.sum(counts)), p)
-            else:
-                for i, p in enumerate(pp):
-                    pp[i] = min(float(total) / float(np.sum(counts[i, :])), p)
-        return pp
-
-    def _sample_individual_counts(self, x, proportion: float) -> int:
-        return int(
-            np.floor(x * proportion)
-            + (0.0 if x != 0 or np.random.rand() > (x * proportion - np.floor(x * proportion)) else 1.0)
-        )
+        self._invalidate_derived("rna_sampling", "dna_sampling")
 
     def _apply_sampling(
         self,
         layer_name: str,
         counts: NDArray[np.int32],
+        rng: np.random.Generator,
         proportion: float | None,
         total: int | None,
         max_value: int | None,
@@ -1069,18 +2123,30 @@ class MPRABarcodeData(MPRAData):
         sampled_counts = counts.copy()
 
         if total is not None or proportion is not None:
-
-            pp = self._calculate_proportions(proportion, total, aggregate_over_replicates, sampled_counts, self.n_obs)
-
-            vectorized_sample_individual_counts = np.vectorize(self._sample_individual_counts)
-
-            for i, p in enumerate(pp):
-                sampled_counts[i, :] = vectorized_sample_individual_counts(sampled_counts[i, :], proportion=p)
+            if aggregate_over_replicates:
+                if sp.issparse(sampled_counts):
+                    sampled_counts.data = sample_counts(sampled_counts.data, rng, proportion, total)
+                else:
+                    sampled_counts = sample_counts(sampled_counts, rng, proportion, total)
+            else:
+                for i in range(sampled_counts.shape[0]):
+                    if sp.issparse(sampled_counts):
+                        row = slice(sampled_counts.indptr[i], sampled_counts.indptr[i + 1])
+                        sampled_counts.data[row] = sample_counts(sampled_counts.data[row], rng, proportion, total)
+                    else:
+                        sampled_counts[i, :] = sample_counts(sampled_counts[i, :], rng, proportion, total)
 
         if max_value is not None:
-            sampled_counts = np.clip(sampled_counts, None, max_value)
+            if sp.issparse(sampled_counts):
+                sampled_counts.data = np.clip(sampled_counts.data, None, max_value)
+            else:
+                sampled_counts = np.clip(sampled_counts, None, max_value)
+
+        if sp.issparse(sampled_counts):
+            sampled_counts.eliminate_zeros()
 
         self.data.layers[layer_name] = sampled_counts
+        self._invalidate_derived(layer_name)
 
     def apply_count_sampling(
         self,
@@ -1089,25 +2155,34 @@ class MPRABarcodeData(MPRAData):
         total: int | None = None,
         max_value: int | None = None,
         aggregate_over_replicates: bool = False,
+        seed: int | None = None,
     ) -> None:
         """Applies count sampling to RNA and/or DNA count data according to the specified parameters.
 
+        Counts are first thinned binomially with `proportion`, then downsampled without replacement (multivariate hypergeometric) to exactly `total` counts per replicate (or over all replicates), and finally clipped at `max_value`.
+
         Args:
             count_type (CountSampling): Specifies which counts to sample. Options are RNA, DNA, or RNA_AND_DNA.
-            proportion (Optional[float]): Proportion of counts to sample (between 0 and 1). If None, this parameter is ignored.
-            total (Optional[int]): Total number of counts to sample. If None, this parameter is ignored.
+            proportion (Optional[float]): Probability to keep each single count (between 0 and 1). If None, this parameter is ignored.
+            total (Optional[int]): Exact number of counts to keep. Replicates with fewer counts are not changed. If None, this parameter is ignored.
             max_value (Optional[int]): Maximum value for sampled counts. If None, this parameter is ignored.
-            aggregate_over_replicates (bool): Whether to aggregate counts over replicates before sampling.
+            aggregate_over_replicates (bool): Whether `total` applies to the counts of all replicates together instead of to each replicate.
+            seed (Optional[int]): Seed of the random number generator. If None, a random seed is drawn. The seed is stored in the sampling metadata so that the sampling can be reproduced.
 
         Side Effects:
             - Adds sampling metadata to the object.
             - Drops any normalized data associated with the object.
-        """
+        """  # noqa: E501
+
+        if seed is None:
+            seed = int(np.random.default_rng().integers(np.iinfo(np.int64).max))
+        rng = np.random.default_rng(seed)
 
         if count_type == CountSampling.RNA or count_type == CountSampling.RNA_AND_DNA:
             self._apply_sampling(
                 "rna_sampling",
                 self.raw_rna_counts,
+                rng,
                 proportion,
                 total,
                 max_value,
@@ -1118,6 +2193,7 @@ class MPRABarcodeData(MPRAData):
             self._apply_sampling(
                 "dna_sampling",
                 self.raw_dna_counts,
+                rng,
                 proportion,
                 total,
                 max_value,
@@ -1133,6 +2209,7 @@ class MPRABarcodeData(MPRAData):
                         "total": total,
                         "max_value": max_value,
                         "aggregate_over_replicates": aggregate_over_replicates,
+                        "seed": seed,
                     }
                 }
             ],
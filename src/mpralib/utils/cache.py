@@ -0,0 +1,376 @@
+import hashlib
+import json
+import logging
+import os
+import zipfile
+from collections.abc import Callable
+from typing import Any
+
+import anndata as ad
+import h5py
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from anndata.io import read_elem
+
+from mpralib import __version__
+from mpralib.mpradata import MPRABarcodeData
+from mpralib.utils.io import read_sequence_design_file
+
+
+def default_cache_dir() -> str:
+    """Returns the default cache directory of MPRAlib.
+
+    Returns:
+        `$XDG_CACHE_HOME/mpralib` or `~/.cache/mpralib` if `XDG_CACHE_HOME` is not set.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "mpralib")
+
+
+def _map_dataset(file_path: str, dataset: h5py.Dataset) -> np.ndarray:
+    # contiguous, uncompressed numeric datasets are mapped copy-on-write, so in-place changes never reach the file
+    offset = dataset.id.get_offset()
+    if offset is None or dataset.chunks is not None or dataset.dtype.kind not in "biuf":
+        return read_elem(dataset)
+    return np.memmap(file_path, mode="c", dtype=dataset.dtype, offset=offset, shape=dataset.shape)
+
+
+def _map_elem(file_path: str, elem: h5py.Dataset | h5py.Group) -> np.ndarray | sp.spmatrix:
+    if isinstance(elem, h5py.Dataset):
+        return _map_dataset(file_path, elem)
+    encoding = elem.attrs.get("encoding-type")
+    if encoding in ("csr_matrix", "csc_matrix"):
+        matrix_type = sp.csr_matrix if encoding == "csr_matrix" else sp.csc_matrix
+        return matrix_type(
+            tuple(_map_dataset(file_path, elem[name]) for name in ("data", "indices", "indptr")),
+            shape=tuple(elem.attrs["shape"]),
+            copy=False,
+        )
+    return read_elem(elem)
+
+
+def _write_mappable_elem(parent: h5py.Group, name: str, matrix: np.ndarray | sp.spmatrix) -> None:
+    # h5ad encoding of anndata, but with contiguous datasets; anndata writes sparse matrices chunked
+    if sp.issparse(matrix):
+        group = parent.create_group(name)
+        group.attrs.update({"encoding-type": f"{matrix.format}_matrix", "encoding-version": "0.1.0", "shape": matrix.shape})
+        for key in ("data", "indices", "indptr"):
+            group.create_dataset(key, data=getattr(matrix, key))
+    else:
+        dataset = parent.create_dataset(name, data=np.asarray(matrix))
+        dataset.attrs.update({"encoding-type": "array", "encoding-version": "0.2.0"})
+
+
+def _write_mappable_h5ad(adata: ad.AnnData, file_path: str) -> None:
+    """Writes an h5ad file whose count matrices (`X` and layers) can be memory mapped by :func:`_read_mapped_h5ad`."""
+    annotations = ad.AnnData(
+        obs=adata.obs,
+        var=adata.var,
+        uns=dict(adata.uns),
+        obsm=dict(adata.obsm),
+        varm=dict(adata.varm),
+        obsp=dict(adata.obsp),
+        varp=dict(adata.varp),
+    )
+    annotations.write_h5ad(file_path)
+    with h5py.File(file_path, "a") as f:
+        if adata.X is not None:
+            _write_mappable_elem(f, "X", adata.X)
+        layers = f.require_group("layers")
+        layers.attrs.update({"encoding-type": "dict", "encoding-version": "0.1.0"})
+        for name, matrix in adata.layers.items():
+            _write_mappable_elem(layers, name, matrix)
+
+
+def _read_mapped_h5ad(file_path: str) -> ad.AnnData:
+    """Reads an h5ad file with the count matrices (`X` and layers) memory mapped instead of loaded.
+
+    Only pages that are accessed are read from disk, so opening an entry does not depend on the size of the count matrices.
+    Annotations and metadata are read completely.
+    """
+    with h5py.File(file_path, "r") as f:
+        elems = {key: read_elem(f[key]) for key in ("obs", "var")}
+        elems.update({key: read_elem(f[key]) for key in ("uns", "obsm", "varm", "obsp", "varp") if key in f})
+        layers = {name: _map_elem(file_path, elem) for name, elem in f["layers"].items()} if "layers" in f else {}
+        X = _map_elem(file_path, f["X"]) if "X" in f else None
+    return ad.AnnData(X=X, layers=layers, **elems)
+
+
+def _encode_strings(arrays: dict, name: str, values: list) -> None:
+    # UTF-8 bytes of all strings concatenated, with the offsets of each string
+    encoded = [value.encode("utf-8") for value in values]
+    lengths = np.fromiter((len(value) for value in encoded), dtype=np.int64, count=len(encoded))
+    arrays[f"{name}.bytes"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    arrays[f"{name}.offsets"] = np.concatenate(([0], np.cumsum(lengths)))
+
+
+def _decode_strings(npz: Any, name: str) -> list[str]:
+    data = npz[f"{name}.bytes"].tobytes()
+    offsets = npz[f"{name}.offsets"].tolist()
+    return [data[begin:end].decode("utf-8") for begin, end in zip(offsets[:-1], offsets[1:])]
+
+
+def _encode_items(arrays: dict, name: str, items: list) -> str:
+    # list items are either all strings or all integers; other items, e.g. from literal lists of floats, are not supported
+    if all(isinstance(item, str) for item in items):
+        _encode_strings(arrays, name, items)
+        return "str"
+    if all(isinstance(item, int) and not isinstance(item, bool) for item in items):
+        arrays[name] = np.asarray(items, dtype=np.int64)
+        return "int"
+    raise ValueError(f"Unsupported values in column {name}")
+
+
+def _decode_items(npz: Any, name: str, kind: str) -> list:
+    return _decode_strings(npz, name) if kind == "str" else npz[name].tolist()
+
+
+def _encode_column(arrays: dict, name: str, values: pd.Series | pd.Index) -> dict:
+    """Stores a column of a parsed sequence design as plain NumPy arrays and returns how to decode it."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        arrays[f"{name}.codes"] = np.asarray(values.cat.codes if isinstance(values, pd.Series) else values.codes)
+        return {"kind": "category", "categories": _encode_items(arrays, name, list(values.dtype.categories))}
+    if isinstance(values.dtype, pd.Int64Dtype):
+        missing = np.asarray(values.isna())
+        arrays[f"{name}.missing"] = missing
+        arrays[name] = np.asarray(values.fillna(0), dtype=np.int64)
+        return {"kind": "Int64"}
+    if values.dtype != object:
+        raise ValueError(f"Unsupported dtype {values.dtype} of column {name}")
+    if all(isinstance(value, list) for value in values):
+        arrays[f"{name}.lengths"] = np.fromiter((len(value) for value in values), dtype=np.int64, count=len(values))
+        return {"kind": "list", "items": _encode_items(arrays, name, [item for value in values for item in value])}
+    missing = np.asarray(values.isna())
+    arrays[f"{name}.missing"] = missing
+    return {"kind": "object", "items": _encode_items(arrays, name, list(values[~missing]))}
+
+
+def _decode_column(npz: Any, name: str, encoding: dict) -> pd.Series | pd.Index:
+    kind = encoding["kind"]
+    if kind == "category":
+        categories = _decode_items(npz, name, encoding["categories"])
+        return pd.Categorical.from_codes(npz[f"{name}.codes"], categories=categories)
+    if kind == "Int64":
+        return pd.arrays.IntegerArray(npz[name], npz[f"{name}.missing"])
+    if kind == "list":
+        items = _decode_items(npz, name, encoding["items"])
+        offsets = np.concatenate(([0], np.cumsum(npz[f"{name}.lengths"]))).tolist()
+        return pd.array([items[begin:end] for begin, end in zip(offsets[:-1], offsets[1:])], dtype=object)
+    missing = npz[f"{name}.missing"]
+    values = np.full(len(missing), np.nan, dtype=object)
+    values[~missing] = _decode_items(npz, name, encoding["items"])
+    return pd.array(values, dtype=object)
+
+
+def _write_design(df: pd.DataFrame, file_path: str) -> None:
+    """Writes a parsed sequence design as NumPy arrays, which, unlike pickles, cannot execute code when read."""
+    arrays: dict = {}
+    encodings = {"index": _encode_column(arrays, "index", df.index)}
+    encodings.update({f"column{i}": _encode_column(arrays, f"column{i}", df[column]) for i, column in enumerate(df.columns)})
+    meta = {"index_name": df.index.name, "columns": list(df.columns), "encodings": encodings}
+    with open(file_path, "wb") as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+
+
+def _read_design(file_path: str) -> pd.DataFrame:
+    with np.load(file_path, allow_pickle=False) as npz:
+        meta = json.loads(str(npz["meta"]))
+        encodings = meta["encodings"]
+        index = pd.Index(_decode_column(npz, "index", encodings["index"]), name=meta["index_name"])
+        return pd.DataFrame(
+            {column: _decode_column(npz, f"column{i}", encodings[f"column{i}"]) for i, column in enumerate(meta["columns"])},
+            index=index,
+        )
+
+
+class _FileCache:
+    """Least recently used on-disk cache of parsed input files.
+
+    All cache types share the entries and the size limit of a cache directory.
+
+    Args:
+        cache_dir (str): Directory of the cache. Created if it does not exist.
+        max_size (int, optional): Maximum size of the cache in bytes. Defaults to 10 GB.
+    """
+
+    LOGGER = logging.getLogger(__name__)
+
+    _SUFFIXES = (".h5ad", ".design.npz")
+    _HASH_BLOCK_SIZE = 1 << 20
+
+    def __init__(self, cache_dir: str, max_size: int = 10 * 1000**3):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def _write(self, entry: str, write: Callable[[str], None]) -> None:
+        # write to a temporary file first so that concurrent readers never see a partial entry
+        tmp_path = f"{entry}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            write(tmp_path)
+            os.replace(tmp_path, entry)
+            self.LOGGER.info(f"Wrote cache entry {entry}")
+        except (OSError, ValueError) as e:
+            self.LOGGER.warning(f"Unable to write cache entry {entry}: {e}")
+            self._remove(tmp_path)
+
+    def entries(self) -> list[str]:
+        """Returns the paths of all cache entries, least recently used first."""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith(self._SUFFIXES)]
+        return sorted(entries, key=os.path.getmtime)
+
+    def size(self) -> int:
+        """Returns the total size of all cache entries in bytes."""
+        return sum(os.path.getsize(entry) for entry in self.entries())
+
+    def evict(self) -> None:
+        """Removes least recently used entries until the cache is not larger than `max_size`."""
+        entries = self.entries()
+        total_size = sum(os.path.getsize(entry) for entry in entries)
+        for entry in entries:
+            if total_size <= self.max_size:
+                break
+            total_size -= os.path.getsize(entry)
+            self._remove(entry)
+            self.LOGGER.info(f"Evicted cache entry {entry}")
+
+    def clear(self) -> None:
+        """Removes all cache entries."""
+        for entry in self.entries():
+            self._remove(entry)
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class BarcodeDataCache(_FileCache):
+    """On-disk cache of parsed reporter experiment barcode files.
+
+    Parsed files are stored as uncompressed h5ad files in the cache directory. The count matrices of an entry are memory mapped when it is read, so reading an entry costs a few milliseconds independent of the size of the file; counts are read from disk when they are used. An entry is keyed by the MPRAlib version, the absolute path, size and modification time of the input file, a hash of its first and last block and the storage mode (dense or sparse), so a changed input file is parsed again. The cache is limited in size; least recently used entries are removed first.
+
+    Args:
+        cache_dir (str): Directory of the cache. Created if it does not exist.
+        max_size (int, optional): Maximum size of the cache in bytes. Defaults to 10 GB.
+    """  # noqa: E501
+
+    _SUFFIX = ".h5ad"
+
+    def key(self, file_path: str, sparse: bool = False) -> str:
+        """Computes the cache key of a reporter experiment barcode file.
+
+        Args:
+            file_path (str): Path to the reporter experiment barcode file.
+            sparse (bool, optional): Whether the counts are stored as sparse matrices. Defaults to False.
+
+        Returns:
+            Hex digest identifying the parsed file.
+        """
+        stat = os.stat(file_path)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{__version__}\t{os.path.abspath(file_path)}\t{stat.st_size}\t{stat.st_mtime_ns}\t{sparse}".encode())
+        with open(file_path, "rb") as f:
+            digest.update(f.read(self._HASH_BLOCK_SIZE))
+            if stat.st_size > self._HASH_BLOCK_SIZE:
+                f.seek(-self._HASH_BLOCK_SIZE, os.SEEK_END)
+                digest.update(f.read(self._HASH_BLOCK_SIZE))
+        return digest.hexdigest()
+
+    def entry_path(self, file_path: str, sparse: bool = False) -> str:
+        """Returns the path of the cache entry of a reporter experiment barcode file."""
+        return os.path.join(self.cache_dir, self.key(file_path, sparse) + self._SUFFIX)
+
+    def read(self, file_path: str, sparse: bool = False) -> MPRABarcodeData:
+        """Reads a reporter experiment barcode file from the cache or parses and caches it.
+
+        Args:
+            file_path (str): Path to the reporter experiment barcode file.
+            sparse (bool, optional): Store the RNA and DNA count layers as sparse (CSR) matrices. Defaults to False.
+
+        Returns:
+            The barcode data of the file, identical to :meth:`MPRABarcodeData.from_file`.
+        """
+        entry = self.entry_path(file_path, sparse)
+        if os.path.exists(entry):
+            try:
+                adata = _read_mapped_h5ad(entry)
+            except (OSError, KeyError, ValueError) as e:
+                # truncated entries or entries of another format are parsed again
+                self.LOGGER.warning(f"Removing unreadable cache entry {entry}: {e}")
+                self._remove(entry)
+            else:
+                self.LOGGER.info(f"Read {file_path} from cache entry {entry}")
+                # the modification time marks the last use of an entry for the LRU eviction
+                os.utime(entry)
+                adata.uns["file_path"] = file_path
+                adata.uns["date"] = pd.to_datetime("today").strftime("%Y-%m-%d")
+                return MPRABarcodeData(adata)
+
+        mpradata = MPRABarcodeData.from_file(file_path, sparse=sparse)
+        self._write(entry, lambda path: _write_mappable_h5ad(mpradata.data, path))
+        self.evict()
+        return mpradata
+
+
+class SequenceDesignCache(_FileCache):
+    """On-disk cache of parsed sequence design files.
+
+    Parsed designs are stored as NumPy arrays in `.npz` files in the cache directory and read without unpickling, so entries of a shared cache directory cannot execute code. An entry is keyed by the MPRAlib version and a hash of the complete file content, so copies of a design share one entry and a changed design is parsed again. Entries share the directory and size limit with :class:`BarcodeDataCache`.
+
+    Args:
+        cache_dir (str): Directory of the cache. Created if it does not exist.
+        max_size (int, optional): Maximum size of the cache in bytes. Defaults to 10 GB.
+    """  # noqa: E501
+
+    _SUFFIX = ".design.npz"
+
+    def key(self, file_path: str) -> str:
+        """Computes the cache key of a sequence design file from its content.
+
+        Args:
+            file_path (str): Path to the sequence design file.
+
+        Returns:
+            Hex digest identifying the parsed file.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{__version__}\t".encode())
+        with open(file_path, "rb") as f:
+            while block := f.read(self._HASH_BLOCK_SIZE):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def entry_path(self, file_path: str) -> str:
+        """Returns the path of the cache entry of a sequence design file."""
+        return os.path.join(self.cache_dir, self.key(file_path) + self._SUFFIX)
+
+    def read(self, file_path: str) -> pd.DataFrame:
+        """Reads a sequence design file from the cache or parses and caches it.
+
+        Args:
+            file_path (str): Path to the sequence design file.
+
+        Returns:
+            The sequence design, identical to :func:`read_sequence_design_file`.
+        """
+        entry = self.entry_path(file_path)
+        if os.path.exists(entry):
+            try:
+                df = _read_design(entry)
+            except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+                self.LOGGER.warning(f"Removing unreadable cache entry {entry}: {e}")
+                self._remove(entry)
+            else:
+                self.LOGGER.info(f"Read {file_path} from cache entry {entry}")
+                os.utime(entry)
+                return df
+
+        df = read_sequence_design_file(file_path)
+        self._write(entry, lambda path: _write_design(df, path))
+        self.evict()
+        return df
@@ -4,13 +4,19 @@ import gzip
 import json
 import logging
 import re
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
 from enum import Enum
 from importlib.resources import files
 
 import jsonschema
+import numpy as np
+import pandas as pd
 import tqdm
+from numpy.typing import NDArray
 
-from mpralib.utils.io import is_compressed_file
+from mpralib.utils.io import is_bgzf, is_compressed_file, read_bgzf_block
 
 
 class ValidationSchema(Enum):
@@ -72,16 +78,32 @@ def _convert_row_value(value: str, prop_schema: dict):
     return converted_value
 
 
-def validate_tsv_with_schema(tsv_file_path: str, schema_type: ValidationSchema) -> bool:
+def validate_tsv_with_schema(
+    tsv_file_path: str,
+    schema_type: ValidationSchema,
+    threads: int = 1,
+    chunk_size: int = 1 << 23,
+    columnar: bool = True,
+) -> bool:
     """Validates a TSV file against a specified JSON schema.
 
     This function reads a TSV file (optionally gzipped), converts each row to a dictionary,
     and validates each row against the provided JSON schema. If any row fails validation,
     a warning is logged. If an unexpected error occurs during validation, it is logged and raised.
 
+    The file is split into chunks of about `chunk_size` bytes which are validated in a pool of `threads`
+    processes, each with one compiled validator. BGZF files are split at block boundaries, so the workers
+    also decompress in parallel. Invalid rows are reported in line order, independent of the number of threads.
+
+    The rows of a chunk are first checked column by column with vectorized checks compiled from the schema. Only rows
+    failing a check are converted and validated one by one, which gives the same messages as validating every row.
+
     Args:
         tsv_file_path (str): Path to the TSV file to validate. The file may be gzipped.
         schema_type (ValidationSchema): The type of schema to validate against.
+        threads (int, optional): Number of processes validating chunks. Defaults to 1 (no process pool).
+        chunk_size (int, optional): Approximate number of uncompressed bytes per chunk. Defaults to 8 MiB.
+        columnar (bool, optional): Check the columns vectorized before validating rows. Defaults to True.
 
     Returns:
         True if all rows are valid according to the schema, False otherwise.
@@ -102,25 +124,30 @@ def validate_tsv_with_schema(tsv_file_path: str, schema_type: ValidationSchema)
     header = _get_header_for_schema(schema_type)
     open_func = gzip.open if is_compressed_file(tsv_file_path) else open
 
-    correct_file = True
+    skip_first_line = header is None
+    if header is None:
+        # the first line of the file is the header
+        with open_func(tsv_file_path, "rt", encoding="utf-8") as tsvfile:
+            header = next(csv.reader(tsvfile, delimiter="\t"), [])
 
-    with open_func(tsv_file_path, "rt", encoding="utf-8") as tsvfile:
-        reader = csv.DictReader(tsvfile, delimiter="\t", fieldnames=header)
-        i = 0
-        for i, row in enumerate(tqdm.tqdm(reader, desc="Validating rows", unit="row"), start=1):
-            _convert_row_types(row, schema)
-            try:
-                jsonschema.validate(instance=row, schema=schema)
-            except jsonschema.ValidationError as e:
-                LOGGER.warning(f"Row {i} invalid: {e.message}")
-                correct_file = False
-            except Exception as e:
-                LOGGER.error(f"Row {i} error: {e}")
+    validator = _RowValidator(schema, header, columnar)
+    correct_file = True
+    i = 0
+    with tqdm.tqdm(desc="Validating rows", unit="row") as progress:
+        for rows, errors, failure in _validate_chunks(tsv_file_path, validator, threads, chunk_size, skip_first_line):
+            for row, message in errors:
+                LOGGER.warning(f"Row {i + row} invalid: {message}")
                 correct_file = False
-                raise e
-        if i == 0:
-            LOGGER.warning("The file is empty.")
-            correct_file = False
+            if failure is not None:
+                row, exception, log = failure
+                if log:
+                    LOGGER.error(f"Row {i + row} error: {exception}")
+                raise exception
+            i += rows
+            progress.update(rows)
+    if i == 0:
+        LOGGER.warning("The file is empty.")
+        correct_file = False
     if correct_file:
         LOGGER.info(f"File {tsv_file_path} is valid according to schema {schema_type.value}.")
     else:
@@ -128,6 +155,445 @@ def validate_tsv_with_schema(tsv_file_path: str, schema_type: ValidationSchema)
     return correct_file
 
 
+class _RowValidator:
+    """Validates rows of a TSV file with a JSON schema validator and type conversions compiled once per file.
+
+    Args:
+        schema (dict): The JSON schema.
+        fieldnames (list): Column names of the file.
+        columnar (bool, optional): Check the rows of a chunk column by column with :class:`_ColumnarValidator` first and
+            validate only the rows failing a check one by one. Defaults to True.
+    """
+
+    def __init__(self, schema: dict, fieldnames: list, columnar: bool = True):
+        self.schema = schema
+        self.fieldnames = fieldnames
+        self.columnar = columnar
+
+        validator_class = jsonschema.validators.validator_for(schema)
+        validator_class.check_schema(schema)
+        self.validator = validator_class(schema)
+
+        # conversion steps of each column in the order of _convert_row_types, so the regexes are matched once per file
+        self.conversions: dict[str, list[dict]] = {}
+        for prop_pattern_string, prop_schema in schema.get("patternProperties", {}).items():
+            prop_pattern = re.compile(prop_pattern_string)
+            for prop in fieldnames:
+                if prop_pattern.match(prop):
+                    self.conversions.setdefault(prop, []).append(prop_schema)
+        for prop, prop_schema in schema.get("properties", {}).items():
+            if prop in fieldnames:
+                self.conversions.setdefault(prop, []).append(prop_schema)
+
+        self.column_validator = _ColumnarValidator(self) if columnar else None
+
+    def convert(self, row: dict) -> None:
+        if None in row:
+            # surplus values of a row are stored with key None, which the generic conversion rejects
+            _convert_row_types(row, self.schema)
+            return
+        for prop, prop_schemas in self.conversions.items():
+            for prop_schema in prop_schemas:
+                if row[prop] != "":
+                    for any_of_prop_schema in prop_schema.get("anyOf", [prop_schema]):
+                        row[prop] = _convert_row_value(row[prop], any_of_prop_schema)
+
+    def validate_lines(self, lines: list[str]) -> tuple[int, list[tuple[int, str]], tuple | None]:
+        """Validates complete lines of the file.
+
+        Returns:
+            The number of rows (blank lines are skipped like in `csv.DictReader`), the row numbers within the lines and messages of invalid rows, and the row number, exception and whether to log it of an unexpected error that stopped the validation.
+        """  # noqa: E501
+        if self.column_validator is not None and self.column_validator.enabled:
+            lines = [line for line in lines if line]
+            valid = self.column_validator.valid_lines(lines)
+            if valid is not None:
+                rows = (
+                    (i + 1, next(csv.DictReader([lines[i]], delimiter="\t", fieldnames=self.fieldnames)))
+                    for i in np.flatnonzero(~valid)
+                )
+                return self._validate_rows(rows, len(lines))
+        rows = list(enumerate(csv.DictReader(lines, delimiter="\t", fieldnames=self.fieldnames), start=1))
+        return self._validate_rows(rows, len(rows))
+
+    def _validate_rows(self, rows: Iterable[tuple[int, dict]], n_rows: int) -> tuple[int, list[tuple[int, str]], tuple | None]:
+        errors = []
+        for i, row in rows:
+            try:
+                self.convert(row)
+            except Exception as e:
+                return i, errors, (i, e, False)
+            try:
+                error = jsonschema.exceptions.best_match(self.validator.iter_errors(row))
+            except Exception as e:
+                return i, errors, (i, e, True)
+            if error is not None:
+                errors.append((i, error.message))
+        return n_rows, errors, None
+
+    def validate_chunk(self, task: tuple) -> tuple[bytes | None, tuple, bytes]:
+        """Validates the complete lines of a chunk of the file.
+
+        Args:
+            task (tuple): Either `("data", bytes)` with uncompressed data or `("bgzf", path, start, end)` with a range of whole BGZF blocks.
+
+        Returns:
+            The bytes before the first line break, the result of :meth:`validate_lines` for the complete lines and the bytes after the last line break. Lines crossing chunk borders are stitched and validated by the caller. The first value is None if the chunk contains no line break.
+        """  # noqa: E501
+        if task[0] == "bgzf":
+            _, path, start, end = task
+            with open(path, "rb") as f:
+                f.seek(start)
+                data = gzip.decompress(f.read(end - start))
+        else:
+            data = task[1]
+
+        lines = data.split(b"\n")
+        if len(lines) == 1:
+            return None, (0, [], None), data
+        complete_lines = [line.rstrip(b"\r").decode("utf-8") for line in lines[1:-1]]
+        return lines[0], self.validate_lines(complete_lines), lines[-1]
+
+
+# keywords without effect on the validity of the values of this repository's schemas
+_ANNOTATION_KEYWORDS = {"$comment", "description", "name", "title"}
+_OBJECT_KEYWORDS = _ANNOTATION_KEYWORDS | {
+    "$schema",
+    "additionalProperties",
+    "maxProperties",
+    "minProperties",
+    "patternProperties",
+    "properties",
+    "required",
+    "type",
+}
+_BOUND_KEYWORDS = {"exclusiveMaximum", "exclusiveMinimum", "maximum", "minimum"}
+# values converted by int() and float() without doubt, so they can be checked vectorized
+_INTEGER_PATTERN = re.compile(r"[+-]?[0-9]{1,15}")
+_NUMBER_PATTERN = re.compile(r"[+-]?(?:(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][+-]?[0-9]+)?|(?i:nan|inf|infinity))")
+# characters with a special meaning for the csv module; chunks containing them are validated row by row
+_CSV_SPECIAL_PATTERN = re.compile(r'["\r\x00]')
+_MAX_MEMO_SIZE = 1 << 20
+
+
+class _ColumnValues:
+    """The values of one column of a chunk, classified by the type they have after the conversion of the column."""
+
+    def __init__(self, values: pd.Series, conversion: str | None):
+        self.values = values
+        empty = (values == "").to_numpy()
+        if conversion is None:
+            self.is_string = np.ones(len(values), dtype=bool)
+            self.is_integer = np.zeros(len(values), dtype=bool)
+            self.is_number = self.is_integer
+        else:
+            # empty values are not converted, other values are either converted or unknown and left to the row validation
+            self.is_string = empty
+            pattern = _INTEGER_PATTERN if conversion == "integer" else _NUMBER_PATTERN
+            converted = values.str.fullmatch(pattern).to_numpy(dtype=bool)
+            self.is_integer = converted if conversion == "integer" else np.zeros(len(values), dtype=bool)
+            self.is_number = converted
+        self._numbers: NDArray[np.float64] | None = None
+
+    @property
+    def numbers(self) -> NDArray[np.float64]:
+        if self._numbers is None:
+            self._numbers = np.full(len(self.values), np.nan)
+            self._numbers[self.is_number] = self.values.to_numpy()[self.is_number].astype(np.float64)
+        return self._numbers
+
+
+_LeafCheck = Callable[[_ColumnValues], NDArray[np.bool_]]
+
+
+def _compile_leaf(leaf: dict) -> _LeafCheck | None:
+    """Compiles a schema without subschemas to a vectorized check, or returns None if it is not supported."""
+    keywords = set(leaf) - _ANNOTATION_KEYWORDS
+    leaf_type = leaf.get("type")
+    if leaf_type is None and not keywords:
+        return lambda column: np.ones(len(column.values), dtype=bool)
+    if leaf_type == "string":
+        return _compile_string_leaf(leaf, keywords)
+    if leaf_type in ("integer", "number"):
+        return _compile_number_leaf(leaf, keywords)
+    return None
+
+
+def _compile_string_leaf(leaf: dict, keywords: set) -> _LeafCheck | None:
+    # items only applies to arrays
+    if not keywords <= {"type", "enum", "items", "maxLength", "minLength", "pattern"}:
+        return None
+    pattern = re.compile(leaf["pattern"]) if "pattern" in leaf else None
+    enum = [value for value in leaf.get("enum", []) if isinstance(value, str)]
+
+    def check_string(column: _ColumnValues) -> NDArray[np.bool_]:
+        mask = column.is_string.copy()
+        if "minLength" in leaf or "maxLength" in leaf:
+            lengths = column.values.str.len().to_numpy()
+            mask &= (lengths >= leaf.get("minLength", 0)) & (lengths <= leaf.get("maxLength", np.inf))
+        if pattern is not None:
+            # jsonschema searches the pattern anywhere in the value
+            found = (pattern.search(value) is not None for value in column.values)
+            mask &= np.fromiter(found, dtype=bool, count=len(mask))
+        if "enum" in leaf:
+            mask &= column.values.isin(enum).to_numpy()
+        return mask
+
+    return check_string
+
+
+def _compile_number_leaf(leaf: dict, keywords: set) -> _LeafCheck | None:
+    if not keywords <= {"type"} | _BOUND_KEYWORDS:
+        return None
+    bounds = {keyword: leaf[keyword] for keyword in _BOUND_KEYWORDS & keywords}
+    if any(isinstance(bound, bool) or not isinstance(bound, (int, float)) for bound in bounds.values()):
+        return None
+    integer = leaf["type"] == "integer"
+
+    def check_number(column: _ColumnValues) -> NDArray[np.bool_]:
+        mask = (column.is_integer if integer else column.is_number).copy()
+        if bounds:
+            # the comparisons of jsonschema, which let NaN pass
+            numbers = column.numbers
+            with np.errstate(invalid="ignore"):
+                if "minimum" in bounds:
+                    mask &= ~(numbers < bounds["minimum"])
+                if "maximum" in bounds:
+                    mask &= ~(numbers > bounds["maximum"])
+                if "exclusiveMinimum" in bounds:
+                    mask &= ~(numbers <= bounds["exclusiveMinimum"])
+                if "exclusiveMaximum" in bounds:
+                    mask &= ~(numbers >= bounds["exclusiveMaximum"])
+        return mask
+
+    return check_number
+
+
+def _compile_distinct_values(
+    field: str, subschemas: list[dict], conversions: list[dict], validator_class: type
+) -> Callable[[pd.Series], NDArray[np.bool_]]:
+    """Compiles a check validating every distinct value of a column once with the subschemas of the column."""
+    validators = [validator_class(subschema) for subschema in subschemas]
+    memo: dict[str, bool] = {}
+
+    def valid_value(value: str) -> bool:
+        if value not in memo:
+            if len(memo) >= _MAX_MEMO_SIZE:
+                memo.clear()
+            row = {field: value}
+            try:
+                for prop_schema in conversions:
+                    if row[field] != "":
+                        for any_of_prop_schema in prop_schema.get("anyOf", [prop_schema]):
+                            row[field] = _convert_row_value(row[field], any_of_prop_schema)
+                memo[value] = all(validator.is_valid(row[field]) for validator in validators)
+            except Exception:
+                # the row validation raises the error at the right row
+                memo[value] = False
+        return memo[value]
+
+    def check_distinct_values(values: pd.Series) -> NDArray[np.bool_]:
+        codes, uniques = pd.factorize(values)
+        return np.array([valid_value(value) for value in uniques], dtype=bool)[codes]
+
+    return check_distinct_values
+
+
+class _ColumnarValidator:
+    """Checks the rows of a chunk column by column with vectorized checks compiled from the JSON schema.
+
+    A row passing all checks is valid according to the schema. The checks are conservative: rows failing a check are
+    validated again by the row validator, which reports the exact message. Columns with subschemas that cannot be
+    compiled, like the arrays of the sequence design, are validated once per distinct value with their subschemas.
+    The checks are disabled if the properties of a row are invalid (e.g. a required column is missing), so the row
+    validation reports every row.
+
+    Args:
+        row_validator (_RowValidator): The row validator of the file.
+    """
+
+    def __init__(self, row_validator: _RowValidator):
+        schema = row_validator.schema
+        fieldnames = row_validator.fieldnames
+        self.n_fields = len(fieldnames)
+        self.checks: list[Callable[[pd.Series], NDArray[np.bool_]] | None] = []
+        self.enabled = len(set(fieldnames)) == len(fieldnames) and self._valid_properties(schema, fieldnames)
+        if not self.enabled:
+            return
+
+        validator_class = type(row_validator.validator)
+        for field in fieldnames:
+            subschemas = [schema["properties"][field]] if field in schema.get("properties", {}) else []
+            subschemas += [
+                prop_schema
+                for pattern, prop_schema in schema.get("patternProperties", {}).items()
+                if re.search(pattern, field)
+            ]
+            conversions = row_validator.conversions.get(field, [])
+            self.checks.append(self._compile_column(field, subschemas, conversions, validator_class))
+
+    @staticmethod
+    def _valid_properties(schema: dict, fieldnames: list) -> bool:
+        # the object keywords only depend on the column names, which are the same for all rows
+        if not set(schema) <= _OBJECT_KEYWORDS or schema.get("type", "object") != "object" or "$ref" in json.dumps(schema):
+            return False
+        if not set(schema.get("required", [])) <= set(fieldnames):
+            return False
+        if not schema.get("minProperties", 0) <= len(fieldnames) <= schema.get("maxProperties", len(fieldnames)):
+            return False
+        additional_properties = schema.get("additionalProperties", True)
+        if additional_properties is False:
+            patterns = schema.get("patternProperties", {})
+            return all(
+                field in schema.get("properties", {}) or any(re.search(pattern, field) for pattern in patterns)
+                for field in fieldnames
+            )
+        return additional_properties is True
+
+    def _compile_column(
+        self, field: str, subschemas: list[dict], conversions: list[dict], validator_class: type
+    ) -> Callable[[pd.Series], NDArray[np.bool_]] | None:
+        if not subschemas:
+            return None
+        steps = [
+            any_of_prop_schema.get("type")
+            for prop_schema in conversions
+            for any_of_prop_schema in prop_schema.get("anyOf", [prop_schema])
+        ]
+        converting_steps = [step for step in steps if step in ("integer", "number", "array")]
+
+        compiled = []
+        for subschema in subschemas:
+            if "anyOf" in subschema and set(subschema) - _ANNOTATION_KEYWORDS == {"anyOf"}:
+                branches = [_compile_leaf(branch) for branch in subschema["anyOf"]]
+            else:
+                branches = [_compile_leaf(subschema)]
+            compiled.append(branches)
+
+        if converting_steps in ([], ["integer"], ["number"]) and all(None not in branches for branches in compiled):
+            conversion = converting_steps[0] if converting_steps else None
+
+            def check_column(values: pd.Series) -> NDArray[np.bool_]:
+                column = _ColumnValues(values, conversion)
+                mask = np.ones(len(values), dtype=bool)
+                for branches in compiled:
+                    mask &= np.logical_or.reduce([check(column) for check in branches])
+                return mask
+
+            return check_column
+
+        return _compile_distinct_values(field, subschemas, conversions, validator_class)
+
+    def valid_lines(self, lines: list[str]) -> NDArray[np.bool_] | None:
+        """Checks non-blank lines.
+
+        Returns:
+            Whether each line is a valid row, or None if the lines have to be validated row by row.
+        """
+        if _CSV_SPECIAL_PATTERN.search("".join(lines)):
+            return None
+        # lines with a different number of fields are left to the row validation
+        complete = np.fromiter((line.count("\t") == self.n_fields - 1 for line in lines), dtype=bool, count=len(lines))
+        fields = "\t".join(line for line, is_complete in zip(lines, complete) if is_complete).split("\t")
+        valid = np.zeros(len(lines), dtype=bool)
+        if complete.any():
+            valid_complete = np.ones(int(complete.sum()), dtype=bool)
+            n_fields = self.n_fields
+            for i, check in enumerate(self.checks):
+                if check is not None:
+                    valid_complete &= check(pd.Series(fields[i::n_fields], dtype=object))
+            valid[complete] = valid_complete
+        return valid
+
+
+_worker_validator: _RowValidator | None = None
+
+
+def _init_worker(schema: dict, fieldnames: list, columnar: bool) -> None:
+    global _worker_validator
+    _worker_validator = _RowValidator(schema, fieldnames, columnar)
+
+
+def _validate_chunk_in_worker(task: tuple) -> tuple[bytes | None, tuple, bytes]:
+    assert _worker_validator is not None
+    return _worker_validator.validate_chunk(task)
+
+
+def _chunk_tasks(tsv_file_path: str, chunk_size: int) -> Iterator[tuple]:
+    if is_bgzf(tsv_file_path):
+        # every BGZF block holds at most 64 KiB of uncompressed data
+        blocks_per_chunk = max(1, chunk_size >> 16)
+        offsets = _bgzf_block_offsets(tsv_file_path)
+        for i in range(0, len(offsets) - 1, blocks_per_chunk):
+            yield ("bgzf", tsv_file_path, offsets[i], offsets[min(i + blocks_per_chunk, len(offsets) - 1)])
+        return
+
+    open_func = gzip.open if is_compressed_file(tsv_file_path) else open
+    with open_func(tsv_file_path, "rb") as f:
+        while data := f.read(chunk_size):
+            yield ("data", data)
+
+
+def _bgzf_block_offsets(bgzf_file_path: str) -> list[int]:
+    # start offsets of all blocks and the end of the file, read from the BSIZE field of the block headers
+    offsets = [0]
+    with open(bgzf_file_path, "rb") as f:
+        while (block := read_bgzf_block(f, decompress=False)) is not None:
+            offsets.append(offsets[-1] + block[1])
+    return offsets
+
+
+def _chunk_results(
+    tsv_file_path: str, validator: _RowValidator, threads: int, chunk_size: int
+) -> Iterator[tuple[bytes | None, tuple, bytes]]:
+    """Yields the results of :meth:`_RowValidator.validate_chunk` for the chunks of the file in order."""
+    tasks = _chunk_tasks(tsv_file_path, chunk_size)
+    if threads <= 1:
+        for task in tasks:
+            yield validator.validate_chunk(task)
+        return
+    with ProcessPoolExecutor(
+        max_workers=threads,
+        initializer=_init_worker,
+        initargs=(validator.schema, validator.fieldnames, validator.columnar),
+    ) as executor:
+        # a bounded number of chunks in flight keeps the memory use independent of the file size
+        futures: deque[Future] = deque()
+        try:
+            for task in tasks:
+                futures.append(executor.submit(_validate_chunk_in_worker, task))
+                if len(futures) >= 2 * threads:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def _validate_chunks(
+    tsv_file_path: str, validator: _RowValidator, threads: int, chunk_size: int, skip_first_line: bool
+) -> Iterator[tuple[int, list[tuple[int, str]], tuple | None]]:
+    """Validates the file chunk by chunk and yields the results of :meth:`_RowValidator.validate_lines` in line order."""
+    pending = b""
+    first_line = True
+    for head, result, tail in _chunk_results(tsv_file_path, validator, threads, chunk_size):
+        if head is None:
+            pending += tail
+            continue
+        # the line crossing the border to the previous chunk
+        line = (pending + head).rstrip(b"\r").decode("utf-8")
+        if first_line and skip_first_line:
+            first_line = False
+        else:
+            first_line = False
+            yield validator.validate_lines([line])
+        yield result
+        pending = tail
+    if pending and not (first_line and skip_first_line):
+        yield validator.validate_lines([pending.rstrip(b"\r").decode("utf-8")])
+
+
 def _load_schema(schema_type: ValidationSchema):
     schema_filename = schemaFilemap.get(schema_type)
     if schema_filename is None:
@@ -0,0 +1,280 @@
+import io
+import logging
+import os
+from collections.abc import Iterable, Iterator
+from typing import IO
+
+import numpy as np
+import pandas as pd
+from numpy.typing import NDArray
+
+from mpralib.exception import MPRAlibException
+from mpralib.utils.io import is_bgzf, read_bgzf_block
+
+LOGGER = logging.getLogger(__name__)
+
+# blocks decompressed at once while building an index, about 4 MiB of uncompressed data
+_INDEX_BLOCKS = 64
+
+
+class OligoIndex:
+    """Index of the oligos of a BGZF compressed reporter experiment barcode file.
+
+    Barcodes of an oligo are usually written next to each other. The index stores every run of consecutive lines of the same oligo as a range of BGZF virtual offsets, so the lines of a few oligos can be read without decompressing the rest of the file. The index is written next to the file with the suffix `.oidx` and is only used as long as size and modification time of the file are unchanged.
+
+    Args:
+        oligos (NDArray[np.str_]): Oligo names in order of first appearance.
+        run_oligos (NDArray[np.int32]): Oligo code of each run.
+        run_begins (NDArray[np.uint64]): Virtual offset of the first line of each run.
+        run_ends (NDArray[np.uint64]): Virtual offset after the last line of each run.
+        file_size (int): Size of the indexed file in bytes.
+        file_mtime_ns (int): Modification time of the indexed file in nanoseconds.
+    """  # noqa: E501
+
+    SUFFIX = ".oidx"
+
+    def __init__(
+        self,
+        oligos: NDArray[np.str_],
+        run_oligos: NDArray[np.int32],
+        run_begins: NDArray[np.uint64],
+        run_ends: NDArray[np.uint64],
+        file_size: int,
+        file_mtime_ns: int,
+    ):
+        self.oligos = oligos
+        self.run_oligos = run_oligos
+        self.run_begins = run_begins
+        self.run_ends = run_ends
+        self.file_size = file_size
+        self.file_mtime_ns = file_mtime_ns
+
+    @classmethod
+    def index_path(cls, file_path: str) -> str:
+        """Returns the path of the index of a reporter experiment barcode file."""
+        return file_path + cls.SUFFIX
+
+    @classmethod
+    def build(cls, file_path: str) -> "OligoIndex":
+        """Builds the index of a BGZF compressed reporter experiment barcode file in one pass over the file.
+
+        Args:
+            file_path (str): Path to the BGZF compressed reporter experiment barcode file.
+
+        Returns:
+            The index of the file.
+
+        Raises:
+            MPRAlibException: If the file is not BGZF compressed.
+        """
+        if not is_bgzf(file_path):
+            raise MPRAlibException(f"Only BGZF compressed files can be indexed: {file_path}")
+        stat = os.stat(file_path)
+
+        oligo_codes: dict[str, int] = {}
+        run_oligos, run_begins, run_ends = [], [], []
+        # the header line is skipped like a line without oligo
+        carry, carry_begin, skip_line = b"", 0, True
+        with open(file_path, "rb") as f:
+            eof = False
+            while not eof:
+                buffer, block_starts, block_offsets, eof = _read_blocks(f, carry)
+                if not buffer:
+                    break
+                line_ends, begins, ends = _line_offsets(buffer, block_starts, block_offsets, carry_begin)
+                if len(line_ends) == 0:
+                    carry = buffer
+                    continue
+
+                lines_end = int(line_ends[-1])
+                lines, carry, carry_begin = buffer[:lines_end], buffer[lines_end:], int(ends[-1])
+                if skip_line:
+                    header_end = int(line_ends[0])
+                    lines = lines[header_end:]
+                    begins, ends = begins[1:], ends[1:]
+                    skip_line = False
+                if len(begins) == 0:
+                    continue
+
+                # parsed like in MPRABarcodeData.from_file, so missing oligo names get the code -1
+                names = pd.read_csv(io.BytesIO(lines), sep="\t", header=None, usecols=[1], dtype=str, skip_blank_lines=False)
+                codes, uniques = pd.factorize(names[1])
+                lookup = np.fromiter(
+                    (oligo_codes.setdefault(oligo, len(oligo_codes)) for oligo in uniques), dtype=np.int32, count=len(uniques)
+                )
+                codes = np.append(lookup, -1)[codes]
+                run_starts = np.flatnonzero(np.concatenate([[True], codes[1:] != codes[:-1]]))
+                run_oligos.append(codes[run_starts])
+                run_begins.append(begins[run_starts])
+                run_ends.append(ends[np.append(run_starts[1:], len(codes)) - 1])
+
+        if run_oligos:
+            oligos, begins, ends = np.concatenate(run_oligos), np.concatenate(run_begins), np.concatenate(run_ends)
+        else:
+            oligos, begins, ends = np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.uint64)
+        # runs continuing over buffer borders are merged, runs of lines without oligo name are dropped afterwards
+        first = np.flatnonzero(np.concatenate([[True], oligos[1:] != oligos[:-1]]))[: len(oligos)]
+        last = np.append(first[1:], len(oligos)) - 1
+        named = oligos[first] >= 0
+        return cls(
+            np.array(list(oligo_codes), dtype=np.str_),
+            oligos[first][named],
+            begins[first][named],
+            ends[last][named],
+            stat.st_size,
+            stat.st_mtime_ns,
+        )
+
+    def write(self, index_path: str) -> None:
+        """Writes the index to a file."""
+        with open(index_path, "wb") as f:
+            np.savez(
+                f,
+                oligos=self.oligos,
+                run_oligos=self.run_oligos,
+                run_begins=self.run_begins,
+                run_ends=self.run_ends,
+                file_stat=np.array([self.file_size, self.file_mtime_ns], dtype=np.int64),
+            )
+
+    @classmethod
+    def read(cls, index_path: str) -> "OligoIndex":
+        """Reads an index written with :meth:`write`."""
+        with np.load(index_path, allow_pickle=False) as npz:
+            file_size, file_mtime_ns = (int(value) for value in npz["file_stat"])
+            return cls(npz["oligos"], npz["run_oligos"], npz["run_begins"], npz["run_ends"], file_size, file_mtime_ns)
+
+    @classmethod
+    def load(cls, file_path: str) -> "OligoIndex | None":
+        """Reads the index next to a reporter experiment barcode file.
+
+        Args:
+            file_path (str): Path to the reporter experiment barcode file.
+
+        Returns:
+            The index, or None if there is no index or it is outdated.
+        """
+        index_path = cls.index_path(file_path)
+        if not os.path.exists(index_path):
+            return None
+        try:
+            index = cls.read(index_path)
+        except (OSError, ValueError, KeyError) as e:
+            LOGGER.warning(f"Ignoring unreadable oligo index {index_path}: {e}")
+            return None
+        if not index.is_current(file_path):
+            LOGGER.warning(f"Ignoring outdated oligo index {index_path}")
+            return None
+        return index
+
+    def is_current(self, file_path: str) -> bool:
+        """Checks whether the index was built from the current version of a file."""
+        stat = os.stat(file_path)
+        return stat.st_size == self.file_size and stat.st_mtime_ns == self.file_mtime_ns
+
+    def ranges(self, oligos: Iterable[str]) -> list[tuple[int, int]]:
+        """Returns the virtual offset ranges of the lines of oligos in file order.
+
+        Adjacent ranges are merged.
+
+        Args:
+            oligos (Iterable[str]): Names of the oligos. Names not in the index are ignored.
+
+        Returns:
+            List of `(begin, end)` virtual offsets.
+        """
+        selected = np.isin(self.oligos, np.asarray(list(oligos), dtype=np.str_))
+        runs = np.flatnonzero(selected[self.run_oligos])
+        ranges: list[tuple[int, int]] = []
+        for begin, end in zip(self.run_begins[runs].tolist(), self.run_ends[runs].tolist()):
+            if ranges and ranges[-1][1] == begin:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((begin, end))
+        return ranges
+
+    def read_lines(self, file_path: str, oligos: Iterable[str]) -> Iterator[bytes]:
+        """Reads the lines of oligos from the indexed file.
+
+        Only the BGZF blocks containing lines of the oligos are read and decompressed.
+
+        Args:
+            file_path (str): Path to the indexed reporter experiment barcode file.
+            oligos (Iterable[str]): Names of the oligos.
+
+        Yields:
+            Consecutive pieces of the lines of the oligos in file order, without the header line.
+        """
+        # ranges of scattered runs often share blocks, so the last decompressed block is kept
+        cached_offset, cached_block = -1, (b"", 0)
+        with open(file_path, "rb") as f:
+            for begin, end in self.ranges(oligos):
+                block_offset, within = begin >> 16, begin & 0xFFFF
+                end_block, end_within = end >> 16, end & 0xFFFF
+                while block_offset < end_block or (block_offset == end_block and within < end_within):
+                    if block_offset != cached_offset:
+                        f.seek(block_offset)
+                        block = read_bgzf_block(f)
+                        if block is None:
+                            break
+                        cached_offset, cached_block = block_offset, block
+                    data, block_size = cached_block
+                    stop = end_within if block_offset == end_block else None
+                    yield data[within:stop]
+                    block_offset, within = block_offset + block_size, 0
+
+
+def _read_blocks(f: IO[bytes], carry: bytes) -> tuple[bytes, list[int], list[int], bool]:
+    """Decompresses the next blocks of a BGZF file into a buffer after the incomplete line of the previous buffer.
+
+    Returns:
+        The buffer, the buffer positions and file offsets of the blocks in the buffer, and whether the end of the file was reached. Without end of file, the file offset of the next block is appended to the offsets, as the line after the buffer begins there.
+    """  # noqa: E501
+    data, block_starts, block_offsets = [carry], [len(carry)], []
+    for _ in range(_INDEX_BLOCKS):
+        block_offsets.append(f.tell())
+        block = read_bgzf_block(f)
+        if block is None:
+            buffer = b"".join(data)
+            if buffer and not buffer.endswith(b"\n"):
+                buffer += b"\n"
+                block_starts[-1] += 1
+            return buffer, block_starts, block_offsets, True
+        data.append(block[0])
+        block_starts.append(block_starts[-1] + len(block[0]))
+    block_offsets.append(f.tell())
+    return b"".join(data), block_starts, block_offsets, False
+
+
+def _line_offsets(
+    buffer: bytes, block_starts: list[int], block_offsets: list[int], carry_begin: int
+) -> tuple[NDArray[np.intp], NDArray[np.uint64], NDArray[np.uint64]]:
+    """Computes the positions of the complete lines of a buffer.
+
+    Returns:
+        The buffer positions after the line ends, and the virtual offsets of the line beginnings and ends. The first line begins at `carry_begin`, a line end at the end of a block is the beginning of the next block.
+    """  # noqa: E501
+    line_ends = np.flatnonzero(np.frombuffer(buffer, dtype=np.uint8) == ord("\n")) + 1
+    starts = np.asarray(block_starts)
+    blocks = np.searchsorted(starts, line_ends, side="right") - 1
+    within = (line_ends - starts[blocks]).astype(np.uint64)
+    ends = (np.asarray(block_offsets, dtype=np.uint64)[blocks] << np.uint64(16)) | within
+    begins = np.append(np.uint64(carry_begin), ends[:-1])
+    return line_ends, begins, ends
+
+
+def build_oligo_index(file_path: str) -> OligoIndex:
+    """Builds the oligo index of a BGZF compressed reporter experiment barcode file and writes it next to the file.
+
+    Later calls of :meth:`mpralib.mpradata.MPRABarcodeData.from_file` with an oligo selection read only the lines of the
+    selected oligos.
+
+    Args:
+        file_path (str): Path to the BGZF compressed reporter experiment barcode file.
+
+    Returns:
+        The index of the file.
+    """
+    index = OligoIndex.build(file_path)
+    index.write(OligoIndex.index_path(file_path))
+    return index
@@ -1,15 +1,38 @@
 import ast
+import bz2
+import functools
+import gzip
+import lzma
+import re
+import struct
+import zlib
+from collections.abc import Iterable, Iterator, Mapping
 from importlib.resources import files
+from types import MappingProxyType
+from typing import IO
 
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
+from numpy.typing import ArrayLike, NDArray
 
 from mpralib.exception import MPRAlibException, SequenceDesignException
-from mpralib.mpradata import MPRABarcodeData, MPRAData, MPRAOligoData
+from mpralib.mpradata import MPRABarcodeData, MPRAData, MPRAOligoData, as_dense_array
 
 
 def chromosome_map() -> pd.DataFrame:
+    """Returns the bundled chromosome aliases of GRCh37 (hg19) and GRCh38 (hg38).
 
+    The alias files are read once per process; every call returns a copy.
+
+    Returns:
+        DataFrame with the columns `ucsc`, `assembly`, `genbank`, `refseq` and `release`.
+    """
+    return _read_chromosome_map().copy()
+
+
+@functools.cache
+def _read_chromosome_map() -> pd.DataFrame:
     with files("mpralib.data").joinpath("hg19.chromAlias.txt").open() as chromAlias_hg19:
         df = pd.read_csv(chromAlias_hg19, sep="\t", header=None, comment="#", dtype="category")
     df["release"] = "GRCh37"
@@ -23,6 +46,24 @@ def chromosome_map() -> pd.DataFrame:
     return df
 
 
+@functools.cache
+def chromosome_aliases(release: str) -> Mapping[str, str]:
+    """Returns the UCSC chromosome name of each RefSeq contig of a genome release, e.g. to resolve the contigs of SPDI IDs.
+
+    The lookup table is built once per release and process, so contigs are resolved in constant time, e.g. with
+    `pd.Series.map`.
+
+    Args:
+        release (str): `GRCh37` or `GRCh38`.
+
+    Returns:
+        Read-only mapping from RefSeq accession to UCSC chromosome name. Empty for unknown releases.
+    """  # noqa: E501
+    df = _read_chromosome_map()
+    df = df[(df["release"] == release) & df["refseq"].notna()].drop_duplicates("refseq")
+    return MappingProxyType(dict(zip(df["refseq"].astype(str), df["ucsc"].astype(str))))
+
+
 def is_compressed_file(filepath: str) -> bool:
     """Check if a file is compressed (gzip or bgz).
 
@@ -71,7 +112,360 @@ def is_bgzf(filepath: str) -> bool:
     )
 
 
-def export_activity_file(mpradata: MPRAOligoData, output_file_path: str) -> None:
+_BGZF_BLOCK_SIZE = 0xFF00
+_BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+_EXPORT_CHUNK_SIZE = 1 << 16
+_SMALL_INTEGERS = np.array([str(i) for i in range(1 << 12)], dtype=object)
+_CSV_SPECIAL_CHARACTERS = '\t"\r\n'
+# largest end position covered by the binning scheme of .tbi indices
+_TABIX_MAX_POSITION = 1 << 29
+
+
+class BgzfWriter:
+    """Writes a BGZF (Blocked GNU Zip Format) compressed file.
+
+    BGZF files are gzip files made of independently compressed blocks of at most 64 KiB, so every gzip reader can read them
+    and tools like tabix can seek to a block. The empty end-of-file block is written on :meth:`close`.
+
+    Args:
+        file_path (str): Path of the output file.
+        compresslevel (int, optional): zlib compression level. Defaults to 6.
+    """  # noqa: E501
+
+    def __init__(self, file_path: str, compresslevel: int = 6):
+        self._file = open(file_path, "wb")
+        self._buffer = bytearray()
+        self._compresslevel = compresslevel
+        # uncompressed and compressed start of every block written so far
+        self._block_starts: list[int] = []
+        self._block_offsets: list[int] = []
+        self._size = 0
+
+    def write(self, data: bytes) -> int:
+        """Buffers data and writes every full block.
+
+        Args:
+            data (bytes): Uncompressed data.
+
+        Returns:
+            The number of bytes written.
+        """
+        self._buffer += data
+        while len(self._buffer) >= _BGZF_BLOCK_SIZE:
+            self._write_block(bytes(self._buffer[:_BGZF_BLOCK_SIZE]))
+            del self._buffer[:_BGZF_BLOCK_SIZE]
+        return len(data)
+
+    def tell(self) -> int:
+        """Returns the virtual offset of the next byte, i.e. the file offset of its block shifted by 16 bits plus its offset
+        within the uncompressed block."""  # noqa: E501
+        return (self._file.tell() << 16) | len(self._buffer)
+
+    def virtual_offsets(self, positions: ArrayLike) -> NDArray[np.uint64]:
+        """Converts positions in the uncompressed data to virtual offsets, e.g. of the lines of a file for a tabix index.
+
+        Args:
+            positions (ArrayLike): Positions in the uncompressed data that are already written to blocks, see
+                :meth:`flush_block`.
+
+        Returns:
+            The virtual offset of each position.
+        """  # noqa: E501
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = np.asarray(self._block_starts, dtype=np.int64)
+        blocks = np.searchsorted(starts, positions, side="right") - 1
+        offsets = np.asarray(self._block_offsets, dtype=np.uint64)[blocks]
+        return (offsets << np.uint64(16)) | (positions - starts[blocks]).astype(np.uint64)
+
+    def flush_block(self) -> None:
+        """Writes the buffered data as a block, so the next data starts a new block."""
+        if self._buffer:
+            self._write_block(bytes(self._buffer))
+            self._buffer.clear()
+
+    def close(self) -> None:
+        """Writes the remaining data and the end-of-file block and closes the file."""
+        if self._file.closed:
+            return
+        self.flush_block()
+        self._file.write(_BGZF_EOF)
+        self._file.close()
+
+    def __enter__(self) -> "BgzfWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _write_block(self, data: bytes) -> None:
+        compressor = zlib.compressobj(self._compresslevel, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        # gzip header with the BC extra field holding the total block size minus one
+        header = struct.pack("<4BI2BH2BHH", 0x1F, 0x8B, 8, 4, 0, 0, 0xFF, 6, 66, 67, 2, len(compressed) + 25)
+        self._block_starts.append(self._size)
+        self._block_offsets.append(self._file.tell())
+        self._size += len(data)
+        self._file.write(header + compressed + struct.pack("<2I", zlib.crc32(data), len(data)))
+
+
+def read_bgzf_block(f: IO[bytes], decompress: bool = True) -> tuple[bytes, int] | None:
+    """Reads the BGZF block at the current position of a file opened in binary mode.
+
+    The compressed size of the block is read from the BC subfield of the gzip header, so the file can be walked block by
+    block without decompressing it.
+
+    Args:
+        f (IO[bytes]): The BGZF file. Its position is moved to the next block.
+        decompress (bool, optional): Whether to decompress the block. Otherwise the data is empty. Defaults to True.
+
+    Returns:
+        The uncompressed data and the compressed size of the block, or None at the end of the file.
+
+    Raises:
+        MPRAlibException: If there is no valid BGZF block at the position.
+    """  # noqa: E501
+    offset = f.tell()
+    header = f.read(12)
+    if not header:
+        return None
+    if len(header) < 12 or header[:4] != b"\x1f\x8b\x08\x04":
+        raise MPRAlibException(f"Invalid BGZF block at offset {offset}.")
+    extra = f.read(struct.unpack("<H", header[10:12])[0])
+    block_size = None
+    pos = 0
+    while pos + 4 <= len(extra):
+        # subfields are an identifier, a length and the data, BC holds the block size
+        subfield_id, subfield_length = struct.unpack_from("<2sH", extra, pos)
+        if subfield_id == b"BC":
+            block_size = struct.unpack_from("<H", extra, pos + 4)[0] + 1
+        pos += 4 + subfield_length
+    if block_size is None:
+        raise MPRAlibException(f"Invalid BGZF block at offset {offset}.")
+    if not decompress:
+        f.seek(offset + block_size)
+        return b"", block_size
+    block = header + extra + f.read(block_size - 12 - len(extra))
+    return zlib.decompress(block, wbits=31), block_size
+
+
+def _open_output(output_file_path: str, bgzf: bool = False) -> IO[bytes] | BgzfWriter:
+    # compression is inferred from the file extension like pandas.DataFrame.to_csv does
+    if bgzf:
+        return BgzfWriter(output_file_path)
+    if output_file_path.endswith(".gz"):
+        return gzip.open(output_file_path, "wb")
+    if output_file_path.endswith(".bz2"):
+        return bz2.open(output_file_path, "wb")
+    if output_file_path.endswith(".xz"):
+        return lzma.open(output_file_path, "wb")
+    return open(output_file_path, "wb")
+
+
+def _format_column(
+    values: ArrayLike,
+    na_mask: NDArray[np.bool_] | None = None,
+    float_format: str | None = None,
+) -> NDArray[np.object_]:
+    """Formats the values of a column for a TSV file like :meth:`pandas.DataFrame.to_csv` does, but for whole arrays.
+
+    Args:
+        values (ArrayLike): Values of the column.
+        na_mask (NDArray[np.bool_] | None, optional): Values written as empty cells. Missing values are always empty.
+        float_format (str | None, optional): Format string of floats, e.g. `%.6f`. Defaults to the shortest representation.
+
+    Returns:
+        Object array of the formatted strings.
+    """  # noqa: E501
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        missing = np.isnan(values)
+        formatted = np.char.mod(float_format, values) if float_format else values.astype(str)
+    elif values.dtype.kind in "iu":
+        missing = None
+        # most counts are small, their strings are looked up instead of being formatted one by one
+        small = (values >= 0) & (values < len(_SMALL_INTEGERS))
+        formatted = np.empty(len(values), dtype=object)
+        formatted[small] = _SMALL_INTEGERS[values[small]]
+        formatted[~small] = values[~small].astype(str)
+    elif values.dtype.kind == "b":
+        missing = None
+        formatted = values.astype(str)
+    else:
+        missing = pd.isna(values)
+        # strings are kept as they are, other objects are converted like csv.writer does
+        formatted = values.astype(object) if pd.api.types.infer_dtype(values, skipna=True) == "string" else values.astype(str)
+        formatted[missing] = ""
+        # text with tabs, quotes or line breaks is quoted like csv.QUOTE_MINIMAL does
+        text = "".join(formatted.tolist())
+        if any(character in text for character in _CSV_SPECIAL_CHARACTERS):
+            formatted = np.array([_quote(value) for value in formatted.tolist()], dtype=object)
+
+    formatted = formatted.astype(object)
+    if na_mask is not None:
+        missing = na_mask if missing is None else missing | na_mask
+    if missing is not None:
+        formatted[missing] = ""
+    return formatted
+
+
+def _quote(value: str) -> str:
+    if any(character in value for character in _CSV_SPECIAL_CHARACTERS):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def _write_tsv(
+    output_file_path: str, header: list[str] | None, chunks: Iterable[list[NDArray[np.object_]]], bgzf: bool = False
+) -> None:
+    """Writes a TSV file chunk by chunk from formatted columns, see :func:`_format_column`.
+
+    Args:
+        output_file_path (str): Path of the output file. Compression is inferred from the extension unless `bgzf` is set.
+        header (list[str] | None): Column names, None to write no header.
+        chunks (Iterable[list[NDArray[np.object_]]]): Chunks of rows, each given as list of formatted columns.
+        bgzf (bool, optional): Write BGZF compressed output. Defaults to False.
+    """  # noqa: E501
+    with _open_output(output_file_path, bgzf) as f:
+        if header is not None:
+            f.write(("\t".join(header) + "\n").encode())
+        for columns in chunks:
+            lines = [line + "\n" for line in map("\t".join, zip(*(column.tolist() for column in columns)))]
+            f.write("".join(lines).encode())
+
+
+def _column_chunks(n_columns: int) -> Iterator[slice]:
+    for start in range(0, n_columns, _EXPORT_CHUNK_SIZE):
+        yield slice(start, min(start + _EXPORT_CHUNK_SIZE, n_columns))
+
+
+def _sliceable(counts: NDArray | sp.spmatrix) -> NDArray | sp.spmatrix:
+    # sparse counts are sliced by columns in every chunk, which is only cheap in CSC format
+    return counts.tocsc() if sp.issparse(counts) else counts
+
+
+def _tabix_bins(starts: NDArray[np.int64], ends: NDArray[np.int64]) -> NDArray[np.int64]:
+    # smallest bin of the UCSC binning scheme (levels of 2^14 to 2^29 bp) containing [start, end)
+    last = ends - 1
+    bins = np.zeros(len(starts), dtype=np.int64)
+    for shift, offset in [(26, 1), (23, 9), (20, 73), (17, 585), (14, 4681)]:
+        bins = np.where((starts >> shift) == (last >> shift), offset + (starts >> shift), bins)
+    return bins
+
+
+def _tabix_index(
+    chromosomes: ArrayLike,
+    starts: ArrayLike,
+    ends: ArrayLike,
+    begin_offsets: NDArray[np.uint64],
+    end_offsets: NDArray[np.uint64],
+) -> bytes:
+    """Builds a tabix index of a BED file sorted by chromosome and start.
+
+    Args:
+        chromosomes (ArrayLike): Chromosome of each line.
+        starts (ArrayLike): Zero-based start of each line.
+        ends (ArrayLike): Exclusive end of each line.
+        begin_offsets (NDArray[np.uint64]): Virtual offset of the beginning of each line in the BGZF file.
+        end_offsets (NDArray[np.uint64]): Virtual offset after each line.
+
+    Returns:
+        The uncompressed content of the `.tbi` file.
+    """
+    codes, names = pd.factorize(np.asarray(chromosomes, dtype=object))
+    starts = np.asarray(starts, dtype=np.int64)
+    # zero-length intervals, e.g. insertions, are indexed as one base like tabix does
+    ends = np.maximum(np.asarray(ends, dtype=np.int64), starts + 1)
+    bins = _tabix_bins(starts, ends)
+
+    encoded_names = b"".join(str(name).encode() + b"\0" for name in names)
+    # generic format with zero-based, half-open coordinates; columns 1-3 and "#" comment lines
+    index = [struct.pack("<4s8i", b"TBI\1", len(names), 0x10000, 1, 2, 3, ord("#"), 0, len(encoded_names)), encoded_names]
+    for code in range(len(names)):
+        lines = np.flatnonzero(codes == code)
+        if np.any(np.diff(lines) != 1) or np.any(np.diff(starts[lines]) < 0):
+            raise MPRAlibException(f"BED file is not sorted by chromosome and start at chromosome {names[code]}.")
+
+        # consecutive lines of a bin are merged into one chunk of the file
+        order = lines[np.argsort(bins[lines], kind="stable")]
+        new_chunk = np.ones(len(order), dtype=np.bool_)
+        new_chunk[1:] = (bins[order[1:]] != bins[order[:-1]]) | (order[1:] != order[:-1] + 1)
+        chunk_starts = np.flatnonzero(new_chunk)
+        chunk_ends = np.append(chunk_starts[1:], len(order)) - 1
+        chunk_bins = bins[order[chunk_starts]]
+        bin_values, bin_starts, bin_counts = np.unique(chunk_bins, return_index=True, return_counts=True)
+
+        index.append(struct.pack("<i", len(bin_values) + 1))
+        for bin_value, bin_start, bin_count in zip(bin_values.tolist(), bin_starts.tolist(), bin_counts.tolist()):
+            bin_chunks = slice(bin_start, bin_start + bin_count)
+            chunks = np.empty((bin_count, 2), dtype=np.uint64)
+            chunks[:, 0] = begin_offsets[order[chunk_starts[bin_chunks]]]
+            chunks[:, 1] = end_offsets[order[chunk_ends[bin_chunks]]]
+            index.append(struct.pack("<Ii", bin_value, bin_count) + chunks.astype("<u8").tobytes())
+        # pseudo-bin with the offsets and the number of lines of the chromosome
+        index.append(struct.pack("<IiQQQQ", 37450, 2, begin_offsets[lines[0]], end_offsets[lines[-1]], len(lines), 0))
+
+        # linear index: offset of the first line overlapping each 16 kbp window, empty windows use the previous offset
+        first_windows = starts[lines] >> 14
+        n_windows = ((ends[lines] - 1) >> 14) - first_windows + 1
+        window_lines = np.repeat(lines, n_windows)
+        windows = np.repeat(first_windows - (np.cumsum(n_windows) - n_windows), n_windows) + np.arange(n_windows.sum())
+        linear = np.zeros(windows.max() + 1, dtype=np.uint64)
+        first = np.unique(windows, return_index=True)[1]
+        linear[windows[first]] = begin_offsets[window_lines[first]]
+        filled = np.zeros(len(linear), dtype=np.bool_)
+        filled[windows] = True
+        linear = linear[np.maximum.accumulate(np.where(filled, np.arange(len(linear)), 0))]
+        linear[: windows.min()] = begin_offsets[lines[0]]
+        index.append(struct.pack("<i", len(linear)) + linear.astype("<u8").tobytes())
+    return b"".join(index)
+
+
+def export_bed_file(df: pd.DataFrame, output_file_path: str, float_format: str = "%.4f") -> None:
+    """Export a data frame as BED file without header, e.g. reporter genomic elements or variants.
+
+    Files ending with `.gz` or `.bgz` are BGZF compressed and indexed with tabix in the same pass; the index is written
+    to `<output_file_path>.tbi`. The first three columns must be chromosome, start and end, and the rows must be sorted
+    by chromosome and start. The binning scheme of `.tbi` indices only covers positions up to 2^29 (512 Mbp).
+
+    Args:
+        df (pd.DataFrame): BED columns.
+        output_file_path (str): The file path where the output BED file will be saved.
+        float_format (str, optional): Format string of float columns. Defaults to `%.4f`.
+
+    Raises:
+        MPRAlibException: If an indexed file is not sorted by chromosome and start or has positions beyond 2^29.
+    """  # noqa: E501
+    if not output_file_path.endswith((".gz", ".bgz")):
+        _write_tsv(output_file_path, None, _bed_chunks(df, float_format))
+        return
+    # zero-length intervals are indexed as one base, see _tabix_index
+    ends = np.maximum(df.iloc[:, 2].to_numpy(dtype=np.int64), df.iloc[:, 1].to_numpy(dtype=np.int64) + 1)
+    if np.any(ends > _TABIX_MAX_POSITION):
+        raise MPRAlibException(f"BED file has positions beyond {_TABIX_MAX_POSITION}, which a tabix (.tbi) index cannot hold.")
+
+    line_ends = []
+    with BgzfWriter(output_file_path) as writer:
+        for columns in _bed_chunks(df, float_format):
+            lines = [(line + "\n").encode() for line in map("\t".join, zip(*(column.tolist() for column in columns)))]
+            line_ends.append(np.fromiter(map(len, lines), dtype=np.int64, count=len(lines)))
+            writer.write(b"".join(lines))
+        writer.flush_block()
+
+        line_ends = np.cumsum(np.concatenate([np.zeros(0, dtype=np.int64)] + line_ends))
+        begin_offsets = writer.virtual_offsets(line_ends - np.diff(line_ends, prepend=0))
+        end_offsets = writer.virtual_offsets(line_ends)
+    index = _tabix_index(df.iloc[:, 0], df.iloc[:, 1], df.iloc[:, 2], begin_offsets, end_offsets)
+
+    with BgzfWriter(output_file_path + ".tbi") as writer:
+        writer.write(index)
+
+
+def _bed_chunks(df: pd.DataFrame, float_format: str) -> Iterator[list[NDArray[np.object_]]]:
+    for chunk in _column_chunks(len(df)):
+        yield [_format_column(df[column].to_numpy()[chunk], float_format=float_format) for column in df.columns]
+
+
+def export_activity_file(mpradata: MPRAOligoData, output_file_path: str, bgzf: bool = False) -> None:
     """Export activity data from an MPRAdata object to a tab-separated values (TSV) file.
 
     The function processes the grouped data from the MPRAdata object, extracts relevant information for each replicate, and writes the data to a TSV file. The output file contains columns for replicate, oligo name, DNA counts, RNA counts, normalized DNA counts, normalized RNA counts, log2 fold change, and the number of barcodes. Barcode filters, count sampling and barcode thresholds are applied.
@@ -79,53 +473,64 @@ def export_activity_file(mpradata: MPRAOligoData, output_file_path: str) -> None
     Args:
         mpradata (MPRAdata): An object containing MPRA (Massively Parallel Reporter Assay) data.
         output_file_path (str): The file path where the output TSV file will be saved.
+        bgzf (bool, optional): Write BGZF compressed output. Defaults to False.
     """  # noqa: E501
 
-    output = pd.DataFrame()
-
     # has to be run to calculate activities
     mpradata.activity
 
-    for replicate in mpradata.obs_names:
-        replicate_data = mpradata.data[replicate, :]
-        replicate_data = replicate_data[
-            :,
-            np.asarray(replicate_data.layers["barcode_counts"]) >= np.asarray(mpradata.barcode_threshold),
-        ]
-        df = {
-            "replicate": np.repeat(replicate, replicate_data.var_names.size),
-            "oligo_name": replicate_data.var["oligo"],
-            "dna_counts": np.asarray(replicate_data.layers["dna"])[0, :],
-            "rna_counts": np.asarray(replicate_data.layers["rna"])[0, :],
-            "dna_normalized": np.round(np.asarray(replicate_data.layers["dna_normalized"])[0, :], 4),
-            "rna_normalized": np.round(np.asarray(replicate_data.layers["rna_normalized"])[0, :], 4),
-            "log2FoldChange": np.round(np.asarray(replicate_data.layers["activity"])[0, :], 4),
-            "n_bc": np.asarray(replicate_data.layers["barcode_counts"])[0, :],
-        }
-        output = pd.concat([output, pd.DataFrame(df)], axis=0)
-
-    output.to_csv(output_file_path, sep="\t", index=False)
-
-
-def export_barcode_file(mpradata: MPRABarcodeData, output_file_path: str) -> None:
+    layers = {name: as_dense_array(mpradata.data.layers[name]) for name in ["dna", "rna", "barcode_counts"]}
+    for name in ["dna_normalized", "rna_normalized", "activity"]:
+        layers[name] = np.round(as_dense_array(mpradata.data.layers[name]), 4)
+    oligos = mpradata.oligos.to_numpy()
+
+    def chunks() -> Iterator[list[NDArray[np.object_]]]:
+        for idx, replicate in enumerate(mpradata.obs_names):
+            columns = np.flatnonzero(layers["barcode_counts"][idx] >= np.asarray(mpradata.barcode_threshold))
+            for chunk in _column_chunks(len(columns)):
+                chunk_columns = columns[chunk]
+                yield [
+                    np.full(len(chunk_columns), replicate, dtype=object),
+                    _format_column(oligos[chunk_columns]),
+                    *[
+                        _format_column(layers[name][idx, chunk_columns])
+                        for name in ["dna", "rna", "dna_normalized", "rna_normalized", "activity", "barcode_counts"]
+                    ],
+                ]
+
+    header = ["replicate", "oligo_name", "dna_counts", "rna_counts"]
+    header += ["dna_normalized", "rna_normalized", "log2FoldChange", "n_bc"]
+    _write_tsv(output_file_path, header, chunks(), bgzf)
+
+
+def export_barcode_file(mpradata: MPRABarcodeData, output_file_path: str, bgzf: bool = False) -> None:
     """Export barcode count data to a file.
 
-    This function takes an MPRAdata object and exports its barcode count data to a specified file path in tab-separated values (TSV) format. The output file will contain columns for barcodes, oligo names, and DNA/RNA counts for each replicate. Modifides counts (barcode filter/sampling) if applicable will be written.
+    This function takes an MPRAdata object and exports its barcode count data to a specified file path in tab-separated values (TSV) format. The output file will contain columns for barcodes, oligo names, and DNA/RNA counts for each replicate. Modifides counts (barcode filter/sampling) if applicable will be written. Zero counts are written as empty cells.
 
     Args:
         mpradata (MPRAdata): An object containing MPRA data, including barcodes, oligos, DNA counts, RNA counts, and replicates.
         output_file_path (str): The file path where the output TSV file will be saved.
+        bgzf (bool, optional): Write BGZF compressed output. Defaults to False.
     """  # noqa: E501
 
-    output = pd.DataFrame({"barcode": mpradata.var_names, "oligo_name": mpradata.oligos})
+    barcodes = mpradata.var_names.to_numpy()
+    oligos = mpradata.oligos.to_numpy()
+    counts = {"dna": _sliceable(mpradata.dna_counts), "rna": _sliceable(mpradata.rna_counts)}
+
+    def chunks() -> Iterator[list[NDArray[np.object_]]]:
+        for chunk in _column_chunks(mpradata.n_vars):
+            dense = {modality: as_dense_array(modality_counts[:, chunk]) for modality, modality_counts in counts.items()}
+            columns = [_format_column(barcodes[chunk]), _format_column(oligos[chunk])]
+            for idx in range(mpradata.n_obs):
+                for modality in ["dna", "rna"]:
+                    columns.append(_format_column(dense[modality][idx], dense[modality][idx] == 0))
+            yield columns
 
-    dna_counts = mpradata.dna_counts
-    rna_counts = mpradata.rna_counts
-    for i, replicate in enumerate(mpradata.obs_names):
-        output[f"dna_count_{replicate}"] = dna_counts[i]
-        output[f"rna_count_{replicate}"] = rna_counts[i]
-    output.replace(0, "", inplace=True)
-    output.to_csv(output_file_path, sep="\t", index=False)
+    header = ["barcode", "oligo_name"]
+    for replicate in mpradata.obs_names:
+        header += [f"dna_count_{replicate}", f"rna_count_{replicate}"]
+    _write_tsv(output_file_path, header, chunks(), bgzf)
 
 
 def export_counts_file(
@@ -133,48 +538,80 @@ def export_counts_file(
     output_file_path: str,
     normalized: bool = False,
     filter: np.ndarray | None = None,
+    bgzf: bool = False,
 ) -> None:
+    """Export DNA and RNA counts of all replicates to a TSV file.
+
+    Counts of unobserved barcodes or oligos, of oligos below the barcode threshold and of the optional filter are written
+    as empty cells; rows without any count are removed.
+
+    Args:
+        mpradata (MPRAData): Barcode or oligo data.
+        output_file_path (str): The file path where the output TSV file will be saved.
+        normalized (bool, optional): Write normalized instead of raw counts. Defaults to False.
+        filter (np.ndarray | None, optional): Boolean (replicates x columns) mask of counts to leave empty. Defaults to None.
+        bgzf (bool, optional): Write BGZF compressed output. Defaults to False.
+
+    Raises:
+        MPRAlibException: If the data is neither barcode nor oligo data.
+    """  # noqa: E501
     if isinstance(mpradata, MPRABarcodeData):
-        df = {"ID": mpradata.var_names}
+        labels = [mpradata.var_names.to_numpy(), mpradata.oligos.to_numpy()]
     elif isinstance(mpradata, MPRAOligoData):
-        df = {"ID": mpradata.oligos}
+        labels = [mpradata.oligos.to_numpy()]
     else:
         raise MPRAlibException(f"Invalid MPRA data type {type(mpradata)}. Expected MPRAOligoData or MPRABarcodeData.")
 
     if normalized:
-        dna_counts = mpradata.normalized_dna_counts.copy()
-        rna_counts = mpradata.normalized_rna_counts.copy()
+        counts = {"dna": mpradata.normalized_dna_counts, "rna": mpradata.normalized_rna_counts}
     else:
-        dna_counts = mpradata.dna_counts.copy()
-        rna_counts = mpradata.rna_counts.copy()
-
-    not_observed_mask = ~mpradata.observed
-    lower_bc_mask = mpradata.barcode_counts < mpradata.barcode_threshold
-    mask = [not_observed_mask, lower_bc_mask]
-    if filter is not None:
-        mask.append(filter)
-
-    dna_counts = np.ma.masked_array(dna_counts, mask=np.any(mask, axis=0))
-    rna_counts = np.ma.masked_array(rna_counts, mask=np.any(mask, axis=0))
+        counts = {"dna": mpradata.dna_counts, "rna": mpradata.rna_counts}
+    counts = {modality: _sliceable(modality_counts) for modality, modality_counts in counts.items()}
+    observed = _sliceable(mpradata.observed)
+    barcode_counts = _sliceable(mpradata.barcode_counts)
+    float_format = "%.6f" if normalized else "%.0f"
+
+    def chunks() -> Iterator[list[NDArray[np.object_]]]:
+        for chunk in _column_chunks(mpradata.n_vars):
+            mask = ~as_dense_array(observed[:, chunk])
+            mask |= as_dense_array(barcode_counts[:, chunk]) < mpradata.barcode_threshold
+            if filter is not None:
+                mask |= np.asarray(filter)[:, chunk]
+            dense = {modality: as_dense_array(modality_counts[:, chunk]) for modality, modality_counts in counts.items()}
+            yield _count_columns([label[chunk] for label in labels], dense, mask, float_format)
+
+    header = ["ID"] + (["oligo_name"] if isinstance(mpradata, MPRABarcodeData) else [])
+    for replicate in mpradata.obs_names:
+        header += [f"dna_count_{replicate}", f"rna_count_{replicate}"]
+    _write_tsv(output_file_path, header, chunks(), bgzf)
 
-    for idx, replicate in enumerate(mpradata.obs_names):
-        df["dna_count_" + replicate] = dna_counts[idx, :]
-        df["rna_count_" + replicate] = rna_counts[idx, :]
 
-    df = pd.DataFrame(df).set_index("ID")
-    df = df.map(lambda x: np.nan if isinstance(x, np.ma.core.MaskedConstant) else x)
-    nan_columns = df.isna().all(axis=1)
+def _count_columns(
+    labels: list[NDArray], counts: dict[str, NDArray], mask: NDArray[np.bool_], float_format: str
+) -> list[NDArray[np.object_]]:
+    """Formats a chunk of the counts file.
 
-    if isinstance(mpradata, MPRABarcodeData):
-        df.insert(0, "oligo_name", mpradata.oligos)
+    Args:
+        labels (list[NDArray]): Label columns of the chunk, i.e. the IDs and for barcode data the oligo names.
+        counts (dict[str, NDArray]): Dense DNA and RNA counts (replicates x columns) of the chunk.
+        mask (NDArray[np.bool_]): Counts (replicates x columns) written as empty cells.
+        float_format (str): Format string of the counts.
 
-    # remove IDs which are all zero
-    df = df[~nan_columns]
+    Returns:
+        The formatted columns of the rows with at least one count.
+    """
+    counts = {
+        modality: np.where(mask, np.nan, modality_counts) if modality_counts.dtype.kind == "f" else modality_counts
+        for modality, modality_counts in counts.items()
+    }
+    # remove IDs without any count
+    keep = ~(mask | np.isnan(counts["dna"])).all(axis=0) | ~(mask | np.isnan(counts["rna"])).all(axis=0)
 
-    if normalized:
-        df.to_csv(output_file_path, sep="\t", index=True, na_rep="", float_format="%.6f")
-    else:
-        df.to_csv(output_file_path, sep="\t", index=True, na_rep="", float_format="%.0f")
+    columns = [_format_column(label[keep]) for label in labels]
+    for idx in range(mask.shape[0]):
+        for modality in ["dna", "rna"]:
+            columns.append(_format_column(counts[modality][idx, keep], mask[idx, keep], float_format))
+    return columns
 
 
 def read_sequence_design_file(file_path: str) -> pd.DataFrame:
@@ -231,10 +668,10 @@ def read_sequence_design_file(file_path: str) -> pd.DataFrame:
     ).drop_duplicates()
 
     # Set specific columns as arrays
-    df["variant_class"] = df["variant_class"].fillna("[]").apply(ast.literal_eval)
-    df["variant_pos"] = df["variant_pos"].fillna("[]").apply(ast.literal_eval)
-    df["SPDI"] = df["SPDI"].fillna("[]").apply(ast.literal_eval)
-    df["allele"] = df["allele"].fillna("[]").apply(ast.literal_eval)
+    df["variant_class"] = _parse_list_column(df["variant_class"].fillna("[]"))
+    df["variant_pos"] = _parse_list_column(df["variant_pos"].fillna("[]"))
+    df["SPDI"] = _parse_list_column(df["SPDI"].fillna("[]"))
+    df["allele"] = _parse_list_column(df["allele"].fillna("[]"))
 
     # Set specific columns as categorical or integer types
     df["category"] = pd.Categorical(df["category"])
@@ -247,7 +684,7 @@ def read_sequence_design_file(file_path: str) -> pd.DataFrame:
     df.set_index("name", inplace=True)
 
     # Validate that the 'sequence' column contains only valid DNA characters
-    if np.any(~df["sequence"].str.match(r"^[ATGCatgc]+$", na=False)):
+    if not _is_dna(df["sequence"]):
         raise SequenceDesignException("sequence", file_path)
 
     # Validate that the 'class' column contains only 'variant', 'element', 'synthetic' or 'scrambled'
@@ -267,3 +704,45 @@ def read_sequence_design_file(file_path: str) -> pd.DataFrame:
         raise SequenceDesignException("class", file_path)
 
     return df
+
+
+# list literals of quoted strings without quotes, commas or escapes and of integers, as in sequence design files
+_LIST_ITEM = r"""(?:'[^'",\\\n]*'|"[^'",\\\n]*"|-?(?:0|[1-9][0-9]{0,17}))"""
+_SIMPLE_LIST_PATTERN = re.compile(rf"\[[ \t]*(?:{_LIST_ITEM}[ \t]*(?:,[ \t]*{_LIST_ITEM}[ \t]*)*,?[ \t]*)?\]")
+_DNA_BYTES = np.zeros(256, dtype=np.bool_)
+_DNA_BYTES[list(b"ACGTacgt")] = True
+
+
+def _parse_list_column(values: pd.Series) -> pd.Series:
+    """Parses a column of list literals like `['SNV', 'DEL']` or `[12, 13]`, identical to `ast.literal_eval` on each value.
+
+    Every distinct value is parsed once, simple lists of strings and integers with a plain split. Other values are parsed
+    with `ast.literal_eval` row by row, which also raises the same errors for invalid values.
+    """  # noqa: E501
+    codes, uniques = pd.factorize(values)
+    parsed = [_parse_simple_list(value) for value in uniques]
+    # every row gets its own list like from ast.literal_eval
+    return pd.Series(
+        [ast.literal_eval(value) if parsed[code] is None else list(parsed[code]) for code, value in zip(codes, values)],
+        index=values.index,
+        dtype=object,
+    )
+
+
+def _parse_simple_list(value: str) -> list | None:
+    if not _SIMPLE_LIST_PATTERN.fullmatch(value):
+        return None
+    items: list = []
+    for token in value[1:-1].split(","):
+        token = token.strip(" \t")
+        # the empty token of an empty list or a trailing comma is no item
+        if token:
+            items.append(token[1:-1] if token[0] in "'\"" else int(token))
+    return items
+
+
+def _is_dna(sequences: pd.Series) -> bool:
+    # every sequence is a non-empty string of A, C, G and T, checked on the bytes of all sequences at once
+    if sequences.isna().any() or (sequences.str.len() == 0).any():
+        return False
+    return bool(_DNA_BYTES[np.frombuffer("".join(sequences).encode("utf-8"), dtype=np.uint8)].all())
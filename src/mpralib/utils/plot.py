@@ -4,7 +4,7 @@ import pandas as pd
 import seaborn as sns
 from matplotlib.figure import Figure
 
-from mpralib.mpradata import Modality, MPRABarcodeData, MPRAData, MPRAOligoData
+from mpralib.mpradata import Modality, MPRABarcodeData, MPRAData, MPRAOligoData, as_dense_array
 
 custom_params = {"axes.spines.right": False, "axes.spines.top": False}
 custom_palette = sns.color_palette(["#72ACBF", "#BF2675", "#2ecc71", "#f1c40f", "#9b59b6"])
@@ -15,17 +15,17 @@ def correlation(data: MPRAData, layer: Modality, replicates=None) -> sns.PairGri
 
     counts = None
     if layer == Modality.DNA:
-        counts = data.dna_counts.copy()
+        counts = as_dense_array(data.dna_counts).copy()
     elif layer == Modality.RNA:
-        counts = data.rna_counts.copy()
+        counts = as_dense_array(data.rna_counts).copy()
     elif layer == Modality.RNA_NORMALIZED:
-        counts = data.normalized_rna_counts.copy()
+        counts = as_dense_array(data.normalized_rna_counts).copy()
     elif layer == Modality.DNA_NORMALIZED:
-        counts = data.normalized_dna_counts.copy()
+        counts = as_dense_array(data.normalized_dna_counts).copy()
     elif layer == Modality.ACTIVITY:
-        counts = data.activity.copy()
+        counts = as_dense_array(data.activity).copy()
 
-    counts = np.ma.masked_array(counts, mask=[data.barcode_counts < data.barcode_threshold])
+    counts = np.ma.masked_array(counts, mask=[as_dense_array(data.barcode_counts) < data.barcode_threshold])
 
     if replicates:
         idx = np.array([data.obs_names.get_loc(rep) for rep in replicates])
@@ -51,10 +51,10 @@ def correlation(data: MPRAData, layer: Modality, replicates=None) -> sns.PairGri
 
 def dna_vs_rna(data: MPRAData, replicates=None) -> sns.JointGrid:
 
-    counts_dna = data.normalized_dna_counts.copy()
-    counts_rna = data.normalized_rna_counts.copy()
+    counts_dna = as_dense_array(data.normalized_dna_counts).copy()
+    counts_rna = as_dense_array(data.normalized_rna_counts).copy()
 
-    mask = [data.barcode_counts < data.barcode_threshold]
+    mask = [as_dense_array(data.barcode_counts) < data.barcode_threshold]
 
     counts_dna = np.ma.masked_array(counts_dna, mask=mask)
     counts_rna = np.ma.masked_array(counts_rna, mask=mask)
@@ -142,17 +142,17 @@ def barcodes_outlier(data: MPRABarcodeData) -> Figure:
 
     # counts_dna = data.normalized_dna_counts.copy()
     # counts_rna = data.normalized_rna_counts.copy()
-    counts_dna = data.dna_counts.copy()
-    counts_rna = data.rna_counts.copy()
+    counts_dna = as_dense_array(data.dna_counts).copy()
+    counts_rna = as_dense_array(data.rna_counts).copy()
 
     counts_dna_sum = counts_dna.sum(axis=0)
     counts_rna_sum = counts_rna.sum(axis=0)
 
     mask = np.any(
         [
-            np.any(data.barcode_counts < data.barcode_threshold, axis=0),
+            np.any(as_dense_array(data.barcode_counts) < data.barcode_threshold, axis=0),
             np.any([counts_dna_sum <= 10, counts_rna_sum <= 0], axis=0),
-            ~np.any(data.observed, axis=0),
+            ~np.any(as_dense_array(data.observed), axis=0),
         ],
         axis=0,
     )
@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    # commands run with --cache must never write to the cache of the user
+    monkeypatch.setenv("MPRALIB_CACHE_DIR", str(tmp_path / "mpralib_cache"))
+    return tmp_path / "mpralib_cache"
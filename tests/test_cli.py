@@ -7,7 +7,7 @@ import pandas as pd
 import pytest
 from click.testing import CliRunner
 
-from mpralib.cli import _get_chr, cli
+from mpralib.cli import _get_chr, _get_chromosomes, cli
 
 
 @pytest.fixture(scope="module")
@@ -220,3 +220,13 @@ def test_get_chr_with_multiple_matches(logger):
     result = _get_chr(map_df, variant_id, logger)
     assert result in ["chr5a", "chr5b"]
     assert logger.messages == []
+
+
+def test_get_chromosomes(logger):
+    variant_ids = pd.Series(["NC_000001.11:12345:A:T", "NC_000003.13:54321:G:C", "NC_000002.12:1:G:C"])
+    result = _get_chromosomes(variant_ids, {"NC_000001.11": "chr1", "NC_000002.12": "chr2"}, logger)
+    assert result.iloc[0] == "chr1"
+    assert pd.isna(result.iloc[1])
+    assert result.iloc[2] == "chr2"
+    assert len(logger.messages) == 1
+    assert "Contig NC_000003.13 of SPDI NC_000003.13:54321:G:C not found" in logger.messages[0]
@@ -156,6 +156,56 @@ def test_filter_random_method_with_invalid_json(runner, files):
     assert "Could not parse --method-values as dict or JSON." in result.output
 
 
+def test_filter_sweep(runner, files):
+    result = runner.invoke(
+        cli,
+        [
+            "functional",
+            "filter",
+            "--input",
+            files["input"],
+            "--method",
+            "global",
+            "--sweep",
+            '{"times_zscore": [2, 3, 1000]}',
+            "--threads",
+            "2",
+            "--output-sweep",
+            files["output_activity"],
+        ],
+    )
+    assert result.exit_code == 0
+
+    with open(files["output_activity"]) as f:
+        lines = [line.rstrip("\n").split("\t") for line in f]
+    assert lines[0][:3] == ["times_zscore", "barcodes_removed", "observations_removed"]
+    assert lines[0][3:] == ["pearson_1_2", "pearson_1_3", "pearson_2_3"]
+    assert [line[0] for line in lines[1:]] == ["NA", "2.0", "3.0", "1000.0"]
+    assert int(lines[2][1]) > int(lines[3][1]) > 0
+    # nothing is removed with a very large z-score
+    assert lines[4][1:] == ["0", "0", *lines[1][3:]]
+
+
+def test_filter_sweep_with_output_files(runner, files):
+    result = runner.invoke(
+        cli,
+        [
+            "functional",
+            "filter",
+            "--input",
+            files["input"],
+            "--method",
+            "global",
+            "--sweep",
+            '{"times_zscore": [2, 3]}',
+            "--output-activity",
+            files["output_activity"],
+        ],
+    )
+    assert result.exit_code != 0
+    assert "--output-activity and --output-barcode cannot be used with --sweep." in result.output
+
+
 def test_filter_without_method_values(runner, files):
     result = runner.invoke(
         cli,
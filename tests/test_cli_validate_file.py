@@ -320,3 +320,18 @@ def test_reporter_sequence_design_invalid(runner, files):
     )
     assert result.exit_code != 0
     assert isinstance(result.exception, SystemExit)
+
+
+def test_validate_file_threads(runner, files):
+    for command, schema, expected_exit_code in [
+        ("reporter-experiment-barcode", ValidationSchema.REPORTER_EXPERIMENT_BARCODE, 0),
+        ("reporter-genomic-variant", ValidationSchema.REPORTER_GENOMIC_VARIANT, 0),
+        ("reporter-genomic-variant", "REPORTER_GENOMIC_VARIANT_FALSE", 1),
+    ]:
+        result = runner.invoke(cli, ["validate-file", "--threads", "2", command, "--input", files[schema]])
+        assert result.exit_code == expected_exit_code
+
+
+def test_validate_file_threads_invalid(runner):
+    result = runner.invoke(cli, ["validate-file", "--threads", "0", "reporter-experiment-barcode", "--input", __file__])
+    assert result.exit_code != 0
@@ -1,11 +1,38 @@
 import copy
+import os
 
 import anndata as ad
 import numpy as np
 import pandas as pd
 import pytest
-
-from mpralib.mpradata import BarcodeFilter, CountSampling, Modality, MPRABarcodeData, MPRAData, MPRAlibException, MPRAOligoData
+import scipy.sparse as sp
+from scipy.stats import pearsonr, spearmanr
+
+import mpralib.mpradata as mpradata_module
+from mpralib.mpradata import (
+    BarcodeFilter,
+    BarcodeFilterPipeline,
+    CountSampling,
+    Modality,
+    MPRABarcodeData,
+    MPRAData,
+    MPRAlibException,
+    MPRAOligoData,
+    _segment_medians,
+    allele_incidence,
+    as_dense_array,
+    build_variant_table,
+    correlation_matrix,
+    flatten_lists,
+    oligo_positions,
+    sample_counts,
+    segment_sum,
+    select_oligos,
+    variant_incidence,
+    variant_oligo_lists,
+)
+from mpralib.utils.index import build_oligo_index
+from mpralib.utils.io import BgzfWriter
 
 OBS = pd.DataFrame(index=["rep1", "rep2", "rep3"])
 VAR = pd.DataFrame(
@@ -107,6 +134,72 @@ def test_apply_count_sampling_aggregate_over_replicates(mpra_data):
     assert np.sum(dna_sampling) <= 11
 
 
+def test_apply_count_sampling_exact_total(mpra_data):
+    mpra_data.apply_count_sampling(CountSampling.RNA, total=10, seed=1)
+    rna_sampling = np.asarray(mpra_data.data.layers["rna_sampling"])
+    np.testing.assert_array_equal(rna_sampling.sum(axis=1), [10, 10, 10])
+    assert np.all(rna_sampling <= COUNTS_RNA)
+
+    mpra_data.drop_count_sampling()
+    mpra_data.apply_count_sampling(CountSampling.RNA, total=1000, seed=1)
+    np.testing.assert_array_equal(mpra_data.data.layers["rna_sampling"], COUNTS_RNA)
+
+
+def test_apply_count_sampling_seed(mpra_data, mpra_data_barcode):
+    mpra_data.apply_count_sampling(CountSampling.RNA_AND_DNA, proportion=0.5, seed=42)
+    mpra_data_barcode.apply_count_sampling(CountSampling.RNA_AND_DNA, proportion=0.5, seed=42)
+    np.testing.assert_array_equal(mpra_data.data.layers["rna_sampling"], mpra_data_barcode.data.layers["rna_sampling"])
+    np.testing.assert_array_equal(mpra_data.data.layers["dna_sampling"], mpra_data_barcode.data.layers["dna_sampling"])
+    assert mpra_data.data.uns["count_sampling"][0]["RNA_AND_DNA"]["seed"] == 42
+
+
+def test_apply_count_sampling_random_seed_is_recorded(mpra_data, mpra_data_barcode):
+    mpra_data.apply_count_sampling(CountSampling.RNA, proportion=0.5, total=20)
+    seed = mpra_data.data.uns["count_sampling"][0]["RNA"]["seed"]
+    assert isinstance(seed, int)
+    mpra_data_barcode.apply_count_sampling(CountSampling.RNA, proportion=0.5, total=20, seed=seed)
+    np.testing.assert_array_equal(mpra_data.data.layers["rna_sampling"], mpra_data_barcode.data.layers["rna_sampling"])
+
+
+def test_apply_count_sampling_sparse(barcode_file):
+    mpradata = MPRABarcodeData.from_file(barcode_file, sparse=True)
+    mpradata.apply_count_sampling(CountSampling.RNA_AND_DNA, proportion=0.5, total=500, seed=3)
+    rna_sampling = mpradata.data.layers["rna_sampling"]
+    assert sp.issparse(rna_sampling)
+    assert np.all(rna_sampling.data > 0)
+    assert np.all(rna_sampling.toarray() <= mpradata.raw_rna_counts.toarray())
+    assert np.all(np.asarray(rna_sampling.sum(axis=1)).ravel() <= 500)
+
+
+def test_sample_counts():
+    rng = np.random.default_rng(0)
+    counts = np.array([[5, 0, 20], [100, 3, 1]])
+
+    draws = sample_counts(counts, rng, total=30, size=50)
+    assert draws.shape == (50, 2, 3)
+    assert draws.dtype == np.int32
+    np.testing.assert_array_equal(draws.sum(axis=(1, 2)), np.full(50, 30))
+    assert np.all(draws <= counts)
+    assert np.all(draws[:, 0, 1] == 0)
+
+    thinned = sample_counts(counts, rng, proportion=0.5, size=1000)
+    assert np.all(thinned <= counts)
+    np.testing.assert_allclose(thinned.mean(axis=0), counts * 0.5, atol=1.5)
+
+    assert sample_counts(counts, rng, proportion=1.0).tolist() == counts.tolist()
+    np.testing.assert_array_equal(
+        sample_counts(counts, np.random.default_rng(7), proportion=0.3, total=10, size=5),
+        sample_counts(counts, np.random.default_rng(7), proportion=0.3, total=10, size=5),
+    )
+
+
+def test_sample_counts_large_population():
+    counts = np.array([600_000_000, 500_000_000, 10])
+    sampled = sample_counts(counts, np.random.default_rng(0), total=1000, size=2)
+    np.testing.assert_array_equal(sampled.sum(axis=1), [1000, 1000])
+    assert np.all(sampled <= counts)
+
+
 def test_barcode_counts(mpra_data):
     supporting_barcodes = mpra_data.barcode_counts
     expected_barcodes = np.array([[2, 2, 1, 2, 2], [2, 2, 1, 2, 2], [2, 2, 1, 2, 2]])
@@ -382,6 +475,49 @@ def test_correlation(mpra_corr_data):
     assert "spearman_correlation_log2FoldChange" in mpra_corr_data.data.obsp
 
 
+def test_correlation_only_requested_method(mpra_corr_data):
+    mpra_corr_data.correlation(method="spearman", count_type=Modality.RNA_NORMALIZED)
+    assert "spearman_correlation_rna_normalized" in mpra_corr_data.data.obsp
+    assert "spearman_correlation_rna_normalized_pvalue" in mpra_corr_data.data.obsp
+    assert "pearson_correlation_rna_normalized" not in mpra_corr_data.data.obsp
+
+    mpra_corr_data.correlation(method="pearson", count_type=Modality.RNA_NORMALIZED)
+    assert "pearson_correlation_rna_normalized" in mpra_corr_data.data.obsp
+
+
+@pytest.mark.parametrize("method", ["pearson", "spearman"])
+def test_correlation_matrix_matches_scipy(method):
+    rng = np.random.default_rng(1)
+    data = rng.normal(size=(5, 60))
+    data[:, :20] = np.round(data[:, :20])  # ties
+    data[rng.random(data.shape) < 0.2] = np.nan
+    data[4] = 1.0  # constant row
+
+    correlation, pvalue = correlation_matrix(data, method)
+
+    scipy_method = pearsonr if method == "pearson" else spearmanr
+    for i in range(4):
+        for j in range(4):
+            mask = ~np.isnan(data[i]) & ~np.isnan(data[j])
+            expected_correlation, expected_pvalue = scipy_method(data[i, mask], data[j, mask])
+            np.testing.assert_allclose(correlation[i, j], expected_correlation, atol=1e-12)
+            np.testing.assert_allclose(pvalue[i, j], expected_pvalue, rtol=1e-6, atol=1e-12)
+    assert np.all(np.isnan(correlation[4]))
+    assert np.all(np.isnan(pvalue[:, 4]))
+
+
+def test_correlation_matrix_too_few_observations():
+    data = np.array([[1.0, 2.0, np.nan, np.nan], [np.nan, 3.0, 1.0, 2.0], [2.0, 1.0, 3.0, 4.0]])
+    correlation, pvalue = correlation_matrix(data, "pearson")
+    assert np.isnan(correlation[0, 1])
+    assert np.isnan(pvalue[0, 1])
+    np.testing.assert_allclose(correlation[0, 2], -1.0)
+    assert pvalue[0, 2] == 1.0
+
+    with pytest.raises(ValueError):
+        correlation_matrix(data, "kendall")
+
+
 def test_pearson_correlation(mpra_corr_data):
     x = mpra_corr_data.correlation(method="pearson", count_type=Modality.ACTIVITY)
     y = mpra_corr_data.correlation(method="pearson", count_type=Modality.RNA_NORMALIZED)
@@ -441,6 +577,38 @@ def test_chapman_complexity(mpra_complexity_data):
     np.testing.assert_equal(complexity, np.array([[4, 5, 5], [5, 5, 5], [5, 5, 3]]))
 
 
+@pytest.mark.parametrize("sparse", [False, True])
+def test_complexity_chunked(monkeypatch, mpra_complexity_data, sparse):
+    monkeypatch.setattr("mpralib.mpradata._GRAM_CHUNK_SIZE", 2)
+    if sparse:
+        for layer in ["rna", "dna"]:
+            mpra_complexity_data.data.layers[layer] = sp.csr_matrix(mpra_complexity_data.data.layers[layer])
+    np.testing.assert_equal(mpra_complexity_data.complexity(), np.array([[4, 5, 6], [5, 5, 5], [6, 5, 3]]))
+    np.testing.assert_equal(mpra_complexity_data.complexity(method="chapman"), np.array([[4, 5, 5], [5, 5, 5], [5, 5, 3]]))
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_complexity_curve(mpra_complexity_data, sparse):
+    if sparse:
+        for layer in ["rna", "dna"]:
+            mpra_complexity_data.data.layers[layer] = sp.csr_matrix(mpra_complexity_data.data.layers[layer])
+    curve = mpra_complexity_data.complexity_curve([0.0, 0.3, 0.7, 1.0], seed=1)
+    assert curve.shape == (4, 3, 3)
+    np.testing.assert_equal(curve[0], np.zeros((3, 3)))
+    np.testing.assert_equal(curve[-1], mpra_complexity_data.complexity())
+    np.testing.assert_equal(curve, mpra_complexity_data.complexity_curve([0.0, 0.3, 0.7, 1.0], seed=1))
+    # every barcode is kept at a fraction just below 1 with counts of at least 2
+    np.testing.assert_equal(
+        mpra_complexity_data.complexity_curve([0.999999], method="chapman", seed=2)[0],
+        mpra_complexity_data.complexity(method="chapman"),
+    )
+
+    with pytest.raises(ValueError):
+        mpra_complexity_data.complexity_curve([1.5])
+    with pytest.raises(ValueError):
+        mpra_complexity_data.complexity_curve([0.5], method="unknown")
+
+
 def test_fail_complexity(mpra_complexity_data):
     with pytest.raises(ValueError):
         mpra_complexity_data.complexity(method="unknown")
@@ -484,6 +652,33 @@ def test_read_and_write_with_modifications(tmp_path, mpra_data):
     assert data.pseudo_count == 0
 
 
+def test_read_and_write_var_filter(tmp_path, mpra_data):
+    out_path = tmp_path / "bc_data_filter.h5ad"
+    mpra_data.var_filter = FILTER
+    mpra_data.write(out_path)
+
+    data = MPRABarcodeData.read(out_path)
+    assert data.data.varm["var_filter"].dtype == np.uint8
+    assert data.data.varm["var_filter"].shape == (mpra_data.n_vars, 1)
+    np.testing.assert_array_equal(data.var_filter, FILTER)
+    np.testing.assert_array_equal(data.rna_counts, mpra_data.rna_counts)
+
+
+def test_var_filter_packed(mpra_data):
+    mask = np.zeros((mpra_data.n_vars, mpra_data.n_obs), dtype=bool)
+    mask[0, 2] = True
+    mask[4, 0] = True
+    mpra_data.var_filter = mask
+    np.testing.assert_array_equal(mpra_data.var_filter, mask)
+
+    mpra_data.apply_barcode_filter(BarcodeFilter.MAX_COUNT, params={"rna_max_count": 9})
+    expected = mask | (COUNTS_RNA > 9).T
+    np.testing.assert_array_equal(mpra_data.var_filter, expected)
+    np.testing.assert_array_equal(mpra_data.rna_counts, COUNTS_RNA * ~expected.T)
+    sparse_filtered = mpra_data._apply_var_filter(sp.csr_matrix(COUNTS_RNA))
+    np.testing.assert_array_equal(as_dense_array(sparse_filtered), COUNTS_RNA * ~expected.T)
+
+
 def test_modality_from_string():
     assert Modality.from_string("DNA") == Modality.DNA
     assert Modality.from_string("dna") == Modality.DNA
@@ -634,6 +829,27 @@ def test_barcode_filter_oligo_specific_outliers_with_outliers(mpra_data):
     np.testing.assert_array_equal(mask, expected)
 
 
+@pytest.mark.parametrize("sparse", [False, True])
+def test_barcode_filter_zscore_outliers_match_pandas(sparse):
+    rng = np.random.default_rng(3)
+    rna = (rng.negative_binomial(2, 0.2, (3, 400)) * (rng.random((3, 400)) < 0.8)).astype(np.int32)
+    dna = rng.poisson(2, (3, 400)).astype(np.int32)
+    oligos = pd.Categorical(rng.integers(0, 40, 400).astype(str))
+    var = pd.DataFrame({"oligo": oligos}, index=[f"barcode{i}" for i in range(400)])
+    layers = {"rna": sp.csr_matrix(rna) if sparse else rna, "dna": sp.csr_matrix(dna) if sparse else dna}
+    mpra_data = MPRABarcodeData(ad.AnnData(X=rna.copy(), obs=OBS.copy(), var=var, layers=layers))
+
+    df_rna = pd.DataFrame(rna.T).where(as_dense_array(mpra_data.observed).T)
+    global_expected = ((df_rna - df_rna.mean(axis=0)) / df_rna.std(axis=0)).abs() > 1.3
+    grouped = df_rna.groupby(np.asarray(oligos))
+    oligo_expected = ((df_rna - grouped.transform("mean")) / grouped.transform("std").fillna(0).replace(0, 1)).abs() > 1.3
+
+    mask = mpra_data._barcode_filter_global_outliers(times_zscore=1.3)
+    np.testing.assert_array_equal(mask, global_expected.to_numpy())
+    mask = mpra_data._barcode_filter_oligo_specific_outliers(times_zscore=1.3)
+    np.testing.assert_array_equal(mask, oligo_expected.to_numpy())
+
+
 def test_barcode_filter_oligo_specific_outliers_all_zero(mpra_data):
     # All RNA counts zero, should not raise error and all should be False
     mpra_data.data.var["oligo"] = ["oligo1", "oligo1", "oligo3", "oligo3", "oligo3"]
@@ -756,6 +972,251 @@ def test_mprabarcode_from_file(tmp_path):
     assert data.data.uns["normalized"] is False
 
 
+def test_mprabarcode_from_file_chunked(tmp_path):
+    file_path = tmp_path / "test_bc.tsv"
+    df = pd.DataFrame(
+        {
+            "barcode": ["barcode1", "barcode2", "barcode3", "barcode4", "barcode5"],
+            "oligo_name": ["oligo2", "oligo1", "oligo2", "oligo3", "oligo1"],
+            "dna_count_rep1": [10, None, 30, 5, 7],
+            "rna_count_rep1": [1, None, 3, 0, 2],
+            "dna_count_rep2": [40, 50, None, 8, 9],
+            "rna_count_rep2": [4, 5, None, 1, 0],
+        }
+    )
+    df.to_csv(file_path, sep="\t", index=False)
+
+    data = MPRABarcodeData.from_file(str(file_path))
+    for sparse in [False, True]:
+        chunked = MPRABarcodeData.from_file(str(file_path), sparse=sparse, chunk_size=2)
+        np.testing.assert_array_equal(as_dense_array(chunked.raw_rna_counts), data.raw_rna_counts)
+        np.testing.assert_array_equal(as_dense_array(chunked.raw_dna_counts), data.raw_dna_counts)
+        pd.testing.assert_series_equal(chunked.data.var["oligo"], data.data.var["oligo"])
+
+    assert data.raw_dna_counts.dtype == np.int32
+    np.testing.assert_array_equal(data.raw_dna_counts, [[10, 0, 30, 5, 7], [40, 50, 0, 8, 9]])
+    assert list(data.obs_names) == ["rep1", "rep2"]
+    assert list(data.var_names) == ["barcode1", "barcode2", "barcode3", "barcode4", "barcode5"]
+    assert list(data.data.var["oligo"].cat.categories) == ["oligo2", "oligo1", "oligo3"]
+    assert list(data.oligos) == ["oligo2", "oligo1", "oligo2", "oligo3", "oligo1"]
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_mprabarcode_from_file_selection(tmp_path, indexed):
+    file_path = str(tmp_path / "test_bc.tsv.gz")
+    df = pd.DataFrame(
+        {
+            "barcode": [f"barcode{i}" for i in range(8)],
+            "oligo_name": ["oligo2", "oligo2", "oligo1", "oligo3", "oligo1", "oligo2", "oligo4", "oligo3"],
+            "dna_count_rep1": [10, None, 30, 5, 7, 1, 2, 3],
+            "rna_count_rep1": [1, None, 3, 0, 2, 4, 5, 6],
+            "dna_count_rep2": [40, 50, None, 8, 9, 1, 1, 1],
+            "rna_count_rep2": [4, 5, None, 1, 0, 2, 2, 2],
+        }
+    )
+    with BgzfWriter(file_path) as f:
+        f.write(df.to_csv(sep="\t", index=False).encode())
+    if indexed:
+        build_oligo_index(file_path)
+    sequence_design = pd.DataFrame(
+        {
+            "category": ["element", "variant", "variant", "element"],
+            "chr": ["chr1", "chr1", "chr2", "chr1"],
+            "start": pd.array([100, 200, 100, 400], dtype="Int64"),
+            "end": pd.array([200, 300, 200, 500], dtype="Int64"),
+        },
+        index=pd.Index(["oligo1", "oligo2", "oligo3", "oligo4"], name="name"),
+    )
+
+    data = MPRABarcodeData.from_file(file_path)
+    for selection, oligos in [
+        ({"oligos": ["oligo3", "oligo2", "unknown"]}, ["oligo2", "oligo3"]),
+        ({"category": "variant", "sequence_design": sequence_design}, ["oligo2", "oligo3"]),
+        ({"region": "chr1:150-450", "sequence_design": sequence_design}, ["oligo1", "oligo2", "oligo4"]),
+        ({"oligos": ["oligo1", "oligo2"], "category": "variant", "sequence_design": sequence_design}, ["oligo2"]),
+    ]:
+        mask = data.oligos.isin(oligos).to_numpy()
+        for sparse in [False, True]:
+            selected = MPRABarcodeData.from_file(file_path, sparse=sparse, chunk_size=3, **selection)
+            assert list(selected.var_names) == list(data.var_names[mask])
+            assert list(selected.oligos) == list(data.oligos[mask])
+            assert list(selected.data.var["oligo"].cat.categories) == list(pd.unique(data.oligos[mask]))
+            np.testing.assert_array_equal(as_dense_array(selected.raw_rna_counts), data.raw_rna_counts[:, mask])
+            np.testing.assert_array_equal(as_dense_array(selected.raw_dna_counts), data.raw_dna_counts[:, mask])
+
+    with pytest.raises(ValueError):
+        MPRABarcodeData.from_file(file_path, category="variant")
+    with pytest.raises(ValueError):
+        MPRABarcodeData.from_file(file_path, oligos=["unknown"])
+    with pytest.raises(ValueError):
+        select_oligos(sequence_design, region="chr1")
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_mprabarcode_oligo_data_unsorted(tmp_path, sparse):
+    file_path = tmp_path / "test_bc.tsv"
+    df = pd.DataFrame(
+        {
+            "barcode": ["barcode1", "barcode2", "barcode3", "barcode4", "barcode5"],
+            "oligo_name": ["oligo2", "oligo1", "oligo2", "oligo3", "oligo1"],
+            "dna_count_rep1": [10, None, 30, 5, 7],
+            "rna_count_rep1": [1, None, 3, 0, 2],
+            "dna_count_rep2": [40, 50, None, 8, 9],
+            "rna_count_rep2": [4, 5, None, 1, 0],
+        }
+    )
+    df.to_csv(file_path, sep="\t", index=False)
+
+    data = MPRABarcodeData.from_file(str(file_path), sparse=sparse)
+    oligo_data = data.oligo_data
+
+    assert list(oligo_data.oligos) == ["oligo2", "oligo1", "oligo3"]
+    np.testing.assert_array_equal(oligo_data.raw_dna_counts, [[40, 7, 5], [40, 59, 8]])
+    np.testing.assert_array_equal(oligo_data.raw_rna_counts, [[4, 2, 0], [4, 5, 1]])
+    np.testing.assert_array_equal(oligo_data.barcode_counts, [[2, 1, 1], [1, 2, 1]])
+
+
+def test_segment_sum():
+    counts = np.array([[1, 2, 3, 4], [5, 6, 7, 8]])
+    codes = np.array([1, 0, 1, -1])
+
+    expected = [[2, 4], [6, 12]]
+    np.testing.assert_array_equal(segment_sum(counts, codes, 2), expected)
+    np.testing.assert_array_equal(segment_sum(sp.csr_matrix(counts), codes, 2), expected)
+    np.testing.assert_array_equal(segment_sum(counts, codes, 3), [[2, 4, 0], [6, 12, 0]])
+
+
+def test_oligo_positions():
+    oligos = pd.Series(["a", "b", None, "a", "c"])
+    names = ["c", "x", "a", "b", None, "a"]
+
+    expected = [(i, j) for i, name in enumerate(names) for j in np.flatnonzero(oligos == name)]
+    matches, positions = oligo_positions(oligos, names)
+    assert list(zip(matches, positions)) == expected
+    assert [len(result) for result in oligo_positions(pd.Series([], dtype=object), names)] == [0, 0]
+
+
+def test_variant_incidence():
+    oligos = pd.Series(["a", "b", "c", "a"])
+    oligo_lists = pd.Series([["a"], ["b", "c", "b"], [], ["d"]], index=["v1", "v2", "v3", "v4"])
+
+    incidence = variant_incidence(oligo_lists, oligos)
+
+    assert incidence.shape == (4, 4)
+    for i, oligo_list in enumerate(oligo_lists):
+        np.testing.assert_array_equal(incidence[i].toarray().ravel(), oligos.isin(oligo_list))
+
+
+def test_build_variant_table():
+    table = build_variant_table(
+        ["v2", "v1", "v2", "v1", "v3", "v2", np.nan], ["alt", "ref", "ref", "alt", "ref", "alt", "ref"], [0, 1, 2, 3, 4, 5, 6]
+    )
+
+    assert table["variant_id"].cat.categories.tolist() == ["v1", "v2"]
+    assert table["variant_id"].tolist() == ["v1", "v1", "v2", "v2", "v2"]
+    assert table["allele"].tolist() == ["ref", "alt", "alt", "ref", "alt"]
+    assert table["oligo_code"].tolist() == [1, 3, 0, 2, 5]
+
+    variant_map = variant_oligo_lists(table, ["a", "b", "c", "d", "e", "f", "g"])
+    assert variant_map.index.name == "ID"
+    assert variant_map.to_dict("index") == {"v1": {"REF": ["b"], "ALT": ["d"]}, "v2": {"REF": ["c"], "ALT": ["a", "f"]}}
+
+    np.testing.assert_array_equal(allele_incidence(table, "alt", 7).toarray(), [[0, 0, 0, 1, 0, 0, 0], [1, 0, 0, 0, 0, 1, 0]])
+
+
+def test_flatten_lists():
+    values, offsets = flatten_lists([["a", "b"], [], "c", np.nan, ("d",)])
+
+    assert values.tolist() == ["a", "b", "c", "d"]
+    assert offsets.tolist() == [0, 2, 2, 3, 3, 4]
+
+
+@pytest.fixture
+def barcode_file():
+    return os.path.join(os.path.dirname(__file__), "data", "reporter_experiment_barcode.input.head101.tsv.gz")
+
+
+def test_mprabarcode_from_file_sparse(barcode_file):
+    dense = MPRABarcodeData.from_file(barcode_file)
+    sparse = MPRABarcodeData.from_file(barcode_file, sparse=True)
+
+    assert not dense.is_sparse
+    assert sparse.is_sparse
+    assert sp.issparse(sparse.data.layers["rna"])
+    assert sp.issparse(sparse.data.layers["dna"])
+    np.testing.assert_array_equal(sparse.raw_rna_counts.toarray(), dense.raw_rna_counts)
+    np.testing.assert_array_equal(sparse.raw_dna_counts.toarray(), dense.raw_dna_counts)
+    assert list(sparse.var_names) == list(dense.var_names)
+    assert list(sparse.obs_names) == list(dense.obs_names)
+
+
+def test_sparse_properties_match_dense(barcode_file):
+    dense = MPRABarcodeData.from_file(barcode_file)
+    sparse = MPRABarcodeData.from_file(barcode_file, sparse=True)
+    var_filter = np.zeros((dense.n_vars, dense.n_obs), dtype=bool)
+    var_filter[::7, 0] = True
+    dense.var_filter = var_filter
+    sparse.var_filter = var_filter
+
+    for prop in ["rna_counts", "dna_counts", "observed", "normalized_rna_counts", "normalized_dna_counts"]:
+        assert sp.issparse(getattr(sparse, prop))
+        np.testing.assert_allclose(getattr(sparse, prop).toarray(), getattr(dense, prop))
+
+    observed = dense.observed
+    kept = observed & ~var_filter.T
+    np.testing.assert_allclose(sparse.activity.toarray()[kept], dense.activity[kept])
+    np.testing.assert_array_equal(sparse.barcode_counts.toarray()[observed], dense.barcode_counts[observed])
+
+
+def test_sparse_oligo_data_matches_dense(barcode_file):
+    dense = MPRABarcodeData.from_file(barcode_file)
+    sparse = MPRABarcodeData.from_file(barcode_file, sparse=True)
+    dense.apply_barcode_filter(BarcodeFilter.MIN_COUNT, {"rna_min_count": 2})
+    sparse.apply_barcode_filter(BarcodeFilter.MIN_COUNT, {"rna_min_count": 2})
+
+    dense_oligo_data = dense.oligo_data
+    sparse_oligo_data = sparse.oligo_data
+
+    assert list(sparse_oligo_data.var_names) == list(dense_oligo_data.var_names)
+    np.testing.assert_array_equal(sparse_oligo_data.rna_counts, dense_oligo_data.rna_counts)
+    np.testing.assert_array_equal(sparse_oligo_data.dna_counts, dense_oligo_data.dna_counts)
+    np.testing.assert_array_equal(sparse_oligo_data.barcode_counts, dense_oligo_data.barcode_counts)
+    np.testing.assert_allclose(sparse_oligo_data.activity, dense_oligo_data.activity)
+
+
+@pytest.mark.parametrize(
+    "barcode_filter, params",
+    [
+        (BarcodeFilter.MIN_BCS_PER_OLIGO, {"threshold": 3}),
+        (BarcodeFilter.MIN_COUNT, {"rna_min_count": 2, "dna_min_count": 1}),
+        (BarcodeFilter.MAX_COUNT, {"rna_max_count": 2}),
+        (BarcodeFilter.GLOBAL, {"times_zscore": 1.5}),
+        (BarcodeFilter.OLIGO_SPECIFIC, {"times_zscore": 1.0}),
+        (BarcodeFilter.LARGE_EXPRESSION, {"times_activity": 0.5}),
+        (BarcodeFilter.MAD, {"n_bins": 5}),
+    ],
+)
+def test_sparse_barcode_filter_matches_dense(barcode_file, barcode_filter, params):
+    dense = MPRABarcodeData.from_file(barcode_file)
+    sparse = MPRABarcodeData.from_file(barcode_file, sparse=True)
+    dense.barcode_threshold = 2
+    sparse.barcode_threshold = 2
+
+    mask = dense._barcode_filter(barcode_filter, params)
+    assert mask.any()
+    np.testing.assert_array_equal(sparse._barcode_filter(barcode_filter, params), mask)
+
+
+def test_sparse_read_and_write(tmp_path, barcode_file):
+    data = MPRABarcodeData.from_file(barcode_file, sparse=True)
+    out_path = tmp_path / "bc_data_sparse.h5ad"
+    data.write(out_path)
+
+    read_data = MPRABarcodeData.read(out_path)
+    assert read_data.is_sparse
+    np.testing.assert_array_equal(read_data.rna_counts.toarray(), data.rna_counts.toarray())
+
+
 def test_mpraoligo_from_file(tmp_path):
     # Create a mock AnnData file for oligo-level data
     X = np.array([[1, 2], [3, 4]])
@@ -839,6 +1300,65 @@ def test_data_property_setter(mpra_data):
     assert np.all(mpra_data.data.layers["dna"] == 1)
 
 
+def test_derived_cache(mpra_data):
+    rna_counts = mpra_data.rna_counts
+    assert mpra_data.rna_counts is rna_counts
+    assert not rna_counts.flags.writeable
+    assert mpra_data.derived_cache_info["hits"] == 1
+
+    activity = mpra_data.activity
+    assert mpra_data.activity is activity
+
+    # replacing the var filter invalidates all filtered matrices
+    filter_mask = np.zeros_like(mpra_data.var_filter, dtype=bool)
+    filter_mask[0, 0] = True
+    mpra_data.var_filter = filter_mask
+    assert mpra_data.rna_counts[0, 0] == 0
+    assert mpra_data.activity is not activity
+
+    # normalized counts depend on the scaling
+    normalized_rna_counts = mpra_data.normalized_rna_counts
+    mpra_data.scaling = 10
+    np.testing.assert_allclose(mpra_data.normalized_rna_counts, normalized_rna_counts / 1e5)
+
+    # sampled counts replace the raw counts
+    observed = mpra_data.observed
+    mpra_data.apply_count_sampling(CountSampling.RNA_AND_DNA, proportion=0.0, seed=1)
+    assert mpra_data.observed is not observed
+    assert not mpra_data.observed.any()
+
+    # replacing a layer in AnnData directly is detected as well
+    mpra_data.drop_count_sampling()
+    mpra_data.data.layers["rna"] = np.zeros_like(COUNTS_RNA)
+    np.testing.assert_array_equal(mpra_data.rna_counts, 0)
+
+    info = mpra_data.derived_cache_info
+    assert info["misses"] > 0 and info["size"] > 0
+    mpra_data.clear_derived_cache()
+    assert mpra_data.derived_cache_info["size"] == 0
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_unfiltered_counts_share_memory(barcode_file, sparse):
+    mpradata = MPRABarcodeData.from_file(barcode_file, sparse=sparse)
+    layer = mpradata.data.layers["rna"]
+    rna_counts = mpradata.rna_counts
+
+    # without a filter the counts are a read-only view of the layer, not a copy
+    if sparse:
+        assert np.shares_memory(rna_counts.data, layer.data)
+        assert not rna_counts.data.flags.writeable and layer.data.flags.writeable
+    else:
+        assert np.shares_memory(rna_counts, layer)
+        assert not rna_counts.flags.writeable and layer.flags.writeable
+
+    var_filter = np.zeros((mpradata.n_vars, mpradata.n_obs), dtype=bool)
+    var_filter[0, :] = True
+    mpradata.var_filter = var_filter
+    filtered = mpradata.rna_counts
+    assert not np.shares_memory(filtered.data if sparse else filtered, layer.data if sparse else layer)
+
+
 @pytest.mark.parametrize(
     "has_sampling",
     [False, True],
@@ -1017,6 +1537,37 @@ def test_mpra_data_variant_map(mpra_data):
     assert "ALT" in variant_map.columns
 
 
+def test_mpra_data_sequence_design_lists(mpra_data):
+    df = pd.DataFrame(
+        {
+            "category": ["cat1", "cat2", "cat3"],
+            "class": ["class1", "class2", "class3"],
+            "ref": ["ref1", "ref2", "ref3"],
+            "chr": ["chr1", "chr2", "chr3"],
+            "start": [1, 2, 3],
+            "end": [10, 20, 30],
+            "strand": ["+", "-", "+"],
+            "variant_class": [["SNV"], ["SNV", "SNV"], []],
+            "variant_pos": [[5], [6, 7], []],
+            "SPDI": [["spdi1"], ["spdi1", "spdi2"], []],
+            "allele": [["ref"], ["alt", "ref"], []],
+        },
+        index=["oligo1", "oligo2", "oligo3"],
+    )
+    mpra_data.data.var["oligo"] = ["oligo2", "oligo1", "oligo2", "oligo3", "oligo3"]
+    mpra_data.add_sequence_design(df, "dummy_path")
+
+    assert "SPDI" not in mpra_data.data.var
+    assert mpra_data.sequence_design_list("SPDI").tolist() == [["spdi1", "spdi2"], ["spdi1"], ["spdi1", "spdi2"], [], []]
+    assert mpra_data.sequence_design_list("variant_pos").tolist() == [[6, 7], [5], [6, 7], [], []]
+    np.testing.assert_array_equal(mpra_data.sequence_design_contains("allele", "ref"), [True, True, True, False, False])
+
+    variant_map = mpra_data.variant_map
+    assert variant_map.index.tolist() == ["spdi1"]
+    assert variant_map.loc["spdi1", "REF"] == ["oligo1"]
+    assert variant_map.loc["spdi1", "ALT"] == ["oligo2", "oligo2"]
+
+
 @pytest.mark.parametrize("modality", ["rna", "dna"])
 def test_mpra_data_drop_normalized(mpra_data, modality):
     mpra_data._normalize()
@@ -1220,6 +1771,78 @@ def test_mprabarcode_apply_barcode_filter(mpra_data):
     assert mpra_data.var_filter.shape == (mpra_data.n_vars, mpra_data.n_obs)
 
 
+def test_mprabarcode_apply_barcode_filter_mad():
+    rng = np.random.default_rng(5)
+    dna = rng.poisson(8, (3, 300)).astype(np.int32)
+    rna = rng.poisson(6, (3, 300)).astype(np.int32)
+    # barcode0 has a much larger DNA/RNA ratio than the other barcodes of its oligo
+    rna[:, 0] = 1
+    dna[:, 0] = 40
+    # barcode1 is dropped for too few DNA counts
+    dna[:, 1] = 1
+    var = pd.DataFrame(
+        {"oligo": pd.Categorical([f"oligo{i % 30}" for i in range(300)])}, index=[f"barcode{i}" for i in range(300)]
+    )
+    mpra_data = MPRABarcodeData(ad.AnnData(X=rna.copy(), obs=OBS.copy(), var=var, layers={"rna": rna, "dna": dna}))
+
+    mpra_data.apply_barcode_filter(BarcodeFilter.MAD, params={"times_mad": 3, "n_bins": 5})
+
+    assert mpra_data.var_filter[0].all()
+    assert mpra_data.var_filter[1].all()
+    assert not mpra_data.var_filter.all()
+    # every barcode is filtered in all replicates or in none
+    assert (mpra_data.var_filter.all(axis=1) == mpra_data.var_filter.any(axis=1)).all()
+    assert mpra_data.data.uns["var_filter"] == ["mad"]
+
+
+def test_segment_medians():
+    values = np.array([3.0, 1.0, 2.0, 10.0, 4.0, 6.0, 5.0])
+    codes = np.array([0, 0, 0, 2, 2, 2, 2])
+    np.testing.assert_array_equal(_segment_medians(values, codes, 4), [2.0, np.nan, 5.5, np.nan])
+
+
+def test_barcode_filter_pipeline(mpra_data):
+    steps = [
+        (BarcodeFilter.MIN_COUNT, {"rna_min_count": 1}),
+        (BarcodeFilter.MAX_COUNT, {"rna_max_count": 5, "dna_max_count": 9}),
+        (BarcodeFilter.MIN_COUNT, {"dna_min_count": 2}),
+        (BarcodeFilter.OLIGO_SPECIFIC, {"times_zscore": 1.0}),
+        (BarcodeFilter.MAD, {"n_bins": 2}),
+        (BarcodeFilter.GLOBAL, {"times_zscore": 1.5}),
+    ]
+    pipeline = BarcodeFilterPipeline(steps[:2]).add(*steps[2]).add(*steps[3]).add(*steps[4]).add(*steps[5])
+    assert pipeline.steps == steps
+    assert pipeline.schedule() == [steps[:3], [steps[3]], [steps[4]], [steps[5]]]
+
+    expected = copy.deepcopy(mpra_data)
+    for barcode_filter, params in steps:
+        expected.apply_barcode_filter(barcode_filter, params)
+    pipeline.apply(mpra_data)
+
+    np.testing.assert_array_equal(mpra_data.var_filter, expected.var_filter)
+    assert mpra_data.data.uns["var_filter"] == expected.data.uns["var_filter"]
+    assert mpra_data.data.uns["barcode_filter_pipeline"] == [
+        {"min_count": {"rna_min_count": 1}},
+        {"max_count": {"rna_max_count": 5, "dna_max_count": 9}},
+        {"min_count": {"dna_min_count": 2}},
+        {"oligo_specific": {"times_zscore": 1.0}},
+        {"mad": {"n_bins": 2}},
+        {"global": {"times_zscore": 1.5}},
+    ]
+
+    with pytest.raises(TypeError):
+        BarcodeFilterPipeline([(BarcodeFilter.MIN_COUNT, {"unknown": 1})]).apply(mpra_data)
+
+
+def test_mprabarcode_oligo_index_cache(mpra_data):
+    codes, oligos = mpra_data._oligo_index()
+    assert mpra_data._oligo_index()[0] is codes
+    mpra_data.data.var["oligo"] = ["oligo1", "oligo1", "oligo1", "oligo3", "oligo3"]
+    codes, oligos = mpra_data._oligo_index()
+    np.testing.assert_array_equal(codes, [0, 0, 0, 1, 1])
+    assert list(oligos) == ["oligo1", "oligo3"]
+
+
 def test_mprabarcode_drop_count_sampling(mpra_data):
     mpra_data.apply_count_sampling(CountSampling.RNA, proportion=0.5)
     mpra_data.drop_count_sampling()
@@ -1262,3 +1885,50 @@ def test_barcode_counts_setter_comprehensive(mpra_oligo_data):
     counts_int64 = np.array([[5, 6, 7], [8, 9, 10], [11, 12, 13]], dtype=np.int64)
     mpra_oligo_data.barcode_counts = counts_int64
     assert mpra_oligo_data.barcode_counts.dtype == np.int32
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_mprabarcode_sweep_barcode_filter(barcode_file, sparse, monkeypatch):
+    start_methods = []
+    executor = mpradata_module.ProcessPoolExecutor
+
+    def recording_executor(*args, **kwargs):
+        start_methods.append(kwargs["mp_context"].get_start_method())
+        return executor(*args, **kwargs)
+
+    # workers are forked so that they inherit the data instead of unpickling it
+    monkeypatch.setattr("mpralib.mpradata.ProcessPoolExecutor", recording_executor)
+    mpradata = MPRABarcodeData.from_file(barcode_file, sparse=sparse)
+    mpradata.barcode_threshold = 2
+    var_filter = mpradata.var_filter
+
+    grid = {"rna_min_count": [1, 2], "dna_min_count": [1, 2]}
+    table = mpradata.sweep_barcode_filter(BarcodeFilter.MIN_COUNT, grid, threads=2)
+    np.testing.assert_array_equal(mpradata.var_filter, var_filter)
+    assert start_methods == ["fork"]
+    assert list(table.columns) == [
+        "rna_min_count",
+        "dna_min_count",
+        "barcodes_removed",
+        "observations_removed",
+        "pearson_1_2",
+        "pearson_1_3",
+        "pearson_2_3",
+    ]
+    assert len(table) == 5
+    assert table.loc[0, "barcodes_removed"] == 0
+    assert table["pearson_1_3"].notna().sum() == 4
+
+    for i, row in table.iterrows():
+        expected = copy.deepcopy(mpradata)
+        if i > 0:
+            expected.apply_barcode_filter(
+                BarcodeFilter.MIN_COUNT, {"rna_min_count": row["rna_min_count"], "dna_min_count": row["dna_min_count"]}
+            )
+        removed = expected.var_filter & as_dense_array(mpradata.observed).T
+        assert row["observations_removed"] == removed.sum()
+        assert row["barcodes_removed"] == removed.any(axis=1).sum()
+        correlation = expected.oligo_data.correlation("pearson", Modality.ACTIVITY)
+        np.testing.assert_allclose(
+            row[["pearson_1_2", "pearson_1_3", "pearson_2_3"]].to_numpy(float), correlation[[0, 0, 1], [1, 2, 2]], rtol=1e-6
+        )
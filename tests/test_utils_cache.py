@@ -0,0 +1,193 @@
+import os
+import shutil
+
+import h5py
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse as sp
+from click.testing import CliRunner
+
+from mpralib.cli import cli
+from mpralib.mpradata import MPRABarcodeData, as_dense_array
+from mpralib.utils.cache import BarcodeDataCache, SequenceDesignCache
+from mpralib.utils.io import read_sequence_design_file
+
+
+@pytest.fixture
+def barcode_file(tmp_path):
+    file_path = tmp_path / "reporter_experiment_barcode.input.head101.tsv.gz"
+    shutil.copy(
+        os.path.join(os.path.dirname(__file__), "data", "reporter_experiment_barcode.input.head101.tsv.gz"),
+        file_path,
+    )
+    return str(file_path)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return BarcodeDataCache(str(tmp_path / "cache"))
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_cache_read(cache, barcode_file, sparse):
+    parsed = MPRABarcodeData.from_file(barcode_file, sparse=sparse)
+
+    first = cache.read(barcode_file, sparse=sparse)
+    assert len(cache.entries()) == 1
+    second = cache.read(barcode_file, sparse=sparse)
+    assert len(cache.entries()) == 1
+
+    assert sp.issparse(second.data.layers["rna"]) == sparse
+    # counts of a cache entry are memory mapped, not loaded
+    counts = second.data.layers["rna"].data if sparse else second.data.layers["rna"]
+    while counts is not None and not isinstance(counts, np.memmap):
+        counts = counts.base
+    assert isinstance(counts, np.memmap)
+    for mpradata in [first, second]:
+        assert mpradata.data.uns["file_path"] == barcode_file
+        np.testing.assert_array_equal(as_dense_array(mpradata.raw_rna_counts), as_dense_array(parsed.raw_rna_counts))
+        np.testing.assert_array_equal(as_dense_array(mpradata.raw_dna_counts), as_dense_array(parsed.raw_dna_counts))
+        assert mpradata.data.layers["dna"].dtype == np.int32
+        assert list(mpradata.var_names) == list(parsed.var_names)
+        assert list(mpradata.obs_names) == list(parsed.obs_names)
+        pd.testing.assert_series_equal(mpradata.data.var["oligo"], parsed.data.var["oligo"])
+        np.testing.assert_array_equal(mpradata.var_filter, parsed.var_filter)
+
+
+def test_cache_key(cache, barcode_file):
+    key = cache.key(barcode_file)
+    assert cache.key(barcode_file) == key
+    assert cache.key(barcode_file, sparse=True) != key
+
+    os.utime(barcode_file, ns=(0, 0))
+    assert cache.key(barcode_file) != key
+
+
+def test_cache_changed_file(cache, barcode_file):
+    cache.read(barcode_file)
+
+    df = pd.read_csv(barcode_file, sep="\t")
+    df = df.iloc[:10]
+    df.to_csv(barcode_file, sep="\t", index=False)
+
+    assert cache.read(barcode_file).n_vars == 10
+    assert len(cache.entries()) == 2
+
+
+def test_cache_evict(tmp_path, barcode_file):
+    cache = BarcodeDataCache(str(tmp_path / "cache"))
+    cache.read(barcode_file)
+    cache.read(barcode_file, sparse=True)
+    sparse_entry = cache.entry_path(barcode_file, sparse=True)
+    dense_entry = cache.entry_path(barcode_file)
+    os.utime(dense_entry, (1, 1))
+
+    cache.max_size = os.path.getsize(sparse_entry)
+    cache.evict()
+    assert cache.entries() == [sparse_entry]
+
+    cache.max_size = 0
+    cache.evict()
+    assert cache.entries() == []
+
+
+def test_cache_mapped_entry_copy_on_write(cache, barcode_file):
+    cache.read(barcode_file)
+    mpradata = cache.read(barcode_file)
+    expected = np.array(mpradata.data.layers["rna"])
+    mpradata.data.layers["rna"][:] = 0
+
+    np.testing.assert_array_equal(cache.read(barcode_file).data.layers["rna"], expected)
+
+
+@pytest.mark.parametrize("entry_format", ["text", "h5", "truncated"])
+def test_cache_unreadable_entry(cache, barcode_file, entry_format):
+    entry = cache.entry_path(barcode_file)
+    os.makedirs(cache.cache_dir)
+    if entry_format == "truncated":
+        cache.read(barcode_file)
+        os.truncate(entry, os.path.getsize(entry) // 2)
+    elif entry_format == "text":
+        with open(entry, "w") as f:
+            f.write("no h5ad")
+    else:
+        # an HDF5 file of another format
+        with h5py.File(entry, "w") as f:
+            f["counts"] = np.arange(3)
+
+    assert cache.read(barcode_file).n_vars == 100
+    assert cache.entries() == [entry]
+
+
+def test_sequence_design_cache(tmp_path):
+    design_file = tmp_path / "design.tsv.gz"
+    shutil.copy(os.path.join(os.path.dirname(__file__), "data", "reporter_sequence_design.example.tsv.gz"), design_file)
+    cache = SequenceDesignCache(str(tmp_path / "cache"))
+    parsed = read_sequence_design_file(str(design_file))
+
+    pd.testing.assert_frame_equal(cache.read(str(design_file)), parsed)
+    pd.testing.assert_frame_equal(cache.read(str(design_file)), parsed)
+    assert cache.entries() == [cache.entry_path(str(design_file))]
+
+    # the key only depends on the content
+    copy_file = tmp_path / "copy.tsv.gz"
+    shutil.copy(design_file, copy_file)
+    assert cache.key(str(copy_file)) == cache.key(str(design_file))
+    os.utime(design_file, ns=(0, 0))
+    assert cache.key(str(design_file)) == cache.key(str(copy_file))
+
+    # entries of all cache types share the directory
+    barcode_cache = BarcodeDataCache(cache.cache_dir)
+    assert barcode_cache.entries() == cache.entries()
+    barcode_cache.clear()
+    assert cache.entries() == []
+
+
+def test_sequence_design_cache_entries(tmp_path):
+    df = pd.read_csv(os.path.join(os.path.dirname(__file__), "data", "reporter_sequence_design.example.tsv.gz"), sep="\t")
+    df.loc[0, "info"] = np.nan
+    design_file = tmp_path / "design.tsv"
+    df.to_csv(design_file, sep="\t", index=False)
+    cache = SequenceDesignCache(str(tmp_path / "cache"))
+    parsed = read_sequence_design_file(str(design_file))
+
+    # a planted pickle is never unpickled but replaced
+    entry = cache.entry_path(str(design_file))
+    os.makedirs(cache.cache_dir)
+    parsed.to_pickle(entry)
+    pd.testing.assert_frame_equal(cache.read(str(design_file)), parsed)
+    pd.testing.assert_frame_equal(cache.read(str(design_file)), parsed)
+    assert cache.read(str(design_file))["info"].isna().sum() == 1
+    with np.load(entry, allow_pickle=False) as npz:
+        assert "meta" in npz
+
+    # list items that cannot be stored without pickle are not cached
+    df.loc[0, "variant_pos"] = "[1.5]"
+    df.to_csv(design_file, sep="\t", index=False)
+    cache.clear()
+    assert cache.read(str(design_file)).iloc[0]["variant_pos"] == [1.5]
+    assert cache.entries() == []
+
+
+def test_cli_cache(tmp_path, barcode_file):
+    runner = CliRunner()
+    cache_dir = tmp_path / "cli_cache"
+    output_file = tmp_path / "activity.tsv"
+
+    args = ["functional", "activities", "--input", barcode_file, "--output", str(output_file)]
+    result = runner.invoke(cli, ["--no-cache", "--cache-dir", str(cache_dir)] + args)
+    assert result.exit_code == 0
+    assert not cache_dir.exists()
+    expected = output_file.read_text()
+
+    for _ in range(2):
+        result = runner.invoke(cli, ["--cache", "--cache-dir", str(cache_dir)] + args)
+        assert result.exit_code == 0
+        assert len(os.listdir(cache_dir)) == 1
+        assert output_file.read_text() == expected
+
+    # the cache is opt-in
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0
+    assert not os.path.exists(os.environ["MPRALIB_CACHE_DIR"])
@@ -0,0 +1,92 @@
+import gzip
+import logging
+import os
+
+import pytest
+
+from mpralib.utils.file_validation import (
+    ValidationSchema,
+    _bgzf_block_offsets,
+    _load_schema,
+    _RowValidator,
+    validate_tsv_with_schema,
+)
+
+BARCODE_FILE = os.path.join(os.path.dirname(__file__), "data", "reporter_experiment_barcode.input.head101.tsv.gz")
+GENOMIC_VARIANT_FILE = os.path.join(os.path.dirname(__file__), "data", "reporter_genomic_variant.example3.bed.gz")
+
+
+@pytest.fixture
+def invalid_barcode_file(tmp_path):
+    with gzip.open(BARCODE_FILE, "rt") as f:
+        lines = f.read().split("\n")
+    lines[3] = "N" + lines[3]
+    lines[40] = ""
+    lines[77] = "\t".join(lines[77].split("\t")[:2] + ["1.5"] + lines[77].split("\t")[3:])
+    file_path = tmp_path / "invalid.tsv"
+    file_path.write_text("\n".join(lines))
+    return str(file_path)
+
+
+def _invalid_rows(caplog, *args, **kwargs):
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger="mpralib.utils.file_validation"):
+        valid = validate_tsv_with_schema(*args, **kwargs)
+    return valid, [record.getMessage() for record in caplog.records if record.getMessage().startswith("Row ")]
+
+
+def test_validate_tsv_with_schema_errors_in_line_order(caplog, invalid_barcode_file):
+    valid, messages = _invalid_rows(caplog, invalid_barcode_file, ValidationSchema.REPORTER_EXPERIMENT_BARCODE)
+    assert not valid
+    assert [message.split(" ")[1] for message in messages] == ["3", "76"]
+
+    for threads, chunk_size in [(1, 100), (2, 100), (3, 1 << 16)]:
+        assert _invalid_rows(
+            caplog,
+            invalid_barcode_file,
+            ValidationSchema.REPORTER_EXPERIMENT_BARCODE,
+            threads=threads,
+            chunk_size=chunk_size,
+        ) == (valid, messages)
+
+
+def test_validate_tsv_with_schema_bgzf(caplog):
+    assert len(_bgzf_block_offsets(GENOMIC_VARIANT_FILE)) >= 2
+    expected = _invalid_rows(caplog, GENOMIC_VARIANT_FILE, ValidationSchema.REPORTER_GENOMIC_VARIANT)
+    assert not expected[0]
+    assert _invalid_rows(caplog, GENOMIC_VARIANT_FILE, ValidationSchema.REPORTER_GENOMIC_VARIANT, threads=2) == expected
+
+
+def test_validate_tsv_with_schema_empty(tmp_path):
+    file_path = tmp_path / "empty.tsv"
+    file_path.write_text("barcode\toligo_name\tdna_count_1\trna_count_1\n")
+    assert not validate_tsv_with_schema(str(file_path), ValidationSchema.REPORTER_EXPERIMENT_BARCODE, threads=2)
+
+
+def test_validate_tsv_with_schema_columnar(caplog, tmp_path):
+    with gzip.open(BARCODE_FILE, "rt") as f:
+        lines = f.read().split("\n")
+    values = [" 5", "+3", "-1", "1_0", "1e5", "nan", "0x10", "", "12345678901234567890", '"7"']
+    for i, value in enumerate(values, start=1):
+        fields = lines[i].split("\t")
+        fields[2 + i % 2] = value
+        lines[i] = "\t".join(fields)
+    file_path = tmp_path / "columnar.tsv"
+    file_path.write_text("\n".join(lines))
+
+    expected = _invalid_rows(caplog, str(file_path), ValidationSchema.REPORTER_EXPERIMENT_BARCODE, columnar=False)
+    assert [message.split(" ")[1] for message in expected[1]] == ["5", "6", "7"]
+    for chunk_size in [1 << 23, 100]:
+        assert (
+            _invalid_rows(caplog, str(file_path), ValidationSchema.REPORTER_EXPERIMENT_BARCODE, chunk_size=chunk_size)
+            == expected
+        )
+
+
+def test_columnar_validator_valid_lines():
+    with gzip.open(BARCODE_FILE, "rt") as f:
+        lines = f.read().splitlines()
+    validator = _RowValidator(_load_schema(ValidationSchema.REPORTER_EXPERIMENT_BARCODE), lines[0].split("\t"))
+    assert validator.column_validator.valid_lines(lines[1:]).all()
+    assert validator.column_validator.valid_lines(["ACGN" + lines[1], lines[1] + "\t1"]).tolist() == [False, False]
+    assert validator.column_validator.valid_lines(['"ACGT"' + lines[1]]) is None
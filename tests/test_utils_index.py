@@ -0,0 +1,68 @@
+import gzip
+import os
+
+import pytest
+
+import mpralib.utils.index as index_module
+from mpralib.exception import MPRAlibException
+from mpralib.utils.index import OligoIndex, build_oligo_index
+from mpralib.utils.io import BgzfWriter
+
+
+@pytest.fixture
+def barcode_lines():
+    oligos = ["oligo1", "oligo1", "oligo2", "NA", "oligo3", "oligo1", "oligo2", "oligo2"] * 500
+    return ["barcode\toligo_name\tdna_count_1\trna_count_1\n"] + [
+        f"BC{i}\t{oligo}\t{i % 7}\t{i % 5}\n" for i, oligo in enumerate(oligos)
+    ]
+
+
+@pytest.fixture
+def bgzf_file(tmp_path, barcode_lines):
+    file_path = str(tmp_path / "barcodes.tsv.gz")
+    with BgzfWriter(file_path) as f:
+        # small writes and flushes spread lines over many blocks
+        for i, line in enumerate(barcode_lines):
+            f.write(line.encode())
+            if i % 300 == 0:
+                f.flush_block()
+    return file_path
+
+
+@pytest.mark.parametrize("index_blocks", [1, 64])
+def test_oligo_index(monkeypatch, bgzf_file, barcode_lines, index_blocks):
+    monkeypatch.setattr(index_module, "_INDEX_BLOCKS", index_blocks)
+    index = build_oligo_index(bgzf_file)
+
+    assert os.path.exists(bgzf_file + ".oidx")
+    assert list(index.oligos) == ["oligo1", "oligo2", "oligo3"]
+    # the NA lines are not indexed
+    assert len(index.run_oligos) == 5 * 500
+
+    loaded = OligoIndex.load(bgzf_file)
+    assert loaded is not None
+    assert list(loaded.run_begins) == list(index.run_begins)
+    assert list(loaded.run_ends) == list(index.run_ends)
+
+    for oligos in [["oligo1"], ["oligo2", "oligo3"], ["oligo1", "oligo2", "oligo3", "unknown"], []]:
+        expected = [line for line in barcode_lines[1:] if line.split("\t")[1] in oligos]
+        assert b"".join(loaded.read_lines(bgzf_file, oligos)).decode() == "".join(expected)
+
+    # adjacent runs of oligo1 and oligo2 are read as one range, the NA and oligo3 lines separate them
+    assert len(index.ranges(["oligo1", "oligo2"])) == 501
+
+
+def test_oligo_index_outdated(bgzf_file, barcode_lines):
+    build_oligo_index(bgzf_file)
+    with BgzfWriter(bgzf_file) as f:
+        f.write("".join(barcode_lines[:10]).encode())
+    assert OligoIndex.load(bgzf_file) is None
+
+
+def test_oligo_index_not_bgzf(tmp_path, barcode_lines):
+    file_path = str(tmp_path / "barcodes.tsv.gz")
+    with gzip.open(file_path, "wt") as f:
+        f.writelines(barcode_lines)
+    with pytest.raises(MPRAlibException):
+        build_oligo_index(file_path)
+    assert OligoIndex.load(file_path) is None
@@ -1,7 +1,11 @@
+import ast
 import copy
 import gzip
+import io
 import os
+import struct
 import tempfile
+import zlib
 
 import anndata as ad
 import numpy as np
@@ -11,7 +15,20 @@ from numpy.typing import NDArray
 
 from mpralib.exception import MPRAlibException, SequenceDesignException
 from mpralib.mpradata import MPRABarcodeData, MPRAData, MPRAOligoData
-from mpralib.utils.io import chromosome_map, export_barcode_file, export_counts_file, read_sequence_design_file
+from mpralib.utils.io import (
+    BgzfWriter,
+    _format_column,
+    _is_dna,
+    _parse_list_column,
+    chromosome_aliases,
+    chromosome_map,
+    export_barcode_file,
+    export_bed_file,
+    export_counts_file,
+    is_bgzf,
+    read_bgzf_block,
+    read_sequence_design_file,
+)
 
 
 class DummyMPRAData(MPRAData):
@@ -116,6 +133,162 @@ def test_export_counts_file_with_filter(tmp_path, barcode_data):
     assert set(df["oligo_name"]) == {"ol2", "ol3"}
 
 
+def test_export_counts_file_chunks_and_bgzf(tmp_path, barcode_data, monkeypatch):
+    expected_path = tmp_path / "counts.tsv"
+    export_counts_file(barcode_data, str(expected_path), normalized=True)
+
+    monkeypatch.setattr("mpralib.utils.io._EXPORT_CHUNK_SIZE", 2)
+    out_path = tmp_path / "counts.tsv.gz"
+    export_counts_file(barcode_data, str(out_path), normalized=True, bgzf=True)
+    assert is_bgzf(str(out_path))
+    with gzip.open(out_path, "rt") as f:
+        assert f.read() == expected_path.read_text()
+
+
+def test_bgzf_writer(tmp_path):
+    out_path = tmp_path / "blocks.gz"
+    data = os.urandom(100000)
+    with BgzfWriter(str(out_path)) as writer:
+        writer.write(data[:10])
+        assert writer.tell() == 10
+        writer.write(data[10:])
+        # the first full block is written, the rest is buffered
+        assert writer.tell() >> 16 > 0
+        assert writer.tell() & 0xFFFF == len(data) - 0xFF00
+    assert is_bgzf(str(out_path))
+    with gzip.open(out_path, "rb") as f:
+        assert f.read() == data
+
+
+def test_read_bgzf_block(tmp_path):
+    out_path = tmp_path / "blocks.gz"
+    data = os.urandom(100000)
+    with BgzfWriter(str(out_path)) as writer:
+        writer.write(data)
+
+    with open(out_path, "rb") as f:
+        blocks = []
+        while (block := read_bgzf_block(f)) is not None:
+            blocks.append(block)
+        assert f.tell() == os.path.getsize(out_path)
+        f.seek(0)
+        sizes = []
+        while (block := read_bgzf_block(f, decompress=False)) is not None:
+            sizes.append(block[1])
+    # two data blocks and the empty end-of-file block
+    assert b"".join(block[0] for block in blocks) == data
+    assert [block[1] for block in blocks] == sizes
+    assert sum(sizes) == os.path.getsize(out_path)
+
+    with pytest.raises(MPRAlibException):
+        read_bgzf_block(io.BytesIO(gzip.compress(data)))
+
+
+def _read_tabix_index(index_file):
+    with gzip.open(index_file, "rb") as f:
+        data = f.read()
+    header = struct.unpack_from("<4s8i", data)
+    position = 36 + header[8]
+    index = {}
+    for name in data[36:position].split(b"\0")[:-1]:
+        bins = {}
+        for _ in range(struct.unpack_from("<i", data, position)[0]):
+            bin_value, n_chunks = struct.unpack_from("<Ii", data, position + 4)
+            bins[bin_value] = [struct.unpack_from("<QQ", data, position + 12 + 16 * i) for i in range(n_chunks)]
+            position += 8 + 16 * n_chunks
+        n_windows = struct.unpack_from("<i", data, position + 4)[0]
+        index[name.decode()] = (bins, struct.unpack_from(f"<{n_windows}Q", data, position + 8))
+        position += 8 + 8 * n_windows
+    assert position == len(data)
+    return header, index
+
+
+def _read_bgzf_lines(bgzf_file, begin, end):
+    # uncompressed lines between two virtual offsets
+    with open(bgzf_file, "rb") as f:
+        f.seek(begin >> 16)
+        content = b""
+        while f.tell() <= end >> 16:
+            block_header = f.read(18)
+            block = f.read(struct.unpack_from("<H", block_header, 16)[0] + 1 - 18)
+            content += zlib.decompress(block[:-8], -15)
+        last_block = len(content) - len(zlib.decompress(block[:-8], -15))
+    first, last = begin & 0xFFFF, last_block + (end & 0xFFFF)
+    return content[first:last].decode().splitlines()
+
+
+def test_export_bed_file(tmp_path):
+    rng = np.random.default_rng(1)
+    starts = np.sort(rng.integers(0, 1_000_000, 3000))
+    df = pd.DataFrame(
+        {
+            "chr": np.repeat(["chr1", "chr2"], 1500),
+            "start": starts,
+            "end": starts + np.where(np.arange(3000) % 100 == 0, 50000, rng.integers(0, 300, 3000)),
+            "name": [f"oligo_{i}" for i in range(3000)],
+            "score": rng.integers(0, 1000, 3000),
+            "strand": "+",
+            "log2FoldChange": rng.normal(size=3000),
+        }
+    ).sort_values(["chr", "start", "end"])
+    expected = df.to_csv(sep="\t", index=False, header=False, float_format="%.4f")
+
+    export_bed_file(df, str(tmp_path / "out.bed"))
+    assert (tmp_path / "out.bed").read_text() == expected
+
+    bed_file = str(tmp_path / "out.bed.gz")
+    export_bed_file(df, bed_file)
+    assert is_bgzf(bed_file)
+    with gzip.open(bed_file, "rt") as f:
+        assert f.read() == expected
+
+    header, index = _read_tabix_index(bed_file + ".tbi")
+    assert header[:8] == (b"TBI\1", 2, 0x10000, 1, 2, 3, ord("#"), 0)
+    # every line is found in a chunk of its bin, only skipping chunks before the linear index
+    for chromosome, start, end, name in df[["chr", "start", "end", "name"]].iloc[::10].itertuples(index=False):
+        bins, linear = index[chromosome]
+        end = max(end, start + 1)
+        bin_value = next(
+            offset + (start >> shift)
+            for shift, offset in [(14, 4681), (17, 585), (20, 73), (23, 9), (26, 1), (29, 0)]
+            if start >> shift == (end - 1) >> shift
+        )
+        lines = [
+            line
+            for begin, chunk_end in bins[bin_value]
+            if chunk_end > linear[start >> 14]
+            for line in _read_bgzf_lines(bed_file, begin, chunk_end)
+        ]
+        assert any(line.split("\t")[3] == name for line in lines)
+
+
+def test_export_bed_file_unsorted(tmp_path):
+    df = pd.DataFrame({"chr": ["chr1", "chr2", "chr1"], "start": [1, 2, 3], "end": [2, 3, 4]})
+    with pytest.raises(MPRAlibException):
+        export_bed_file(df, str(tmp_path / "out.bed.gz"))
+
+
+def test_export_bed_file_beyond_tabix_bins(tmp_path):
+    df = pd.DataFrame({"chr": ["chrX", "chrX"], "start": [1, (1 << 29) - 1], "end": [2, (1 << 29) + 1]})
+    with pytest.raises(MPRAlibException):
+        export_bed_file(df, str(tmp_path / "out.bed.gz"))
+    assert not (tmp_path / "out.bed.gz").exists()
+    export_bed_file(df.iloc[:1], str(tmp_path / "out.bed.gz"))
+    export_bed_file(df, str(tmp_path / "out.bed"))
+
+
+def test_format_column():
+    values = ["a\tb", 'c"d', "e", None]
+    buffer = io.StringIO()
+    pd.DataFrame({"x": values, "y": 1}).to_csv(buffer, sep="\t", index=False, header=False)
+    assert "".join(value + "\t1\n" for value in _format_column(np.array(values, dtype=object))) == buffer.getvalue()
+
+    counts = np.array([0, 5, 123456, -1])
+    assert _format_column(counts, counts == 0).tolist() == ["", "5", "123456", "-1"]
+    assert _format_column(np.array([1.5, np.nan], dtype=np.float32)).tolist() == ["1.5", ""]
+    assert _format_column(np.array([1.5, 2.0]), np.array([False, True]), "%.6f").tolist() == ["1.500000", ""]
+
+
 def test_export_counts_file_invalid_type(tmp_path):
     class Dummy:
         pass
@@ -165,6 +338,27 @@ def test_read_sequence_design_file_valid():
     os.remove(path)
 
 
+def test_parse_list_column():
+    values = pd.Series(
+        ["['SNV', 'DEL']", '["ref"]', "[12, -3,]", "[]", "[ 'a b' ]", "['SNV', 'DEL']", "[1.5]", "[[1], 'x,y']"]
+    )
+    parsed = _parse_list_column(values)
+    assert parsed.tolist() == [ast.literal_eval(value) for value in values]
+    assert [type(item) for item in parsed.iloc[2]] == [int, int]
+    # equal values are parsed once, but every row has its own list
+    assert parsed.iloc[0] is not parsed.iloc[5]
+
+    with pytest.raises(ValueError):
+        _parse_list_column(pd.Series(["['SNV']", "[SNV]"]))
+
+
+def test_is_dna():
+    assert _is_dna(pd.Series(["ACGT", "acgt"]))
+    assert not _is_dna(pd.Series(["ACGT", "ACGN"]))
+    assert not _is_dna(pd.Series(["ACGT", ""]))
+    assert not _is_dna(pd.Series(["ACGT", None]))
+
+
 def test_read_sequence_design_file_invalid_sequence():
     path = write_temp_tsv(INVALID_SEQ_TSV)
     with pytest.raises(SequenceDesignException) as excinfo:
@@ -211,6 +405,19 @@ def test_chromosome_map_no_duplicate_rows():
     assert df.duplicated().sum() == 0
 
 
+def test_chromosome_aliases():
+    aliases = chromosome_aliases("GRCh38")
+    assert aliases["NC_000001.11"] == "chr1"
+    assert "NC_000001.10" not in aliases
+    assert chromosome_aliases("GRCh37")["NC_000001.10"] == "chr1"
+    assert chromosome_aliases("GRCh38") is aliases
+    assert len(chromosome_aliases("unknown")) == 0
+
+    df = chromosome_map()
+    df = df[df["release"] == "GRCh38"].dropna(subset=["refseq"])
+    assert len(aliases) == df["refseq"].nunique()
+
+
 OBS = pd.DataFrame(index=["rep1", "rep2", "rep3"])
 VAR = pd.DataFrame(
     {"oligo": ["oligo1", "oligo1", "oligo2", "oligo3", "oligo3"]},